@@ -100,23 +100,31 @@ const RAG_API = (() => {
      * 강의자료 생성 (RAG)
      */
     async function generateLecture(options = {}) {
-        return post('/api/lecture', {
+        return post('/api/lecture', lectureParams(options));
+    }
+
+    function lectureParams(options) {
+        return {
             chapter: options.chapter || '',
             topic: options.topic || '',
             format: options.format || 'notes'
-        });
+        };
     }
 
     /**
      * 보고서 생성 (RAG)
      */
     async function generateReport(options = {}) {
-        return post('/api/report', {
+        return post('/api/report', reportParams(options));
+    }
+
+    function reportParams(options) {
+        return {
             topic: options.topic || '',
             chapter: options.chapter || '',
             type: options.type || 'analysis',
             length: options.length || 'medium'
-        });
+        };
     }
 
     /**
@@ -126,6 +134,31 @@ const RAG_API = (() => {
         return post('/api/chat', { query });
     }
 
+    // ── 스트리밍 (SSE) ──
+    // handlers: { onSources(sources), onDelta(text, fullText), onDone(fullText, sources), onError(message), signal }
+    // 반환값은 스트리밍하지 않는 함수와 같은 형식: { response, sources } 또는 { error }
+
+    /**
+     * 일반 질의응답 스트리밍 — 답변을 생성되는 대로 받음
+     */
+    async function streamChat(query, handlers = {}) {
+        return stream('/api/chat/stream', { query }, handlers);
+    }
+
+    /**
+     * 강의자료 생성 스트리밍
+     */
+    async function streamLecture(options = {}, handlers = {}) {
+        return stream('/api/lecture/stream', lectureParams(options), handlers);
+    }
+
+    /**
+     * 보고서 생성 스트리밍
+     */
+    async function streamReport(options = {}, handlers = {}) {
+        return stream('/api/report/stream', reportParams(options), handlers);
+    }
+
     // ── HTTP 헬퍼 ──
 
     async function get(path) {
@@ -147,6 +180,63 @@ const RAG_API = (() => {
         return response.json();
     }
 
+    /**
+     * SSE 스트림 읽기 (POST 요청이라 EventSource 대신 fetch 본문을 직접 파싱)
+     * 이벤트 순서: sources → delta… → done (실패하면 error)
+     */
+    async function stream(path, body, handlers = {}) {
+        const response = await fetch(BASE_URL + path, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+            body: JSON.stringify(body),
+            signal: handlers.signal
+        });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let sources = [];
+        let error = null;
+
+        const handleEvent = (block) => {
+            let event = 'message';
+            let data = '';
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+            if (!data) return;
+            const payload = JSON.parse(data);
+            if (event === 'sources') {
+                sources = payload.sources || [];
+                if (handlers.onSources) handlers.onSources(sources);
+            } else if (event === 'delta') {
+                text += payload.text;
+                if (handlers.onDelta) handlers.onDelta(payload.text, text);
+            } else if (event === 'done') {
+                if (handlers.onDone) handlers.onDone(text, sources);
+            } else if (event === 'error') {
+                error = payload.error || '스트림 오류';
+                if (handlers.onError) handlers.onError(error);
+            }
+        };
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true }).replace(/\r\n/g, '\n');
+            let end;
+            while ((end = buffer.indexOf('\n\n')) >= 0) {
+                handleEvent(buffer.slice(0, end));
+                buffer = buffer.slice(end + 2);
+            }
+        }
+        if (buffer.trim()) handleEvent(buffer);
+        return error ? { error } : { response: text, sources };
+    }
+
     // ── UI 컴포넌트 ──
 
     /**
@@ -333,6 +423,9 @@ const RAG_API = (() => {
         generateLecture,
         generateReport,
         chat,
+        streamChat,
+        streamLecture,
+        streamReport,
         createStatusBadge,
         updateStatusBadge,
         showApiKeyModal,
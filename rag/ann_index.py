@@ -0,0 +1,230 @@
+"""
+맨큐의 경제학 - 근사 최근접 이웃(ANN) 색인
+============================================
+컬렉션 벡터로 faiss HNSW 또는 IVF-PQ 색인을 만들어 rag/ann_index/{종류}/에 저장하고,
+server.py의 ann 백엔드가 읽어 검색한다. 교과서 한 권 규모에서는 전수 검색
+(vector_codec.py)으로 충분하지만, 여러 권으로 늘어나면 쿼리 지연이 청크 수에
+비례하지 않도록 근사 검색을 쓴다.
+
+  hnsw   — IndexHNSWFlat: 그래프 탐색, 벡터를 float32 그대로 보관 (거리 = 정확한 제곱 l2)
+           검색 파라미터 efSearch가 클수록 재현율↑ 지연↑
+  ivfpq  — IndexIVFPQ: nlist개 클러스터 + 곱 양자화(벡터당 pq_m바이트)
+           검색 파라미터 nprobe가 클수록 재현율↑ 지연↑ (거리는 근사값 → rescore 권장)
+
+색인 안의 순번은 유효한(벡터가 있는) 청크만 모은 것이므로 rows.npy로 청크 저장소
+순번에 대응시킨다. 메타데이터 필터는 청크 저장소 열로 만든 마스크를 faiss
+IDSelectorBitmap으로 넘겨 색인 안에서 처리한다.
+
+pipeline.py --step index가 파일을 만들고 재현율@k·지연 표를 출력한다.
+faiss 필요: pip install faiss-cpu
+"""
+
+import json
+import math
+from pathlib import Path
+
+from vector_codec import RESCORE_FACTOR, l2_distances
+
+ANN_TYPES = ("hnsw", "ivfpq")
+HNSW_M = 32                  # 노드당 이웃 수
+HNSW_EF_CONSTRUCTION = 200   # 색인 구축 시 탐색 폭
+IVF_NLIST = None             # 클러스터 수 (None = 4·√n, 클러스터당 학습 점 39개 이상으로 제한)
+PQ_M = None                  # 부분 벡터 수 = 벡터당 바이트 (None = dim/8 이하인 dim의 최대 약수)
+PQ_BITS = 8                  # 부분 벡터 코드 비트 (코드당 학습 점이 39개보다 적으면 줄임)
+IVF_TRAIN_ROWS = 100000      # IVF-PQ 학습에 쓰는 최대 표본 수
+SEARCH_SWEEP = {             # --step index가 재현율·지연을 재는 검색 파라미터 값
+    "hnsw": (16, 32, 64, 128, 256),
+    "ivfpq": (1, 2, 4, 8, 16, 32, 64),
+}
+SEARCH_PARAM_NAMES = {"hnsw": "efSearch", "ivfpq": "nprobe"}
+INDEX_FILE = "index.faiss"
+ROWS_FILE = "rows.npy"
+META_FILE = "meta.json"
+
+
+def _faiss():
+    try:
+        import faiss
+    except ImportError:
+        raise ImportError("faiss 설치 필요: pip install faiss-cpu")
+    return faiss
+
+
+def _numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("numpy 설치 필요: pip install numpy")
+    return np
+
+
+def default_nlist(n):
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def default_pq_m(dim):
+    limit = max(1, dim // 8)
+    return max(m for m in range(1, limit + 1) if dim % m == 0)
+
+
+class AnnIndex:
+    """faiss 색인 + 색인 순번 → 청크 순번 대응표
+
+    kind: "hnsw" | "ivfpq", rows: 색인 순번별 청크 저장소 순번 [n] (int64),
+    meta: 구축 파라미터 · 기본 검색 파라미터(search_param) · 컬렉션 · 청크 지문
+    """
+
+    def __init__(self, kind, index, rows, meta=None):
+        self.kind = kind
+        self.index = index
+        self.rows = rows
+        self.meta = meta or {}
+        self.search_param = self.meta.get("search_param") or SEARCH_SWEEP[kind][len(SEARCH_SWEEP[kind]) // 2]
+        self._bitmaps = {}
+
+    @classmethod
+    def build(cls, kind, matrix, valid, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION,
+              nlist=IVF_NLIST, pq_m=PQ_M, pq_bits=PQ_BITS, meta=None):
+        """float32 행렬(행 = 청크 순번)의 유효 행으로 색인 구축"""
+        faiss = _faiss()
+        np = _numpy()
+        rows = np.flatnonzero(np.asarray(valid, dtype=bool)).astype(np.int64)
+        vectors = np.ascontiguousarray(np.asarray(matrix, dtype=np.float32)[rows])
+        n, dim = vectors.shape
+
+        if kind == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, m)
+            index.hnsw.efConstruction = ef_construction
+            params = {"m": m, "ef_construction": ef_construction}
+        elif kind == "ivfpq":
+            nlist = min(nlist or default_nlist(n), n)
+            pq_m = pq_m or default_pq_m(dim)
+            if dim % pq_m:
+                raise ValueError(f"pq_m({pq_m})은 차원({dim})의 약수여야 합니다")
+            pq_bits = max(1, min(pq_bits, int(math.log2(max(n // 39, 2)))))
+            quantizer = faiss.IndexFlatL2(dim)
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_bits)
+            train = vectors
+            if n > IVF_TRAIN_ROWS:
+                pick = np.random.default_rng(0).choice(n, size=IVF_TRAIN_ROWS, replace=False)
+                train = vectors[np.sort(pick)]
+            index.train(train)
+            params = {"nlist": nlist, "pq_m": pq_m, "pq_bits": pq_bits}
+        else:
+            raise ValueError(f"지원하지 않는 색인 종류: {kind} (가능: {', '.join(ANN_TYPES)})")
+
+        index.add(vectors)
+        meta = dict(meta or {}, kind=kind, params=params, count=int(n), dim=int(dim))
+        return cls(kind, index, rows, meta)
+
+    def __len__(self):
+        return self.index.ntotal
+
+    @property
+    def dim(self):
+        return self.index.d
+
+    @property
+    def exact_distances(self):
+        """색인이 돌려주는 거리가 정확한 제곱 l2인지 (HNSW-Flat) — 아니면 rescore가 의미 있음"""
+        return self.kind == "hnsw"
+
+    def sweep_values(self):
+        """--step index가 잴 검색 파라미터 값 (nprobe는 nlist를 넘으면 의미가 없으므로 제외)"""
+        values = SEARCH_SWEEP[self.kind]
+        if self.kind == "ivfpq":
+            nlist = self.meta["params"]["nlist"]
+            values = [v for v in values if v < nlist] + [nlist]
+        return list(values)
+
+    def set_search_param(self, value):
+        """efSearch(hnsw) 또는 nprobe(ivfpq) 기본값 변경"""
+        self.search_param = int(value)
+        self.meta["search_param"] = self.search_param
+
+    def save(self, directory):
+        faiss = _faiss()
+        np = _numpy()
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        faiss.write_index(self.index, str(directory / INDEX_FILE))
+        np.save(directory / ROWS_FILE, self.rows)
+        with open(directory / META_FILE, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, directory):
+        """저장된 색인을 엶 (파일이 없으면 None)"""
+        faiss = _faiss()
+        np = _numpy()
+        directory = Path(directory)
+        meta_path = directory / META_FILE
+        if not meta_path.exists():
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index = faiss.read_index(str(directory / INDEX_FILE))
+        return cls(meta["kind"], index, np.load(directory / ROWS_FILE), meta)
+
+    @property
+    def nbytes(self):
+        """직렬화한 색인 크기 (바이트)"""
+        return int(_faiss().serialize_index(self.index).nbytes) + self.rows.nbytes
+
+    # ── 검색 ──
+
+    def _selector(self, mask):
+        """청크 저장소 행 마스크 → 색인 순번 비트맵 선택자 (같은 마스크 객체는 재사용)"""
+        faiss = _faiss()
+        np = _numpy()
+        cached = self._bitmaps.get(id(mask))
+        if cached is None or cached[0] is not mask:
+            bits = np.packbits(np.asarray(mask, dtype=bool)[self.rows], bitorder="little")
+            cached = (mask, bits, faiss.IDSelectorBitmap(len(self.rows), faiss.swig_ptr(bits)))
+            self._bitmaps[id(mask)] = cached
+            if len(self._bitmaps) > 256:
+                self._bitmaps.pop(next(iter(self._bitmaps)))
+        return cached[2]
+
+    def _params(self, search_param, mask):
+        faiss = _faiss()
+        value = int(search_param or self.search_param)
+        selector = self._selector(mask) if mask is not None else None
+        if self.kind == "hnsw":
+            params = faiss.SearchParametersHNSW(efSearch=value)
+        else:
+            params = faiss.SearchParametersIVF(nprobe=value)
+        if selector is not None:
+            params.sel = selector
+        return params
+
+    def search_batch(self, queries, k, mask=None, search_param=None, rescore=None, factor=RESCORE_FACTOR):
+        """쿼리마다 근사 최근접 k개 → [(청크 순번 배열, 거리 배열), ...]
+
+        mask: 청크 저장소 행 bool 마스크 (메타데이터 필터), search_param: efSearch/nprobe
+        (None = 저장된 기본값), rescore: 후보 k × factor개를 float32 원본으로 다시 채점할
+        벡터를 주는 함수 (IVF-PQ처럼 거리가 근사값인 색인에서만 사용)
+        """
+        np = _numpy()
+        queries = np.ascontiguousarray(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        if rescore is not None and self.exact_distances:
+            rescore = None
+        n = min(k * factor if rescore else k, len(self))
+        if n <= 0 or len(queries) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return [(empty, np.empty(0, dtype=np.float32)) for _ in queries]
+
+        distances, positions = self.index.search(queries, n, params=self._params(search_param, mask))
+        results = []
+        for query, dist, pos in zip(queries, distances, positions):
+            keep = pos >= 0    # 필터 · nprobe 때문에 후보가 n개보다 적으면 -1로 채워짐
+            rows, dist = self.rows[pos[keep]], dist[keep]
+            if rescore is not None and len(rows):
+                exact = l2_distances(rescore(rows), query)
+                order = np.argsort(exact, kind="stable")[:k]
+                rows, dist = rows[order], exact[order]
+            results.append((rows, dist))
+        return results
+
+    def search(self, query, k, mask=None, search_param=None, rescore=None, factor=RESCORE_FACTOR):
+        return self.search_batch([query], k, mask, search_param, rescore, factor)[0]
@@ -0,0 +1,344 @@
+"""
+맨큐의 경제학 - 비동기 RAG 서버
+================================
+server.py와 같은 /api/* 경로를 asyncio(aiohttp)로 제공하는 서빙 모드 (server.py --async).
+
+  - 생성(generateContent)과 쿼리 임베딩(embedContent / batchEmbedContents)을 크기가 제한된
+    keep-alive 연결 풀 하나로 보내, 요청마다 새 TCP · TLS 연결을 맺지 않는다.
+  - 생성 API를 기다리는 요청은 스레드가 아니라 코루틴 하나만 차지한다.
+    워커 수만큼만 동시에 기다리던 스레드 서버와 달리 대기 요청 수가 스레드 수에 묶이지 않는다.
+  - 검색 · 프롬프트 구성(핸들러 본문)은 작은 스레드 풀에서 실행하고,
+    그 안의 쿼리 임베딩 요청은 서버의 query_embedder에 지정한 transport로 이벤트 루프의 연결 풀에 넘긴다.
+  - /api/*/stream은 streamGenerateContent(alt=sse)의 조각을 받는 대로 SSE로 중계한다.
+
+pip install aiohttp
+
+사용법:
+  python rag/server.py --async                          # 비동기 모드 (port 5000)
+  python rag/server.py --async --upstream-pool 128      # 업스트림 keep-alive 연결 수 상한
+  python rag/bench_server.py --url http://localhost:5000 --concurrency 500   # 부하 측정
+"""
+
+import json
+import time
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from embedder import GEMINI_API_BASE, EmbeddingHTTPError
+
+UPSTREAM_POOL_SIZE = 64     # 업스트림(Gemini) 동시 연결 수 상한 (넘는 요청은 풀에서 차례를 기다림)
+UPSTREAM_KEEPALIVE = 60     # 쉬는 연결을 풀에 남겨 두는 시간 (초)
+UPSTREAM_TIMEOUT = 120      # 업스트림 요청 하나의 전체 제한 시간 (초)
+RETRIEVAL_WORKERS = 8       # 검색 · 프롬프트 구성을 실행하는 스레드 수
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, Authorization",
+}
+
+
+def _import_aiohttp():
+    try:
+        import aiohttp
+        from aiohttp import web
+    except ImportError:
+        raise ImportError("aiohttp 설치 필요: pip install aiohttp")
+    return aiohttp, web
+
+
+class UpstreamClient:
+    """keep-alive 연결 풀을 공유하는 업스트림 REST 클라이언트 (이벤트 루프 안에서 생성)
+
+    연결을 새로 맺은 수와 풀에서 다시 쓴 수를 세어 stats()로 보여준다.
+    """
+
+    def __init__(self, pool_size=UPSTREAM_POOL_SIZE, keepalive=UPSTREAM_KEEPALIVE, timeout=UPSTREAM_TIMEOUT):
+        aiohttp, _ = _import_aiohttp()
+        self.pool_size = pool_size
+        self.loop = asyncio.get_running_loop()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self._on_connection_create)
+        trace.on_connection_reuseconn.append(self._on_connection_reuse)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=keepalive),
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            trace_configs=[trace],
+        )
+
+    async def _on_connection_create(self, session, context, params):
+        self.connections_created += 1
+
+    async def _on_connection_reuse(self, session, context, params):
+        self.connections_reused += 1
+
+    async def stream_json(self, url, body):
+        """SSE 응답(alt=sse)의 data 줄마다 JSON을 내보내는 async generator
+
+        긴 보고서는 전체 시간이 UPSTREAM_TIMEOUT을 넘을 수 있으므로 조각 사이 대기 시간만 제한한다.
+        """
+        aiohttp, _ = _import_aiohttp()
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.session.timeout.total)
+        try:
+            async with self.session.post(url, json=body, timeout=timeout) as resp:
+                if resp.status >= 400:
+                    raise EmbeddingHTTPError(resp.status, await resp.text())
+                async for line in resp.content:
+                    line = line.strip()
+                    if line.startswith(b"data:"):
+                        yield json.loads(line[5:])
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def post_json(self, url, body):
+        """JSON POST → 응답 JSON (HTTP 오류는 EmbeddingHTTPError)"""
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            async with self.session.post(url, json=body) as resp:
+                text = await resp.text()
+                if resp.status >= 400:
+                    raise EmbeddingHTTPError(resp.status, text)
+                return json.loads(text)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def post_json_threadsafe(self, url, body, timeout=None):
+        """다른 스레드(검색 스레드 풀)에서 호출 — 이벤트 루프의 연결 풀로 보내고 결과를 기다림"""
+        return asyncio.run_coroutine_threadsafe(self.post_json(url, body), self.loop).result(timeout)
+
+    def stats(self):
+        connections = self.connections_created + self.connections_reused
+        return {
+            "pool_size": self.pool_size,
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_rate": round(self.connections_reused / connections, 4) if connections else 0.0,
+        }
+
+    async def close(self):
+        await self.session.close()
+
+
+def generation_body(task, max_tokens):
+    """GenerationTask → generateContent 요청 본문"""
+    return {
+        "contents": [{"role": "user", "parts": [{"text": task.prompt()}]}],
+        "generationConfig": {"temperature": task.temperature, "maxOutputTokens": max_tokens},
+    }
+
+
+def candidate_text(data):
+    """generateContent 응답(또는 스트림 조각) → 첫 후보의 텍스트"""
+    candidates = data.get("candidates") or [{}]
+    return "".join(part.get("text", "") for part in candidates[0].get("content", {}).get("parts", []))
+
+
+async def generate(client, task, api_key, max_tokens):
+    """GenerationTask → REST generateContent 호출 → 응답 dict (동기 서버의 task.run()과 같은 형식)"""
+    if not api_key:
+        return task.complete(error="Gemini API가 설정되지 않았습니다. API 키를 확인해주세요.")
+
+    url = f"{GEMINI_API_BASE}/models/{task.model}:generateContent?key={api_key}"
+    try:
+        data = await client.post_json(url, generation_body(task, max_tokens))
+        text = "".join(part.get("text", "") for part in data["candidates"][0]["content"]["parts"])
+    except Exception as e:
+        return task.complete(error=f"생성 오류: {str(e)}")
+    return task.complete(text)
+
+
+async def stream_events(client, app, result):
+    """핸들러 결과 → (event, data) 순서: sources → delta… → done | error (server.stream_events의 비동기판)"""
+    if not isinstance(result, app.GenerationTask):
+        for event in app.result_events(result):
+            yield event
+        return
+    if not app.api_key:
+        yield "error", {"error": "Gemini API가 설정되지 않았습니다. API 키를 확인해주세요."}
+        return
+    sources = app.generation_sources(result.context_docs)
+    yield "sources", {"sources": sources}
+    url = f"{GEMINI_API_BASE}/models/{result.model}:streamGenerateContent?alt=sse&key={app.api_key}"
+    chars = 0
+    texts = []
+    try:
+        async for data in client.stream_json(url, generation_body(result, app.GENERATION_MAX_TOKENS)):
+            text = candidate_text(data)
+            if text:
+                chars += len(text)
+                texts.append(text)
+                yield "delta", {"text": text}
+    except Exception as e:
+        yield "error", {"error": f"생성 오류: {str(e)}"}
+        return
+    result.remember({"response": "".join(texts), "sources": sources})
+    yield "done", {"chars": chars}
+
+
+def build_app(app, workers=RETRIEVAL_WORKERS, pool_size=UPSTREAM_POOL_SIZE):
+    """aiohttp 애플리케이션 구성
+
+    app: server.py 모듈 (API_ROUTES · handle_status · GenerationTask · 전역 상태를 그대로 사용)
+    """
+    _, web = _import_aiohttp()
+    static_dir = Path(app.BASE_DIR).resolve()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="retrieval")
+    state = {"client": None, "requests": 0, "in_flight": 0, "peak_in_flight": 0,
+             "started_at": time.time()}
+
+    def json_response(data, status=200):
+        return web.Response(text=json.dumps(data, ensure_ascii=False, indent=2), status=status,
+                            content_type="application/json", charset="utf-8")
+
+    @web.middleware
+    async def cors_and_log(request, handler):
+        if request.method == "OPTIONS":   # CORS preflight (라우트 없이 미들웨어에서 응답)
+            response = web.Response()
+        else:
+            state["requests"] += 1
+            state["in_flight"] += 1
+            state["peak_in_flight"] = max(state["peak_in_flight"], state["in_flight"])
+            try:
+                response = await handler(request)
+            except web.HTTPException as e:
+                response = web.Response(status=e.status, text=e.text)
+            finally:
+                state["in_flight"] -= 1
+        if not response.prepared:   # 스트림 응답은 prepare 전에 헤더를 붙임
+            response.headers.update(CORS_HEADERS)
+        if request.path.startswith("/api/"):
+            print(f"  [API] {request.method} {request.path} -> {response.status}")
+        return response
+
+    async def read_body(request):
+        """요청 본문 JSON (없으면 {}), 형식 오류면 None"""
+        if not request.can_read_body:
+            return {}
+        try:
+            return json.loads(await request.text())
+        except json.JSONDecodeError:
+            return None
+
+    async def handle_api(request):
+        handler = app.API_ROUTES.get(request.path)
+        if handler is None:
+            return json_response({"error": f"알 수 없는 경로: {request.path}"}, 404)
+        body = await read_body(request)
+        if body is None:
+            return json_response({"error": "잘못된 JSON 형식입니다."}, 400)
+
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(executor, handler, body)
+            if isinstance(result, app.GenerationTask):
+                result = await generate(state["client"], result, app.api_key, app.GENERATION_MAX_TOKENS)
+        except Exception as e:
+            traceback.print_exc()
+            return json_response({"error": f"서버 오류: {str(e)}"}, 500)
+        return json_response(result)
+
+    async def handle_stream(request):
+        handler = app.STREAM_ROUTES.get(request.path)
+        if handler is None:
+            return json_response({"error": f"알 수 없는 경로: {request.path}"}, 404)
+        body = await read_body(request)
+        if body is None:
+            return json_response({"error": "잘못된 JSON 형식입니다."}, 400)
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(executor, handler, body)
+        except Exception as e:
+            traceback.print_exc()
+            return json_response({"error": f"서버 오류: {str(e)}"}, 500)
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream; charset=utf-8",
+                                               "Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+                                               **CORS_HEADERS})
+        await response.prepare(request)
+        try:
+            async for event, data in stream_events(state["client"], app, result):
+                await response.write(app.sse_event(event, data))
+        except ConnectionResetError:
+            pass   # 클라이언트가 중간에 끊음
+        return response
+
+    async def handle_status(request):
+        result = await asyncio.get_running_loop().run_in_executor(executor, app.handle_status)
+        # 생성은 SDK가 아니라 REST로 호출하므로 API 키만 있으면 된다
+        result["gemini_api"] = "connected" if app.api_key else "not_configured"
+        result["server"] = {
+            "mode": "async",
+            "retrieval_workers": workers,
+            "requests": state["requests"],
+            "in_flight": state["in_flight"],
+            "peak_in_flight": state["peak_in_flight"],
+            "uptime": round(time.time() - state["started_at"], 1),
+        }
+        result["upstream"] = state["client"].stats()
+        return json_response(result)
+
+    async def handle_static(request):
+        path = (static_dir / request.match_info["tail"]).resolve()
+        if path != static_dir and static_dir not in path.parents:
+            raise web.HTTPForbidden()
+        if path.is_dir():
+            path = path / "index.html"
+        if not path.is_file():
+            raise web.HTTPNotFound()
+        return web.FileResponse(path)
+
+    async def on_startup(web_app):
+        state["client"] = UpstreamClient(pool_size=pool_size)
+        app.set_embedder_transport(state["client"].post_json_threadsafe)
+
+    async def on_cleanup(web_app):
+        app.set_embedder_transport(None)
+        await state["client"].close()
+        executor.shutdown(wait=False)
+
+    web_app = web.Application(middlewares=[cors_and_log])
+    web_app.router.add_get("/api/status", handle_status)
+    web_app.router.add_post("/api/{name}/stream", handle_stream)
+    web_app.router.add_post("/api/{name}", handle_api)
+    web_app.router.add_get("/{tail:.*}", handle_static)
+    web_app.on_startup.append(on_startup)
+    web_app.on_cleanup.append(on_cleanup)
+    return web_app
+
+
+def serve(app, port=5000, workers=RETRIEVAL_WORKERS, pool_size=UPSTREAM_POOL_SIZE, backlog=1024):
+    """비동기 서버 실행 (Ctrl+C까지)"""
+    _, web = _import_aiohttp()
+    web_app = build_app(app, workers=workers, pool_size=pool_size)
+
+    print(f"\n[START] Server: http://localhost:{port} (async, retrieval workers: {workers}, "
+          f"upstream pool: {pool_size})")
+    print(f"[FILES] Static: {app.BASE_DIR}")
+    print(f"[API]   Status: http://localhost:{port}/api/status")
+    print(f"\n[INFO]  Press Ctrl+C to stop.\n")
+
+    web.run_app(web_app, host="localhost", port=port, backlog=backlog, print=None, access_log=None)
+    print("\n\n[STOP] Server stopped.")
@@ -0,0 +1,134 @@
+"""
+맨큐의 경제학 - RAG 서버 부하 측정
+===================================
+실행 중인 server.py(스레드 모드 또는 --async 모드)에 같은 요청을 동시에 보내
+처리량 · 지연 분포(p50/p95/p99) · 오류 수를 재고, 업스트림 스텁(stub_gemini.py)의
+/stats 변화로 업스트림 요청 수와 새로 맺은 연결 수를 함께 보여준다.
+
+pip install aiohttp
+
+사용법:
+  python rag/stub_gemini.py --port 8765 --rps 0 --latency-ms 20 --gen-latency-ms 1500
+  GEMINI_API_KEY=stub GEMINI_API_BASE=http://localhost:8765/v1beta python rag/server.py --async
+  python rag/bench_server.py --concurrency 500 --requests 2000 --stub http://localhost:8765
+  python rag/bench_server.py --path /api/search --body '{"query": "기회비용 {i}", "n_results": 3}'
+
+본문의 {i}는 요청 번호로 바뀐다 (쿼리 캐시 적중을 피할 때 사용).
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+
+def percentile(values, p):
+    """정렬된 목록의 p 백분위 값 (최근접 순위)"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def fetch_stats(session, url):
+    try:
+        async with session.get(url) as resp:
+            return await resp.json(content_type=None)
+    except Exception:
+        return None
+
+
+async def run(args):
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError("aiohttp 설치 필요: pip install aiohttp")
+
+    url = args.url.rstrip("/") + args.path
+    latencies = []
+    errors = {}
+    counter = iter(range(args.requests))
+
+    async def worker(session):
+        for i in counter:
+            body = args.body.replace("{i}", str(i))
+            start = time.perf_counter()
+            try:
+                async with session.post(url, data=body.encode("utf-8"),
+                                        headers={"Content-Type": "application/json"}) as resp:
+                    data = await resp.json(content_type=None)
+                    if resp.status != 200:
+                        key = f"HTTP {resp.status}"
+                    elif isinstance(data, dict) and "error" in data:
+                        key = str(data["error"])[:80]
+                    else:
+                        key = None
+            except Exception as e:
+                key = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            if key:
+                errors[key] = errors.get(key, 0) + 1
+
+    # 클라이언트 쪽 연결 수는 제한하지 않음 (동시 요청 수는 --concurrency로만 조절)
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        stub_url = args.stub.rstrip("/") + "/stats" if args.stub else None
+        before = await fetch_stats(session, stub_url) if stub_url else None
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        after = await fetch_stats(session, stub_url) if stub_url else None
+        status = await fetch_stats(session, args.url.rstrip("/") + "/api/status")
+
+    latencies.sort()
+    failed = sum(errors.values())
+    print(f"\n📊 {url} — 동시 {args.concurrency} · 요청 {len(latencies)}")
+    print(f"   처리량: {len(latencies) / elapsed:.1f} req/s ({elapsed:.2f}초)")
+    print(f"   지연:   p50 {percentile(latencies, 50) * 1000:.0f}ms · p95 {percentile(latencies, 95) * 1000:.0f}ms · "
+          f"p99 {percentile(latencies, 99) * 1000:.0f}ms · 최대 {latencies[-1] * 1000 if latencies else 0:.0f}ms")
+    print(f"   성공:   {len(latencies) - failed} · 실패 {failed}")
+    for key, count in sorted(errors.items(), key=lambda kv: -kv[1])[:5]:
+        print(f"     - {key}: {count}")
+    if before and after:
+        delta = {k: after.get(k, 0) - before.get(k, 0) for k in after}
+        print(f"   업스트림: 요청 {delta.get('requests', 0)} · 생성 {delta.get('generations', 0)} · "
+              f"새 연결 {delta.get('connections', 0)} · 429 {delta.get('throttled', 0)}")
+    if status and status.get("upstream"):
+        upstream = status["upstream"]
+        print(f"   연결 풀: 생성 {upstream['connections_created']} · 재사용 {upstream['connections_reused']} "
+              f"(재사용률 {upstream['reuse_rate']:.0%}) · 최대 동시 {upstream['peak_in_flight']}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG API 서버 부하 측정")
+    parser.add_argument("--url", default="http://localhost:5000", help="서버 주소 (기본: http://localhost:5000)")
+    parser.add_argument("--path", default="/api/chat", help="요청 경로 (기본: /api/chat)")
+    parser.add_argument("--body", default='{"query": "기회비용이란 무엇인가? {i}"}',
+                        help="JSON 요청 본문 ({i} = 요청 번호)")
+    parser.add_argument("--concurrency", type=int, default=100, help="동시 요청 수 (기본: 100)")
+    parser.add_argument("--requests", type=int, default=1000, help="전체 요청 수 (기본: 1000)")
+    parser.add_argument("--timeout", type=float, default=300, help="요청당 제한 시간 초 (기본: 300)")
+    parser.add_argument("--stub", default=None,
+                        help="업스트림 스텁 주소 (예: http://localhost:8765, /stats 변화를 함께 출력)")
+    args = parser.parse_args()
+
+    try:
+        json.loads(args.body.replace("{i}", "0"))
+    except json.JSONDecodeError as e:
+        print(f"❌ --body가 올바른 JSON이 아닙니다: {e}")
+        sys.exit(1)
+    try:
+        failed = asyncio.run(run(args))
+    except ImportError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
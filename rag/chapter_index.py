@@ -0,0 +1,133 @@
+"""
+맨큐의 경제학 - 챕터 색인
+==========================
+청크 저장소의 챕터 열(Step 2가 페이지 상단에서 감지한 current_chapter)을 챕터별
+청크 순번 구간으로 미리 묶은 색인 (rag/data/chapter_index.json).
+
+server.py가 시험·강의·보고서 요청의 챕터("4", 4, "Chapter 4", "제4장", 전체 이름)를
+챕터 이름으로 바꿔 임베딩·벡터 검색 없이 해당 청크를 바로 꺼내거나,
+주제가 함께 오면 챕터 where 필터를 붙인 검색으로 범위를 좁힌다.
+
+파일 구조:
+  {"version", "chunks"(청크 저장소 digest), "count",
+   "chapters": [{"chapter", "number", "ranges": [[시작, 끝), ...], "chunks", "pages": [첫, 끝],
+                 "source_files": [...]}, ...]}
+
+pipeline.py Step 2가 청킹 직후 만들고, server.py가 읽는다.
+"""
+
+import re
+import json
+from pathlib import Path
+
+FORMAT_VERSION = 1
+CHAPTER_NUMBER = re.compile(r"\d{1,3}")
+
+
+def chapter_number(value):
+    """챕터 이름·요청 값에서 챕터 번호 (없으면 None): "Chapter 4: 수요와 공급" → 4"""
+    if isinstance(value, int):
+        return value
+    match = CHAPTER_NUMBER.search(str(value))
+    return int(match.group()) if match else None
+
+
+def build_chapter_index(store, path):
+    """청크 저장소 → 챕터 색인 파일 (같은 챕터가 이어지는 순번 구간을 한 번의 선형 스캔으로 묶음)"""
+    path = Path(path)
+    entries = {}
+    chapter_ids = store.chapter_ids
+    start = 0
+    for i in range(1, len(store) + 1):
+        if i < len(store) and chapter_ids[i] == chapter_ids[start]:
+            continue
+        name = store.chapters[chapter_ids[start]]
+        entry = entries.get(name)
+        if entry is None:
+            entry = entries[name] = {"chapter": name, "number": chapter_number(name), "ranges": [],
+                                     "chunks": 0, "pages": [None, None], "source_files": []}
+        entry["ranges"].append([start, i])
+        entry["chunks"] += i - start
+        first, last = store.pages[start], store.pages[i - 1]
+        entry["pages"][0] = first if entry["pages"][0] is None else min(entry["pages"][0], first)
+        entry["pages"][1] = last if entry["pages"][1] is None else max(entry["pages"][1], last)
+        for row in (start, i - 1):
+            source = store.source_files[store.source_ids[row]]
+            if source not in entry["source_files"]:
+                entry["source_files"].append(source)
+        start = i
+
+    data = {
+        "version": FORMAT_VERSION,
+        "chunks": store.digest,
+        "count": len(store),
+        "chapters": list(entries.values()),
+    }
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    tmp_path.replace(path)
+    return data
+
+
+class ChapterIndex:
+    """챕터 → 청크 순번 구간 (행 번호 = 청크 저장소 순번)"""
+
+    def __init__(self, data):
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"지원하지 않는 챕터 색인 버전: {data.get('version')}")
+        self.digest = data["chunks"]
+        self.count = data["count"]
+        self.chapters = {entry["chapter"]: entry for entry in data["chapters"]}
+        self._by_number = {}
+        for entry in data["chapters"]:
+            if entry["number"] is not None:
+                self._by_number.setdefault(entry["number"], []).append(entry["chapter"])
+
+    @classmethod
+    def load(cls, path):
+        """색인 파일 로드 (없으면 None)"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def __len__(self):
+        return len(self.chapters)
+
+    def resolve(self, chapter):
+        """요청의 챕터 값 → 챕터 이름 목록 (정확한 이름이 없으면 번호로 찾음, 못 찾으면 [])"""
+        if chapter in (None, ""):
+            return []
+        if isinstance(chapter, str) and chapter in self.chapters:
+            return [chapter]
+        number = chapter_number(chapter)
+        return list(self._by_number.get(number, ())) if number is not None else []
+
+    def rows(self, chapter):
+        """챕터의 청크 순번 목록 (저장소 순서)"""
+        rows = []
+        for name in self.resolve(chapter):
+            for start, end in self.chapters[name]["ranges"]:
+                rows.extend(range(start, end))
+        return sorted(rows)
+
+    def sample(self, chapter, n):
+        """챕터 전체에 고르게 퍼진 청크 순번 n개 (앞부분에 몰리지 않도록 등간격)"""
+        rows = self.rows(chapter)
+        if len(rows) <= n:
+            return rows
+        step = len(rows) / n
+        return [rows[int(step * i + step / 2)] for i in range(n)]
+
+    def where(self, chapter):
+        """챕터 값 → Chroma 형식 where 필터 (못 찾으면 None)"""
+        names = self.resolve(chapter)
+        if not names:
+            return None
+        return {"chapter": names[0]} if len(names) == 1 else {"chapter": {"$in": names}}
+
+    def stats(self):
+        return {"chapters": len(self.chapters), "numbered": len(self._by_number),
+                "ranges": sum(len(e["ranges"]) for e in self.chapters.values())}
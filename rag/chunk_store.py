@@ -0,0 +1,241 @@
+"""
+맨큐의 경제학 - 열 지향 청크 저장소
+====================================
+청크 텍스트를 하나의 연속된 UTF-8 블롭으로, 메타데이터를 타입이 있는 열
+(페이지 · 챕터 ID · 파트 ID · 원본 파일 ID · 글자 수 · 순번)로 저장하는 바이너리
+파일 (rag/data/chunks.bin). chunks.jsonl을 대체한다.
+
+파일은 mmap으로 열기 때문에 로드 비용이 청크 수와 무관하고, 청크 텍스트는
+복사 없이 memoryview로 잘라 읽을 수 있다. pipeline.py와 server.py가 함께 사용한다.
+
+파일 구조 (모든 구역은 8바이트 정렬, 리틀 엔디언):
+  MAGIC(8) | 헤더 길이 uint32 | 헤더 JSON | 텍스트 블롭 | offsets uint64[n+1]
+  | page · chapter · part · source · char_count · chunk_index int32[n] | id 고정폭[n]
+
+사용 예:
+  store = ChunkStore(path)
+  len(store), store[i]            # {"id", "text", "metadata"} (chunks.jsonl 레코드와 같은 모양)
+  store.text(i), store.text_view(i)   # str / 복사 없는 memoryview (UTF-8 바이트)
+  store.pages[i], store.chapter_ids[i], store.chapters[store.chapter_ids[i]]
+
+  with ChunkStoreWriter(tmp_path) as writer:
+      for chunk in chunks:
+          writer.add(chunk)
+"""
+
+import os
+import sys
+import json
+import mmap
+import shutil
+import hashlib
+import tempfile
+from array import array
+from pathlib import Path
+
+MAGIC = b"MKCHUNK1"
+FORMAT_VERSION = 1
+ALIGN = 8
+INT_COLUMNS = ("pages", "chapter_ids", "part_ids", "source_ids", "char_counts", "chunk_indexes")
+
+
+def _pad(n):
+    return (-n) % ALIGN
+
+
+class ChunkStoreWriter:
+    """청크를 순서대로 받아 열 지향 저장소 파일을 씀
+
+    텍스트는 임시 파일로 바로 흘려 쓰고, 열(청크당 24바이트)과 ID만 메모리에 둔다.
+    close()에서 헤더 · 텍스트 · 열을 한 파일로 합친다. 헤더의 digest는 청크
+    내용 전체의 sha256이므로 파일 전체를 다시 해시하지 않고도 지문으로 쓸 수 있다.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.count = 0
+        self._text = tempfile.TemporaryFile(dir=self.path.parent)
+        self._text_bytes = 0
+        self._offsets = array("Q", [0])
+        self._columns = {name: array("i") for name in INT_COLUMNS}
+        self._ids = []
+        self._tables = {"chapters": {}, "parts": {}, "source_files": {}}
+        self._digest = hashlib.sha256()
+
+    def _intern(self, table, value):
+        ids = self._tables[table]
+        if value not in ids:
+            ids[value] = len(ids)
+        return ids[value]
+
+    def add(self, chunk):
+        """청크 레코드 {"id", "text", "metadata"} 추가"""
+        data = chunk["text"].encode("utf-8")
+        meta = chunk["metadata"]
+        self._text.write(data)
+        self._text_bytes += len(data)
+        self._offsets.append(self._text_bytes)
+        self._ids.append(chunk["id"].encode("ascii"))
+        cols = self._columns
+        cols["pages"].append(meta["estimated_page"])
+        cols["chapter_ids"].append(self._intern("chapters", meta["chapter"]))
+        cols["part_ids"].append(self._intern("parts", meta["part"]))
+        cols["source_ids"].append(self._intern("source_files", meta["source_file"]))
+        cols["char_counts"].append(meta["char_count"])
+        cols["chunk_indexes"].append(meta["chunk_index"])
+        self._digest.update(json.dumps(chunk, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        self._digest.update(b"\n")
+        self.count += 1
+
+    def close(self):
+        id_width = max((len(i) for i in self._ids), default=1)
+        header = {
+            "version": FORMAT_VERSION,
+            "count": self.count,
+            "text_bytes": self._text_bytes,
+            "id_width": id_width,
+            "digest": self._digest.hexdigest(),
+            "chapters": list(self._tables["chapters"]),
+            "parts": list(self._tables["parts"]),
+            "source_files": list(self._tables["source_files"]),
+        }
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        header_bytes += b" " * _pad(len(MAGIC) + 4 + len(header_bytes))
+
+        with open(self.path, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header_bytes).to_bytes(4, "little"))
+            f.write(header_bytes)
+            self._text.seek(0)
+            shutil.copyfileobj(self._text, f, 1024 * 1024)
+            f.write(b"\0" * _pad(self._text_bytes))
+            columns = [self._offsets] + [self._columns[name] for name in INT_COLUMNS]
+            for column in columns:
+                if sys.byteorder != "little":
+                    column.byteswap()
+                data = column.tobytes()
+                f.write(data)
+                f.write(b"\0" * _pad(len(data)))
+            f.write(b"".join(i.ljust(id_width, b"\0") for i in self._ids))
+            f.flush()
+            os.fsync(f.fileno())
+        self._text.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._text.close()
+
+
+class ChunkStore:
+    """mmap으로 연 열 지향 청크 저장소 (읽기 전용, 시퀀스처럼 인덱싱)"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = view = memoryview(self._mmap)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"청크 저장소 형식이 아닙니다: {self.path}")
+        pos = len(MAGIC)
+        header_len = int.from_bytes(view[pos:pos + 4], "little")
+        pos += 4
+        header = json.loads(bytes(view[pos:pos + header_len]).decode("utf-8"))
+        pos += header_len
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"지원하지 않는 청크 저장소 버전: {header.get('version')}")
+
+        self.count = header["count"]
+        self.digest = header["digest"]
+        self.chapters = header["chapters"]
+        self.parts = header["parts"]
+        self.source_files = header["source_files"]
+        self._id_width = header["id_width"]
+
+        self._text = view[pos:pos + header["text_bytes"]]
+        pos += header["text_bytes"] + _pad(header["text_bytes"])
+
+        def take(fmt, n):
+            nonlocal pos
+            size = n * array(fmt).itemsize
+            column = view[pos:pos + size].cast(fmt)
+            pos += size + _pad(size)
+            return column
+
+        if sys.byteorder != "little":
+            raise ValueError("빅 엔디언 환경에서는 청크 저장소를 mmap으로 읽을 수 없습니다")
+        self.offsets = take("Q", self.count + 1)
+        for name in INT_COLUMNS:
+            setattr(self, name, take("i", self.count))
+        self._ids = view[pos:pos + self.count * self._id_width]
+        self._index = None
+
+    def __len__(self):
+        return self.count
+
+    def text_view(self, i):
+        """i번째 청크 텍스트의 UTF-8 바이트 (복사 없는 memoryview)"""
+        return self._text[self.offsets[i]:self.offsets[i + 1]]
+
+    def text(self, i):
+        return str(self.text_view(i), "utf-8")
+
+    def chunk_id(self, i):
+        start = i * self._id_width
+        return bytes(self._ids[start:start + self._id_width]).rstrip(b"\0").decode("ascii")
+
+    def metadata(self, i):
+        """chunks.jsonl 시절과 같은 키 순서의 메타데이터 dict"""
+        return {
+            "source_file": self.source_files[self.source_ids[i]],
+            "estimated_page": self.pages[i],
+            "chapter": self.chapters[self.chapter_ids[i]],
+            "part": self.parts[self.part_ids[i]],
+            "char_count": self.char_counts[i],
+            "chunk_index": self.chunk_indexes[i],
+        }
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return {"id": self.chunk_id(i), "text": self.text(i), "metadata": self.metadata(i)}
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def index_of(self, chunk_id):
+        """ID → 순번 (처음 호출할 때 전체 ID 색인을 만듦, 없으면 None)"""
+        if self._index is None:
+            self._index = {self.chunk_id(i): i for i in range(self.count)}
+        return self._index.get(chunk_id)
+
+    def close(self):
+        """mmap 해제 (text_view()로 받은 memoryview를 아직 쥐고 있으면 BufferError)"""
+        for name in ("_text", "_ids", "offsets") + INT_COLUMNS + ("_view",):
+            getattr(self, name).release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_chunk_records(path):
+    """청크 파일의 레코드를 순서대로 yield (chunks.bin 또는 이전 형식 chunks.jsonl)"""
+    path = Path(path)
+    if path.suffix == ".jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+    else:
+        with ChunkStore(path) as store:
+            yield from store
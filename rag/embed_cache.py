@@ -0,0 +1,176 @@
+"""
+맨큐의 경제학 - 임베딩 캐시
+============================
+텍스트 · 임베딩 모델 · 작업 유형(taskType)의 해시를 키로 하는 디스크 캐시 (SQLite)
+
+pipeline.py(문서 임베딩)와 server.py(쿼리 임베딩)가 같은 파일을 함께 사용한다.
+같은 텍스트를 다시 임베딩할 때 API를 호출하지 않고 로컬 디스크에서 읽는다.
+
+사용 예:
+  cache = EmbeddingCache()
+  vectors = cache.get_vectors(texts, model, "RETRIEVAL_DOCUMENT")   # 없으면 None
+  cache.put_vectors(texts, vectors, model, "RETRIEVAL_DOCUMENT")
+  cache.stats()   # {"entries", "hits", "misses", "hit_rate", ...}
+"""
+
+import sqlite3
+import hashlib
+import threading
+import time
+from array import array
+from pathlib import Path
+
+# ── 경로 설정 ──
+BASE_DIR = Path(__file__).resolve().parent.parent
+CACHE_DIR = BASE_DIR / "rag" / "cache"
+EMBEDDING_CACHE_PATH = CACHE_DIR / "embeddings.sqlite"
+
+# ── 캐시 설정 ──
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000   # 최대 항목 수 (초과 시 오래 안 쓴 항목부터 삭제)
+EVICT_CHECK_INTERVAL = 500              # 이만큼 기록할 때마다 크기 확인
+
+
+class DiskCache:
+    """SQLite 기반 키-값 캐시 (최근 사용 순 크기 제한 + 적중률 집계, 스레드 안전)"""
+
+    def __init__(self, path, table="cache", max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.table = table
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed_at)")
+        self._conn.commit()
+
+    def get_many(self, keys, max_age=None):
+        """여러 키 조회 → {키: 값} (없거나 max_age초보다 오래된 항목은 제외)"""
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, value, created_at FROM {self.table} WHERE key IN ({marks})", part
+                ).fetchall()
+                for key, value, created_at in rows:
+                    if max_age is None or now - created_at <= max_age:
+                        found[key] = value
+            if found:
+                self._conn.executemany(
+                    f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key, max_age=None):
+        """단일 키 조회 (없으면 None)"""
+        return self.get_many([key], max_age=max_age).get(key)
+
+    def put_many(self, items):
+        """[(키, 값), ...] 저장 (같은 키는 덮어씀)"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                [(key, value, now, now) for key, value in items]
+            )
+            self._conn.commit()
+            self._writes += len(items)
+            if self._writes >= EVICT_CHECK_INTERVAL:
+                self._writes = 0
+                self._evict()
+
+    def put(self, key, value):
+        """단일 키 저장"""
+        self.put_many([(key, value)])
+
+    def delete(self, key):
+        """단일 키 삭제"""
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _evict(self):
+        """항목 수가 상한을 넘으면 가장 오래 사용하지 않은 항목부터 삭제 (lock 보유 상태에서 호출)"""
+        count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)", (excess,)
+            )
+            self._conn.commit()
+            self.evictions += excess
+
+    def stats(self):
+        """캐시 통계 (항목 수, 적중/미적중, 적중률, 삭제 수)"""
+        with self._lock:
+            entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache(DiskCache):
+    """임베딩 벡터 캐시 — 키: sha256(모델, 작업 유형, 텍스트), 값: float32 배열"""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        super().__init__(path, table="embeddings", max_entries=max_entries)
+
+    @staticmethod
+    def model_tag(model, dim=None):
+        """캐시 키에 쓰는 모델 이름 (outputDimensionality를 지정했으면 차원을 붙임)"""
+        return f"{model}@{dim}" if dim else model
+
+    @staticmethod
+    def make_key(text, model, task_type):
+        return hashlib.sha256(f"{model}\0{task_type}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_vectors(self, texts, model, task_type):
+        """텍스트 목록의 캐시된 벡터 → 같은 순서의 리스트 (없는 항목은 None)"""
+        keys = [self.make_key(t, model, task_type) for t in texts]
+        found = self.get_many(list(dict.fromkeys(keys)))
+        vectors = []
+        for key in keys:
+            blob = found.get(key)
+            vectors.append(array("f", blob).tolist() if blob is not None else None)
+        return vectors
+
+    def put_vectors(self, texts, vectors, model, task_type):
+        """텍스트 목록과 같은 순서의 벡터를 저장"""
+        self.put_many([
+            (self.make_key(t, model, task_type), array("f", v).tobytes())
+            for t, v in zip(texts, vectors)
+        ])
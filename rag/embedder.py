@@ -0,0 +1,227 @@
+"""
+맨큐의 경제학 - 임베딩 백엔드
+==============================
+pipeline.py(문서 임베딩)와 server.py(쿼리 임베딩)가 함께 쓰는 Embedder 추상화.
+
+  gemini   — Gemini REST API (embedContent / batchEmbedContents), 네트워크 필요
+  hashing  — 결정적 해싱 임베딩 (lexical.py 토큰 → 부호 있는 특성 해싱, 로그 TF, 단위 길이).
+             의존성·네트워크 없이 CPU에서 바로 동작 — 오프라인 색인 구축 · CI용
+  onnx     — fastembed의 양자화 ONNX 문장 모델 (CPU, 모델 파일은 처음 한 번만 내려받음)
+             pip install fastembed
+
+임베딩마다 벡터 공간이 다르므로 컬렉션 이름에 임베딩 종류·차원(onnx는 모델)을 붙여
+구분하고(collection_name), 디스크 캐시 키(cache_tag)도 임베딩별로 나눈다.
+
+사용 예:
+  embedder = make_embedder("hashing", dim=768, cache=EmbeddingCache())
+  vectors = embedder.embed_documents(texts)
+  vector = embedder.embed_query("수요와 공급의 균형")
+"""
+
+import os
+import json
+import math
+import hashlib
+from array import array
+from collections import Counter
+
+from embed_cache import EmbeddingCache
+from lexical import tokenize
+from vector_codec import normalize_values
+
+EMBEDDERS = ("gemini", "hashing", "onnx")
+GEMINI_MODEL = "models/gemini-embedding-001"
+GEMINI_API_BASE = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+HASHING_DIM = 768
+HASHING_MODEL = "hashing-v1"   # 해싱 규칙이 바뀌면 올려서 캐시·컬렉션을 구분
+ONNX_MODEL = "intfloat/multilingual-e5-small"   # 한국어를 지원하는 fastembed 모델
+
+
+def collection_name(base, kind, dim=None, model=None):
+    """임베딩 종류 · 차원 · 모델별 컬렉션 이름 (Gemini 기본 차원이면 base 그대로)"""
+    if kind == "gemini":
+        return f"{base}_d{dim}" if dim else base
+    if kind == "onnx":
+        slug = (model or ONNX_MODEL).rsplit("/", 1)[-1].replace(".", "_").replace("-", "_")
+        return f"{base}_onnx_{slug}"
+    return f"{base}_{kind}_d{dim or HASHING_DIM}"
+
+
+class EmbeddingHTTPError(Exception):
+    """임베딩 API가 HTTP 오류를 돌려줌 (code: 상태 코드)"""
+
+    def __init__(self, code, body=""):
+        super().__init__(f"HTTP {code}: {body[:300]}")
+        self.code = code
+
+
+class Embedder:
+    """임베딩 백엔드 공통 부분 — 디스크 캐시를 거쳐 캐시에 없는 텍스트만 _embed로 계산
+
+    하위 클래스: name, model, remote(네트워크 호출 여부)와 _embed(texts, task_type)를 정의
+    """
+
+    name = None
+    remote = False
+
+    def __init__(self, model, dim=None, cache=None):
+        self.model = model
+        self.dim = dim
+        self.cache = cache
+
+    @property
+    def cache_tag(self):
+        """디스크 캐시 키에 쓰는 모델 표시 (모델 · 차원이 다르면 다른 항목)"""
+        return EmbeddingCache.model_tag(self.model, self.dim)
+
+    def collection_name(self, base):
+        return collection_name(base, self.name, self.dim, self.model)
+
+    def describe(self):
+        return f"{self.name} ({self.model}{f', {self.dim}차원' if self.dim else ''})"
+
+    def embed(self, texts, task_type="RETRIEVAL_DOCUMENT", use_cache=True):
+        """텍스트 목록 → 벡터 목록 (list[float])"""
+        cache = self.cache if use_cache else None
+        if cache is None:
+            return self._embed(texts, task_type)
+        vectors = cache.get_vectors(texts, self.cache_tag, task_type)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            fetched = self._embed(missing_texts, task_type)
+            cache.put_vectors(missing_texts, fetched, self.cache_tag, task_type)
+            for i, vector in zip(missing, fetched):
+                vectors[i] = vector
+        return vectors
+
+    def embed_documents(self, texts, use_cache=True):
+        return self.embed(texts, "RETRIEVAL_DOCUMENT", use_cache)
+
+    def embed_query(self, text, use_cache=True):
+        return self.embed([text], "RETRIEVAL_QUERY", use_cache)[0]
+
+    def _embed(self, texts, task_type):
+        raise NotImplementedError
+
+
+class GeminiEmbedder(Embedder):
+    """Gemini REST API 직접 호출 (deprecated 라이브러리 우회)
+
+    dim을 주면 outputDimensionality로 요청하고 단위 길이로 정규화한다.
+    """
+
+    name = "gemini"
+    remote = True
+    # (url, body, timeout) → 응답 JSON. None이면 urllib로 요청마다 새 연결.
+    # 인스턴스마다 지정한다 — async_server.py · pregenerate.py는 서버가 가진 query_embedder에만
+    # 이벤트 루프의 keep-alive 연결 풀로 보내는 함수를 끼운다 (server.set_embedder_transport).
+    transport = None
+
+    def __init__(self, api_key, model=GEMINI_MODEL, dim=None, cache=None, api_base=None, timeout=60):
+        super().__init__(model, dim, cache)
+        self.api_key = api_key
+        self.api_base = api_base or GEMINI_API_BASE
+        self.timeout = timeout
+
+    def _request(self, method, body):
+        import urllib.request
+        import urllib.error
+
+        model_name = self.model.replace("models/", "")
+        url = f"{self.api_base}/models/{model_name}:{method}?key={self.api_key}"
+        if self.transport is not None:
+            return self.transport(url, body, self.timeout)
+        req = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"), method="POST")
+        req.add_header("Content-Type", "application/json")
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read().decode())
+        except urllib.error.HTTPError as e:
+            raise EmbeddingHTTPError(e.code, e.read().decode())
+
+    def _content(self, text, task_type):
+        request = {
+            "model": self.model,
+            "content": {"parts": [{"text": text}]},
+            "taskType": task_type
+        }
+        if self.dim:
+            request["outputDimensionality"] = self.dim
+        return request
+
+    def _embed(self, texts, task_type):
+        if len(texts) == 1:
+            data = self._request("embedContent", self._content(texts[0], task_type))
+            vectors = [data["embedding"]["values"]]
+        else:
+            data = self._request("batchEmbedContents",
+                                 {"requests": [self._content(t, task_type) for t in texts]})
+            vectors = [item["values"] for item in data["embeddings"]]
+        return [normalize_values(v) for v in vectors] if self.dim else vectors
+
+
+class HashingEmbedder(Embedder):
+    """부호 있는 특성 해싱 임베딩 (결정적, 의존성 없음)
+
+    lexical.py와 같은 토큰(한글 2-gram · 영문 단어)을 blake2b로 dim개 버킷 중 하나에
+    ±(1 + log tf)로 더한 뒤 단위 길이로 정규화한다. 쿼리와 문서를 같은 방식으로 만든다.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim=HASHING_DIM, cache=None):
+        super().__init__(HASHING_MODEL, dim or HASHING_DIM, cache)
+        self._buckets = {}
+
+    def _bucket(self, token):
+        cached = self._buckets.get(token)
+        if cached is None:
+            h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            cached = (h % self.dim, 1.0 if (h >> 63) & 1 else -1.0)
+            if len(self._buckets) < 1_000_000:
+                self._buckets[token] = cached
+        return cached
+
+    def _embed(self, texts, task_type):
+        vectors = []
+        for text in texts:
+            values = array("d", bytes(8 * self.dim))
+            for token, tf in Counter(tokenize(text)).items():
+                bucket, sign = self._bucket(token)
+                values[bucket] += sign * (1.0 + math.log(tf))
+            vectors.append(normalize_values(values))
+        return vectors
+
+
+class OnnxEmbedder(Embedder):
+    """fastembed 양자화 ONNX 문장 모델 (CPU)"""
+
+    name = "onnx"
+
+    def __init__(self, model=ONNX_MODEL, cache=None):
+        try:
+            from fastembed import TextEmbedding
+        except ImportError:
+            raise ImportError("fastembed 설치 필요: pip install fastembed")
+        self._model = TextEmbedding(model_name=model)
+        dim = len(next(iter(self._model.embed(["dim"]))))
+        super().__init__(model, dim, cache)
+
+    def _embed(self, texts, task_type):
+        if task_type == "RETRIEVAL_QUERY":
+            vectors = self._model.query_embed(texts)
+        else:
+            vectors = self._model.passage_embed(texts)
+        return [v.tolist() for v in vectors]
+
+
+def make_embedder(kind, api_key=None, dim=None, model=None, cache=None):
+    """임베딩 종류 이름 → Embedder (gemini는 api_key 필요)"""
+    if kind == "gemini":
+        return GeminiEmbedder(api_key, model=model or GEMINI_MODEL, dim=dim, cache=cache)
+    if kind == "hashing":
+        return HashingEmbedder(dim=dim, cache=cache)
+    if kind == "onnx":
+        return OnnxEmbedder(model=model or ONNX_MODEL, cache=cache)
+    raise ValueError(f"지원하지 않는 임베딩: {kind} (가능: {', '.join(EMBEDDERS)})")
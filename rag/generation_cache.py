@@ -0,0 +1,86 @@
+"""
+맨큐의 경제학 - 생성 결과 캐시
+================================
+server.py가 쓰는 생성 응답 디스크 캐시 (SQLite, rag/cache/generations.sqlite).
+
+수업 준비 중 같은 챕터의 강의 노트 · 퀴즈를 반복해서 요청하면 매번 생성 API를 다시 부르므로,
+(엔드포인트, 정규화한 요청 값, 검색된 청크 ID, 생성 모델, temperature)가 같으면 저장된 응답을
+돌려준다. 검색 결과가 바뀌면(색인 재구축 · 다른 청크) 키도 바뀌어 자연히 새로 생성된다.
+
+엔드포인트마다 정책(TTL · 최대 항목 수)이 다르고, 테이블을 따로 써서 크기 제한도 따로 적용한다.
+요청 본문의 "cache": false는 캐시를 아예 쓰지 않고, "fresh": true는 조회를 건너뛰고 새로 생성해 덮어쓴다.
+
+사용 예:
+  cache = GenerationCache()
+  key = cache.make_key("lecture", body, chunk_ids, "gemini-2.0-flash", 0.5)
+  result = cache.get("lecture", key)      # 없거나 TTL이 지났으면 None
+  cache.put("lecture", key, {"response": ..., "sources": [...]})
+  cache.stats()   # {"lecture": {"entries", "hits", "misses", "hit_rate", ...}, ...}
+"""
+
+import json
+import hashlib
+
+from embed_cache import CACHE_DIR, DiskCache
+from query_cache import normalize_query
+
+GENERATION_CACHE_PATH = CACHE_DIR / "generations.sqlite"
+
+# 엔드포인트별 정책 — ttl: 유효 시간(초, None = 만료 없음), max_entries: 최대 항목 수
+# chat · report는 질문이 매번 달라 적중이 드물고 개인화된 응답이라 캐시하지 않는다.
+GENERATION_CACHE_POLICY = {
+    "lecture": {"ttl": 7 * 24 * 3600, "max_entries": 2000},
+    "quiz": {"ttl": 24 * 3600, "max_entries": 2000},
+    "exam": {"ttl": 24 * 3600, "max_entries": 1000},
+    "search": {"ttl": 24 * 3600, "max_entries": 5000},
+}
+
+CONTROL_FIELDS = ("cache", "fresh")   # 키에서 빼는 요청 필드 (캐시 동작만 바꿈)
+
+
+def normalize_params(value):
+    """요청 값 정규화 — 문자열은 normalize_query, dict는 키 정렬, 제어 필드 제외"""
+    if isinstance(value, str):
+        return normalize_query(value)
+    if isinstance(value, dict):
+        return {k: normalize_params(v) for k, v in sorted(value.items()) if k not in CONTROL_FIELDS}
+    if isinstance(value, (list, tuple)):
+        return [normalize_params(v) for v in value]
+    return value
+
+
+class GenerationCache:
+    """엔드포인트별 DiskCache 테이블 묶음 — 값: 생성 결과 dict (JSON)"""
+
+    def __init__(self, path=GENERATION_CACHE_PATH, policy=None):
+        self.policy = dict(GENERATION_CACHE_POLICY if policy is None else policy)
+        self._tables = {
+            endpoint: DiskCache(path, table=f"generations_{endpoint}", max_entries=rule["max_entries"])
+            for endpoint, rule in self.policy.items()
+        }
+
+    def enabled(self, endpoint):
+        return endpoint in self._tables
+
+    @staticmethod
+    def make_key(endpoint, params, chunk_ids, model, temperature):
+        payload = json.dumps([endpoint, normalize_params(params), list(chunk_ids), model, temperature],
+                             ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, endpoint, key):
+        """저장된 생성 결과 (없거나 엔드포인트 TTL이 지났으면 None)"""
+        blob = self._tables[endpoint].get(key, max_age=self.policy[endpoint]["ttl"])
+        return json.loads(blob) if blob is not None else None
+
+    def put(self, endpoint, key, result):
+        self._tables[endpoint].put(key, json.dumps(result, ensure_ascii=False))
+
+    def stats(self):
+        """엔드포인트별 통계 (DiskCache.stats + ttl)"""
+        return {endpoint: {**table.stats(), "ttl": self.policy[endpoint]["ttl"]}
+                for endpoint, table in self._tables.items()}
+
+    def close(self):
+        for table in self._tables.values():
+            table.close()
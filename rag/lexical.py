@@ -0,0 +1,209 @@
+"""
+맨큐의 경제학 - 어휘(BM25) 색인
+================================
+청크 저장소(chunks.bin)의 텍스트로 만든 역색인 (rag/data/lexical.bin).
+"탄력성", "GDP 디플레이터"처럼 용어가 정확히 들어간 질의는 임베딩 없이 바로
+찾을 수 있으므로, server.py가 벡터 검색과 순위 융합(RRF)하거나 단독으로 사용한다.
+
+토큰화 (형태소 분석기 의존성 없이 한국어 조사·어미 변화에 견디도록):
+  한글 연속 구간 → 글자 2-gram (문서 쪽은 구간 첫 글자 1-gram도 추가: "돈은" → 돈, 돈은)
+  영문·숫자     → 소문자 단어 ("GDP" → gdp, "2.5" → 2.5)
+
+파일 구조 (chunk_store.py와 같은 방식, 8바이트 정렬, 리틀 엔디언):
+  MAGIC(8) | 헤더 길이 uint32 | 헤더 JSON(용어 목록 포함) | term_offsets uint64[T+1]
+  | doc_ids uint32[P] | tfs uint32[P] | doc_lens uint32[n]
+
+pipeline.py Step 2가 청킹 직후 만들고, server.py가 mmap으로 연다.
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import mmap
+import heapq
+from array import array
+from collections import Counter
+from pathlib import Path
+
+MAGIC = b"MKLEXIX1"
+FORMAT_VERSION = 1
+TOKENIZER_VERSION = 1    # 토큰화 규칙이 바뀌면 올려서 기존 색인을 무효화
+ALIGN = 8
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60               # reciprocal rank fusion 상수 (순위 r의 점수 = 1 / (RRF_K + r))
+
+TOKEN_PATTERN = re.compile(r"[가-힣]+|[a-z0-9]+(?:[.'][a-z0-9]+)*")
+
+
+def _pad(n):
+    return (-n) % ALIGN
+
+
+def tokenize(text, query=False):
+    """텍스트 → 토큰 목록 (query=True면 한 글자 구간만 1-gram으로 남김)"""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        word = match.group()
+        if "가" <= word[0] <= "힣":
+            if len(word) == 1 or not query:
+                tokens.append(word[0])
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def build_lexical_index(store, path):
+    """청크 저장소 → 역색인 파일 (임시 파일에 쓴 뒤 교체)"""
+    path = Path(path)
+    postings = {}
+    doc_lens = array("I")
+    for i in range(len(store)):
+        counts = Counter(tokenize(store.text(i)))
+        doc_lens.append(sum(counts.values()))
+        for term, tf in counts.items():
+            entry = postings.get(term)
+            if entry is None:
+                entry = postings[term] = (array("I"), array("I"))
+            entry[0].append(i)
+            entry[1].append(tf)
+
+    terms = sorted(postings)
+    offsets = array("Q", [0])
+    for term in terms:
+        offsets.append(offsets[-1] + len(postings[term][0]))
+    header = {
+        "version": FORMAT_VERSION,
+        "tokenizer_version": TOKENIZER_VERSION,
+        "chunks": store.digest,
+        "count": len(store),
+        "postings": offsets[-1],
+        "total_tokens": sum(doc_lens),
+        "terms": terms,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    header_bytes += b" " * _pad(len(MAGIC) + 4 + len(header_bytes))
+
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(4, "little"))
+        f.write(header_bytes)
+        columns = [offsets]
+        columns.append(array("I", (d for t in terms for d in postings[t][0])))
+        columns.append(array("I", (tf for t in terms for tf in postings[t][1])))
+        columns.append(doc_lens)
+        for column in columns:
+            if sys.byteorder != "little":
+                column.byteswap()
+            data = column.tobytes()
+            f.write(data)
+            f.write(b"\0" * _pad(len(data)))
+        f.flush()
+        os.fsync(f.fileno())
+    tmp_path.replace(path)
+    return header
+
+
+def read_header(path):
+    """색인 파일 헤더만 읽음 (없거나 형식이 다르면 None) — 다시 만들지 판단할 때 사용"""
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            header_len = int.from_bytes(f.read(4), "little")
+            return json.loads(f.read(header_len).decode("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+class LexicalIndex:
+    """mmap으로 연 BM25 역색인 (행 번호 = 청크 저장소 순번)"""
+
+    def __init__(self, path, k1=BM25_K1, b=BM25_B):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"어휘 색인 형식이 아닙니다: {self.path}")
+        if sys.byteorder != "little":
+            raise ValueError("빅 엔디언 환경에서는 어휘 색인을 mmap으로 읽을 수 없습니다")
+        pos = len(MAGIC)
+        header_len = int.from_bytes(view[pos:pos + 4], "little")
+        pos += 4
+        header = json.loads(bytes(view[pos:pos + header_len]).decode("utf-8"))
+        pos += header_len
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"지원하지 않는 어휘 색인 버전: {header.get('version')}")
+
+        self.digest = header["chunks"]
+        self.tokenizer_version = header["tokenizer_version"]
+        self.count = header["count"]
+        self._term_ids = {term: i for i, term in enumerate(header["terms"])}
+
+        def take(fmt, n):
+            nonlocal pos
+            size = n * array(fmt).itemsize
+            column = view[pos:pos + size].cast(fmt)
+            pos += size + _pad(size)
+            return column
+
+        self._offsets = take("Q", len(self._term_ids) + 1)
+        self._doc_ids = take("I", header["postings"])
+        self._tfs = take("I", header["postings"])
+        doc_lens = take("I", self.count)
+
+        # BM25 문서 길이 정규화 항 k1·(1 - b + b·len/avg)은 미리 계산
+        self.k1 = k1
+        avg_len = header["total_tokens"] / self.count if self.count else 1.0
+        self._norms = [k1 * (1 - b + b * n / avg_len) for n in doc_lens]
+        self._views = [view, self._offsets, self._doc_ids, self._tfs, doc_lens]
+
+    def __len__(self):
+        return self.count
+
+    def search(self, query, k, mask=None):
+        """BM25 상위 k개 → [(청크 순번, 점수), ...] (mask: 청크 순번 bool 마스크, 선택)"""
+        scores = {}
+        n = self.count
+        for term, qtf in Counter(tokenize(query, query=True)).items():
+            t = self._term_ids.get(term)
+            if t is None:
+                continue
+            start, end = self._offsets[t], self._offsets[t + 1]
+            idf = math.log(1 + (n - (end - start) + 0.5) / ((end - start) + 0.5))
+            weight = idf * qtf * (self.k1 + 1)
+            norms = self._norms
+            for doc, tf in zip(self._doc_ids[start:end], self._tfs[start:end]):
+                if mask is not None and not mask[doc]:
+                    continue
+                scores[doc] = scores.get(doc, 0.0) + weight * tf / (tf + norms[doc])
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def stats(self):
+        return {"documents": self.count, "terms": len(self._term_ids),
+                "postings": len(self._doc_ids), "bytes": len(self._mmap)}
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._mmap.close()
+
+
+def reciprocal_rank_fusion(rankings, n, k=RRF_K):
+    """여러 검색 결과 목록(문서 dict, "id"로 식별)을 순위 융합 → 상위 n개
+
+    같은 문서는 먼저 나온 목록의 dict를 쓰고 "rrf" 점수를 붙인다.
+    """
+    fused = {}
+    scores = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, 1):
+            fused.setdefault(doc["id"], doc)
+            scores[doc["id"]] = scores.get(doc["id"], 0.0) + 1.0 / (k + rank)
+    top = sorted(scores, key=scores.get, reverse=True)[:n]
+    return [dict(fused[i], rrf=round(scores[i], 6)) for i in top]
@@ -6,9 +6,27 @@ PDF 추출 → 텍스트 청킹 → Gemini 임베딩 → ChromaDB 저장
 사용법:
   python rag/pipeline.py                          # 전체 파이프라인 실행
   python rag/pipeline.py --step extract           # PDF 텍스트 추출만
+  python rag/pipeline.py --step extract --workers 8  # PDF 병렬 추출 (프로세스 8개)
+  python rag/pipeline.py --step extract --max-rss-mb 2048  # RSS 상한을 두고 추출
   python rag/pipeline.py --step chunk             # 텍스트 청킹만
+  python rag/pipeline.py --step chunk --cross-page  # 페이지 경계를 넘어 청킹
+  python rag/pipeline.py --step bench-chunk --bench-pages 1000000  # 청킹 처리량 측정
   python rag/pipeline.py --step embed             # 임베딩 + DB 저장만
+  python rag/pipeline.py --step embed --embed-workers 8  # 동시 요청 8개로 임베딩
+  python rag/pipeline.py --step stream            # 추출→청킹→임베딩 스트리밍 (중간 파일 없음)
+  python rag/pipeline.py --step compact --codec int8  # 벡터 압축 저장 + 메모리·재현율 보고
+  python rag/pipeline.py --step bench-search       # ChromaDB vs NumPy 검색 백엔드 비교
+  python rag/pipeline.py --step index --index-type hnsw  # ANN 색인 구축 + 재현율·지연 표
+  python rag/pipeline.py --step shard --shard-by source  # 책(PDF)별 샤드 컬렉션 (server.py --backend shards)
+  python rag/pipeline.py --embed-dim 768           # 768차원 임베딩 (별도 컬렉션 mankiw_economics_d768)
+  python rag/pipeline.py --embedder hashing       # 네트워크 없이 로컬 해싱 임베딩 (mankiw_economics_hashing_d768)
   python rag/pipeline.py --api-key YOUR_KEY       # API 키 직접 지정
+  python rag/pipeline.py --force                  # 지문이 같아도 모든 단계를 다시 실행
+
+각 단계는 입력·파라미터 지문을 rag/data/manifest.json에 기록하고, 바뀐 것이
+없으면 건너뛴다 (PDF 추출은 내용이 바뀐 PDF만 다시 처리).
+임베딩 단계는 커밋된 청크 순번을 rag/data/embed_journal.log에 기록해 중단된
+지점부터 이어서 실행한다.
 """
 
 import os
@@ -18,8 +36,27 @@ import re
 import time
 import argparse
 import hashlib
+import shutil
+import gc
+import bisect
+import itertools
+import queue
+import threading
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 
+from embed_cache import EmbeddingCache
+from embedder import (EMBEDDERS, GEMINI_MODEL, HASHING_DIM, HASHING_MODEL, ONNX_MODEL, EmbeddingHTTPError,
+                      collection_name, make_embedder)
+from chunk_store import ChunkStore, ChunkStoreWriter, iter_chunk_records
+from vector_codec import CODECS, CompactVectors, exact_search, recall_at_k
+from retrieval import ChromaBackend, NumpyBackend
+from lexical import TOKENIZER_VERSION, build_lexical_index, read_header as read_lexical_header
+from chapter_index import ChapterIndex, build_chapter_index
+from ann_index import ANN_TYPES, SEARCH_PARAM_NAMES, AnnIndex
+
 # Windows에서 UTF-8 출력 설정
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8', errors='replace')
@@ -31,25 +68,86 @@ RAW_DB_DIR = BASE_DIR / ".raw_db"
 RAG_DIR = BASE_DIR / "rag"
 DATA_DIR = RAG_DIR / "data"
 CHROMA_DIR = RAG_DIR / "chroma_db"
+PAGES_CACHE_DIR = DATA_DIR / "pages"          # PDF별 추출 결과 캐시
+MANIFEST_PATH = DATA_DIR / "manifest.json"    # 단계별 입력·파라미터 지문
+CHUNK_ID_MAP_PATH = DATA_DIR / "chunk_id_map.json"  # 재청킹 시 이전 ID → 새 ID 대응표
+CHUNK_STORE_PATH = DATA_DIR / "chunks.bin"    # 열 지향 청크 저장소 (chunk_store.py)
+LEGACY_CHUNKS_PATH = DATA_DIR / "chunks.jsonl"  # 이전 형식 (다음 Step 2에서 chunks.bin으로 교체)
+LEXICAL_INDEX_PATH = DATA_DIR / "lexical.bin"  # BM25 역색인 (lexical.py, Step 2에서 함께 생성)
+CHAPTER_INDEX_PATH = DATA_DIR / "chapter_index.json"  # 챕터 → 청크 순번 구간 (chapter_index.py, Step 2에서 함께 생성)
+EMBED_JOURNAL_PATH = DATA_DIR / "embed_journal.log"  # 커밋된 청크 순번 (임베딩 재시작용)
+STREAM_JOURNAL_PATH = DATA_DIR / "stream_journal.log"  # --step stream의 커밋된 청크 순번 (스트림 순서)
+VECTORS_DIR = DATA_DIR / "vectors"            # 압축 벡터 (vector_codec.py, --step compact)
+ANN_DIR = RAG_DIR / "ann_index"               # ANN 색인 (ann_index.py, --step index), 종류별 하위 폴더
+SHARDS_PATH = CHROMA_DIR / "shards.json"      # 샤드 컬렉션 목록 (--step shard)
 
 # ── 청킹 설정 ──
 CHUNK_SIZE = 800       # 청크 크기 (문자)
 CHUNK_OVERLAP = 150    # 오버랩 (문자)
 MIN_CHUNK_SIZE = 100   # 최소 청크 크기
+CHUNK_CROSS_PAGE = False  # True면 같은 챕터 안에서 페이지 경계를 넘어 청킹
+CHUNKER_VERSION = 6       # 청킹 로직이 바뀌면 올려서 기존 청크 지문을 무효화
 
-# ── 임베딩 설정 ──
-EMBEDDING_MODEL = "models/gemini-embedding-001"
-EMBEDDING_BATCH_SIZE = 50   # Gemini API 배치 크기
-EMBEDDING_RATE_LIMIT = 0.5  # API 호출 간 대기시간 (초)
+# 문장 경계 (한국어 + 영어): 문장부호 + 공백 뒤, 또는 빈 줄 뒤
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?。]\s)|(?<=\n\n)')
 
+# 챕터 감지를 위한 패턴
+CHAPTER_PATTERNS = [
+    re.compile(r'(?:제?\s*)?(\d{1,2})\s*[장편]\s*[.:]?\s*(.+)', re.MULTILINE),
+    re.compile(r'CHAPTER\s*(\d{1,2})\s*[.:]?\s*(.+)', re.IGNORECASE | re.MULTILINE),
+    re.compile(r'(?:Part|파트)\s*(\d{1,2})\s*[.:]?\s*(.+)', re.IGNORECASE | re.MULTILINE),
+]
 
-def step1_extract_pdfs():
-    """Step 1: PDF 파일에서 텍스트 추출"""
+# ── 임베딩 설정 ──
+EMBEDDER = "gemini"         # gemini | hashing | onnx (embedder.py, --embedder)
+EMBEDDING_MODEL = GEMINI_MODEL
+EMBEDDING_DIM = None        # outputDimensionality (None = 모델 기본 3072, 줄이면 단위 길이로 정규화)
+EMBEDDING_BATCH_SIZE = 50   # Gemini API 배치 크기
+EMBEDDING_RATE_LIMIT = 0.5  # API 호출 간 대기시간 (초) — 속도 제한기의 시작 속도 (1/값 req/s)
+EMBEDDING_MAX_RPS = 20      # 속도 제한기가 올라갈 수 있는 최대 속도 (req/s)
+EMBEDDING_WORKERS = 1       # 동시에 진행할 batchEmbedContents 요청 수
+THROTTLE_STATUS_CODES = (429, 503)  # 속도를 낮춰야 하는 HTTP 상태
+# 로컬 스텁으로 테스트할 때: GEMINI_API_BASE=http://localhost:8765/v1beta (rag/stub_gemini.py)
+EMBEDDING_CACHE_ENABLED = True  # rag/cache/embeddings.sqlite 디스크 캐시 사용 여부
+_embedding_cache = None
+_embedder = None
+COLLECTION_NAME = "mankiw_economics"  # --embed-dim N이면 "_dN", 로컬 임베딩이면 "_hashing_d768" 등이 붙음
+FULL_COLLECTION_NAME = COLLECTION_NAME  # Gemini 전체 차원 컬렉션 (차원 축소 재현율 비교 기준)
+
+# ── 압축 벡터 설정 ──
+COMPACT_CODEC = "int8"       # float16 | int8 (벡터별 스케일)
+RECALL_QUERIES = 200         # 재현율 측정에 쓰는 표본 쿼리 수
+RECALL_K = 10
+
+# ── ANN 색인 설정 ──
+ANN_TARGET_RECALL = 0.95     # 이 재현율@k를 넘는 가장 작은 efSearch/nprobe를 서버 기본값으로 저장
+
+# ── 샤딩 설정 ──
+SHARD_FIELDS = {"source": "source_file", "part": "part"}   # --shard-by 값 → 청크 메타데이터 필드
+SHARD_BY = "source"          # 책(PDF)마다 한 샤드 — 교재·강의록을 추가해도 한 컬렉션이 커지지 않음
+SHARD_COPY_BATCH = 500       # 원본 컬렉션에서 한 번에 읽어 샤드에 옮기는 행 수
+
+# ── DB 쓰기 설정 ──
+WRITER_FLUSH_ROWS = 1000     # 쓰기 스레드가 모아서 한 번에 upsert하는 행 수
+WRITER_FLUSH_SECONDS = 2.0   # 행이 덜 모여도 이 시간 동안 새 배치가 없으면 기록
+WRITER_QUEUE_BATCHES = 16    # 임베딩 → 쓰기 스레드 사이 큐에 대기할 수 있는 최대 배치 수
+
+# ── 추출 설정 ──
+EXTRACT_SHARD_PAGES = 50    # 병렬 추출 시 워커 하나가 맡는 페이지 구간 크기
+EXTRACT_MAX_RSS_MB = 0      # 추출 프로세스 RSS 상한 (MB, 0 = 제한 없음)
+
+# ── 스트리밍 설정 ──
+STREAM_QUEUE_BATCHES = 4    # 추출·청킹 → 임베딩 사이 큐에 대기할 수 있는 최대 배치 수
+
+
+def step1_extract_pdfs(workers=1, max_rss_mb=EXTRACT_MAX_RSS_MB, force=False):
+    """Step 1: PDF 파일에서 텍스트 추출 (내용이 바뀐 PDF만 다시 추출, workers > 1이면 병렬 처리)"""
     print("\n" + "=" * 60)
     print("📄 Step 1: PDF 텍스트 추출")
     print("=" * 60)
 
     DATA_DIR.mkdir(parents=True, exist_ok=True)
+    PAGES_CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
     pdf_files = sorted(RAW_DB_DIR.glob("*.pdf"))
     if not pdf_files:
@@ -65,58 +163,357 @@ def step1_extract_pdfs():
         print("❌ pdfplumber 설치 필요: pip install pdfplumber")
         return False
 
-    all_pages = []
-    total_chars = 0
+    output_path = DATA_DIR / "extracted_pages.jsonl"
+    manifest = load_manifest()
+    prev = manifest.get("extract", {})
+    params = {"pdfplumber": getattr(pdfplumber, "__version__", "unknown")}
+    params_changed = force or prev.get("params") != params
+    prev_files = {} if params_changed else prev.get("files", {})
+
+    # PDF별 지문 비교 → 바뀐 파일만 추출 대상
+    files = {}
+    changed = []
+    for pdf_path in pdf_files:
+        entry = pdf_fingerprint(pdf_path, prev_files.get(pdf_path.name))
+        cached = prev_files.get(pdf_path.name)
+        if cached and cached["sha256"] == entry["sha256"] and page_cache_path(pdf_path.name).exists():
+            entry.update(pages=cached["pages"], chars=cached["chars"])
+        else:
+            changed.append(pdf_path)
+        files[pdf_path.name] = entry
+
+    # 삭제된 PDF의 캐시 정리
+    for stale in PAGES_CACHE_DIR.glob("*.jsonl"):
+        if stale.stem not in files:
+            stale.unlink()
+
+    print(f"🔎 변경된 PDF: {len(changed)}개 (재사용 {len(pdf_files) - len(changed)}개)")
+
+    if changed:
+        if max_rss_mb:
+            print(f"🧠 메모리 상한: RSS {max_rss_mb:,} MB")
+        try:
+            if workers > 1:
+                results = extract_pdfs_parallel(changed, PAGES_CACHE_DIR, workers, max_rss_mb)
+            else:
+                results = extract_pdfs_streaming(changed, PAGES_CACHE_DIR, max_rss_mb)
+        except MemoryLimitExceeded as e:
+            print(f"\n❌ {e}")
+            print(f"   --workers 를 줄이거나 --max-rss-mb 를 늘려 다시 실행하세요.")
+            return False
+
+        for pdf_path in changed:
+            if pdf_path.name in results:
+                files[pdf_path.name].update(results[pdf_path.name])
+            else:
+                # 실패한 파일은 지문을 남기지 않아 다음 실행 때 다시 추출됨
+                del files[pdf_path.name]
+
+    output_fp = params_fingerprint({"params": params,
+                                    "files": [[name, f["sha256"]] for name, f in files.items()]})
+    if changed or params_changed or prev.get("output") != output_fp or not output_path.exists():
+        # 파일별 결과를 (파일명 순서로) 이어 붙임 → 전체 재추출과 바이트 단위로 동일
+        tmp_path = output_path.with_suffix(".jsonl.tmp")
+        with open(tmp_path, "wb") as out:
+            for name in files:
+                with open(page_cache_path(name), "rb") as f:
+                    shutil.copyfileobj(f, out)
+        tmp_path.replace(output_path)
+    else:
+        print("⏭️  변경 없음 — 기존 추출 결과를 그대로 사용합니다.")
+
+    manifest["extract"] = {"params": params, "files": files, "output": output_fp}
+    save_manifest(manifest)
+
+    page_count = sum(f["pages"] for f in files.values())
+    total_chars = sum(f["chars"] for f in files.values())
+
+    print(f"\n{'─' * 40}")
+    print(f"📊 추출 결과:")
+    print(f"   총 페이지: {page_count}개")
+    print(f"   총 문자 수: {total_chars:,}자")
+    print(f"   저장 위치: {output_path}")
+    return True
+
+
+def page_cache_path(pdf_name):
+    """PDF별 추출 결과 캐시 경로"""
+    return PAGES_CACHE_DIR / f"{pdf_name}.jsonl"
+
+
+def file_sha256(path):
+    """파일 내용의 SHA-256 (스트리밍 계산)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pdf_fingerprint(pdf_path, cached=None):
+    """PDF 지문 {sha256, size, mtime_ns} — 크기·수정시각이 같으면 저장된 해시를 재사용"""
+    stat = pdf_path.stat()
+    if cached and cached.get("size") == stat.st_size and cached.get("mtime_ns") == stat.st_mtime_ns:
+        sha = cached["sha256"]
+    else:
+        sha = file_sha256(pdf_path)
+    return {"sha256": sha, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def params_fingerprint(params):
+    """단계 입력·파라미터 딕셔너리의 지문"""
+    return hashlib.sha256(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def load_manifest():
+    """단계별 지문 매니페스트 로드 (없거나 손상되면 빈 매니페스트)"""
+    if MANIFEST_PATH.exists():
+        try:
+            with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            print("   [WARN] 매니페스트가 손상되어 전체를 다시 처리합니다.")
+    return {}
+
+
+def save_manifest(manifest):
+    """단계별 지문 매니페스트 저장"""
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = MANIFEST_PATH.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    tmp_path.replace(MANIFEST_PATH)
+
+
+class MemoryLimitExceeded(Exception):
+    """추출 중 RSS가 설정된 상한을 넘었을 때 발생"""
+
+
+def current_rss_mb():
+    """현재 프로세스의 RSS(MB) — 측정할 수 없으면 None"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def check_memory(peak_mb, max_rss_mb, where):
+    """RSS를 측정해 최대값을 갱신하고, 상한을 넘으면 GC 후에도 넘는 경우 예외 발생"""
+    rss = current_rss_mb()
+    if rss is None:
+        return peak_mb
+    if max_rss_mb and rss > max_rss_mb:
+        gc.collect()
+        rss = current_rss_mb() or rss
+        if rss > max_rss_mb:
+            raise MemoryLimitExceeded(
+                f"메모리 상한 초과: RSS {rss:,.0f} MB > {max_rss_mb:,} MB ({where})")
+    return max(peak_mb, rss)
+
+
+def iter_pdf_pages(pdf_files, max_rss_mb=0, failed=None):
+    """PDF를 한 페이지씩 추출·정제해 페이지 레코드를 yield (페이지 레이아웃 캐시는 즉시 해제)
+
+    추출에 실패한 PDF의 이름은 failed(set)에 기록한다.
+    """
+    import pdfplumber
 
     for pdf_path in pdf_files:
         print(f"\n📖 처리 중: {pdf_path.name}")
-        
+        peak_mb = check_memory(0.0, max_rss_mb, pdf_path.name)
+
         try:
             with pdfplumber.open(pdf_path) as pdf:
                 for page_idx, page in enumerate(pdf.pages):
-                    text = page.extract_text()
-                    if not text or len(text.strip()) < 20:
-                        continue
-
-                    # 텍스트 정제
-                    text = clean_text(text)
-                    
-                    # 페이지 번호 추정 (파일명에서)
-                    # 예: 001-100.pdf → 1~100
-                    page_range = pdf_path.stem.split("-")
-                    if len(page_range) == 2:
-                        start_page = int(page_range[0])
-                        estimated_page = start_page + page_idx
-                    else:
-                        estimated_page = page_idx + 1
-
-                    page_data = {
-                        "source_file": pdf_path.name,
-                        "page_index": page_idx,
-                        "estimated_page": estimated_page,
-                        "text": text,
-                        "char_count": len(text)
-                    }
-                    all_pages.append(page_data)
-                    total_chars += len(text)
-
-                print(f"   ✅ {len(pdf.pages)}페이지 처리 완료")
+                    page_data = build_page_data(pdf_path.name, page_idx, page.extract_text())
+                    # pdf 객체가 페이지별로 보관하는 파싱 결과(문자·레이아웃) 해제
+                    page.flush_cache()
+                    if page_data is not None:
+                        yield page_data
+                    peak_mb = check_memory(peak_mb, max_rss_mb,
+                                           f"{pdf_path.name} p.{page_idx + 1}")
+
+                print(f"   ✅ {len(pdf.pages)}페이지 처리 완료 (최대 RSS: {peak_mb:,.0f} MB)")
+        except MemoryLimitExceeded:
+            raise
         except Exception as e:
             print(f"   ❌ 오류: {e}")
+            if failed is not None:
+                failed.add(pdf_path.name)
             continue
 
-    # 결과 저장
-    output_path = DATA_DIR / "extracted_pages.jsonl"
-    with open(output_path, "w", encoding="utf-8") as f:
-        for page in all_pages:
-            f.write(json.dumps(page, ensure_ascii=False) + "\n")
 
-    print(f"\n{'─' * 40}")
-    print(f"📊 추출 결과:")
-    print(f"   총 페이지: {len(all_pages)}개")
-    print(f"   총 문자 수: {total_chars:,}자")
-    print(f"   저장 위치: {output_path}")
-    return True
+def extract_pdfs_streaming(pdf_files, out_dir, max_rss_mb=0):
+    """PDF를 한 페이지씩 추출해 파일별 결과(out_dir/<이름>.jsonl)에 즉시 기록
+
+    성공한 PDF만 {이름: {"pages", "chars"}}로 반환한다.
+    """
+    failed = set()
+    results = {}
+    out = None
+    current = None
+
+    def finish():
+        if out is not None:
+            out.close()
+            tmp = out_dir / f"{current}.jsonl.tmp"
+            if current in failed:
+                tmp.unlink(missing_ok=True)
+            else:
+                tmp.replace(out_dir / f"{current}.jsonl")
+
+    try:
+        for page_data in iter_pdf_pages(pdf_files, max_rss_mb, failed):
+            name = page_data["source_file"]
+            if name != current:
+                finish()
+                current = name
+                out = open(out_dir / f"{name}.jsonl.tmp", "w", encoding="utf-8")
+                results[name] = {"pages": 0, "chars": 0}
+            out.write(json.dumps(page_data, ensure_ascii=False) + "\n")
+            results[name]["pages"] += 1
+            results[name]["chars"] += page_data["char_count"]
+        finish()
+        out = None
+    finally:
+        if out is not None:
+            out.close()
+
+    # 텍스트가 없는 PDF도 빈 결과로 기록 (다음 실행에서 다시 추출하지 않도록)
+    for pdf_path in pdf_files:
+        if pdf_path.name not in results and pdf_path.name not in failed:
+            (out_dir / f"{pdf_path.name}.jsonl").write_text("", encoding="utf-8")
+            results[pdf_path.name] = {"pages": 0, "chars": 0}
+
+    return {name: r for name, r in results.items() if name not in failed}
+
+
+def build_page_data(source_file, page_idx, text):
+    """추출된 원문 한 페이지를 정제해 페이지 레코드로 변환 (내용이 없으면 None)"""
+    if not text or len(text.strip()) < 20:
+        return None
+
+    # 텍스트 정제
+    text = clean_text(text)
+
+    # 페이지 번호 추정 (파일명에서)
+    # 예: 001-100.pdf → 1~100
+    page_range = Path(source_file).stem.split("-")
+    if len(page_range) == 2:
+        start_page = int(page_range[0])
+        estimated_page = start_page + page_idx
+    else:
+        estimated_page = page_idx + 1
+
+    return {
+        "source_file": source_file,
+        "page_index": page_idx,
+        "estimated_page": estimated_page,
+        "text": text,
+        "char_count": len(text)
+    }
+
+
+def extract_page_range(pdf_path, start, end, max_rss_mb=0):
+    """워커 프로세스: PDF의 [start, end) 페이지 구간 추출 → (페이지 목록, 오류 메시지, 최대 RSS)"""
+    import pdfplumber
+
+    pages = []
+    peak_mb = 0.0
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            for page_idx in range(start, end):
+                page = pdf.pages[page_idx]
+                page_data = build_page_data(Path(pdf_path).name, page_idx, page.extract_text())
+                page.flush_cache()
+                if page_data is not None:
+                    pages.append(page_data)
+                peak_mb = check_memory(peak_mb, max_rss_mb,
+                                       f"{Path(pdf_path).name} p.{page_idx + 1}")
+    except MemoryLimitExceeded as e:
+        return pages, f"MEMORY:{e}", peak_mb
+    except Exception as e:
+        return pages, str(e), peak_mb
+    return pages, None, peak_mb
+
+
+def extract_pdfs_parallel(pdf_files, out_dir, workers, max_rss_mb=0):
+    """프로세스 풀로 PDF를 페이지 구간 단위로 나눠 추출하고 파일별로 (페이지 순서대로) 병합 저장
+
+    성공한 PDF만 {이름: {"pages", "chars"}}로 반환한다.
+    """
+    import pdfplumber
+    from concurrent.futures import ProcessPoolExecutor
+
+    # 작업 단위(shard) 구성: 파일 정렬 순서 → 페이지 구간 순서
+    shards = []
+    page_totals = {}
+    for pdf_path in pdf_files:
+        try:
+            with pdfplumber.open(pdf_path) as pdf:
+                n_pages = len(pdf.pages)
+        except Exception as e:
+            print(f"   ❌ {pdf_path.name} 열기 오류: {e}")
+            continue
+        page_totals[pdf_path.name] = n_pages
+        if n_pages == 0:
+            (out_dir / f"{pdf_path.name}.jsonl").write_text("", encoding="utf-8")
+        for start in range(0, n_pages, EXTRACT_SHARD_PAGES):
+            shards.append((str(pdf_path), start, min(start + EXTRACT_SHARD_PAGES, n_pages)))
+
+    print(f"⚙️  병렬 추출: 워커 {workers}개, 작업 단위 {len(shards)}개 ({EXTRACT_SHARD_PAGES}페이지씩)")
+
+    results = {name: {"pages": 0, "chars": 0} for name in page_totals}
+    failed = set()
+    shards_left = {}
+    peak_by_file = {}
+    outputs = {}
+    for path, _, _ in shards:
+        shards_left[path] = shards_left.get(path, 0) + 1
+
+    # executor.map은 제출 순서대로 결과를 돌려주므로 직렬 실행과 동일한 순서로 기록됨
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            jobs = [(path, start, end, max_rss_mb) for path, start, end in shards]
+            mapped = executor.map(extract_page_range, *zip(*jobs)) if jobs else []
+            for (path, start, end), (pages, error, peak_mb) in zip(shards, mapped):
+                name = Path(path).name
+                if error and error.startswith("MEMORY:"):
+                    raise MemoryLimitExceeded(error[len("MEMORY:"):])
+                if error:
+                    print(f"   ❌ {name} p.{start + 1}-{end} 오류: {error}")
+                    failed.add(name)
+                peak_by_file[path] = max(peak_by_file.get(path, 0.0), peak_mb)
+
+                if path not in outputs:
+                    outputs[path] = open(out_dir / f"{name}.jsonl.tmp", "w", encoding="utf-8")
+                for page_data in pages:
+                    outputs[path].write(json.dumps(page_data, ensure_ascii=False) + "\n")
+                    results[name]["pages"] += 1
+                    results[name]["chars"] += page_data["char_count"]
+
+                shards_left[path] -= 1
+                if shards_left[path] == 0:
+                    outputs.pop(path).close()
+                    tmp = out_dir / f"{name}.jsonl.tmp"
+                    if name in failed:
+                        tmp.unlink(missing_ok=True)
+                        continue
+                    tmp.replace(out_dir / f"{name}.jsonl")
+                    print(f"   ✅ {name}: {page_totals[name]}페이지 처리 완료 "
+                          f"(워커 최대 RSS: {peak_by_file[path]:,.0f} MB)")
+    finally:
+        for f in outputs.values():
+            f.close()
+
+    return {name: r for name, r in results.items() if name not in failed}
 
 
 def clean_text(text):
@@ -132,8 +529,8 @@ def clean_text(text):
     return text
 
 
-def step2_chunk_text():
-    """Step 2: 텍스트 청킹"""
+def step2_chunk_text(cross_page=CHUNK_CROSS_PAGE, force=False):
+    """Step 2: 텍스트 청킹 (페이지를 읽는 즉시 청킹·기록하는 단일 선형 패스, 입력이 같으면 건너뜀)"""
     print("\n" + "=" * 60)
     print("✂️  Step 2: 텍스트 청킹")
     print("=" * 60)
@@ -143,127 +540,404 @@ def step2_chunk_text():
         print("❌ 추출된 페이지 파일이 없습니다. Step 1을 먼저 실행하세요.")
         return False
 
-    # 페이지 로드
-    pages = []
-    with open(pages_path, "r", encoding="utf-8") as f:
-        for line in f:
-            pages.append(json.loads(line.strip()))
+    output_path = CHUNK_STORE_PATH
+    manifest = load_manifest()
+    params = {
+        "pages": file_sha256(pages_path),
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "min_chunk_size": MIN_CHUNK_SIZE,
+        "cross_page": cross_page,
+        "chunker_version": CHUNKER_VERSION,
+    }
+    fingerprint = params_fingerprint(params)
+    prev = manifest.get("chunk", {})
+    if (not force and prev.get("fingerprint") == fingerprint and output_path.exists()
+            and prev.get("output") == chunk_store_digest(output_path)):
+        print(f"⏭️  변경 없음 — 기존 청크 {prev.get('chunks', 0):,}개를 그대로 사용합니다.")
+        print(f"   저장 위치: {output_path}")
+        update_lexical_index(force=force)
+        update_chapter_index(force=force)
+        return True
 
-    print(f"📄 로드된 페이지: {len(pages)}개")
+    page_counter = [0]
+
+    def load_pages():
+        with open(pages_path, "r", encoding="utf-8") as f:
+            for line in f:
+                page_counter[0] += 1
+                yield json.loads(line)
+
+    # 청킹 + 저장 (이전 결과는 ID 대응표를 만든 뒤 교체)
+    tmp_path = output_path.with_suffix(".bin.tmp")
+    chunk_count = 0
+    total_size = 0
+    with ChunkStoreWriter(tmp_path) as writer:
+        for chunk in iter_chunks(load_pages(), cross_page=cross_page):
+            writer.add(chunk)
+            chunk_count += 1
+            total_size += chunk["metadata"]["char_count"]
+
+    old_path = output_path if output_path.exists() else LEGACY_CHUNKS_PATH
+    if old_path.exists():
+        with ChunkStore(tmp_path) as new_store:
+            id_map = build_chunk_id_map(iter_chunk_records(old_path), new_store)
+        if CHUNK_ID_MAP_PATH.exists():
+            # 임베딩 전에 여러 번 재청킹한 경우: 아직 반영되지 않은 이전 대응표와 합성
+            with open(CHUNK_ID_MAP_PATH, "r", encoding="utf-8") as f:
+                pending = json.load(f)
+            renamed = {old: id_map["renamed"].get(mid, mid) for old, mid in pending["renamed"].items()}
+            renamed.update(id_map["renamed"])
+            id_map["renamed"] = {old: new for old, new in renamed.items() if old != new}
+            id_map["metadata_changed"] = sorted(set(pending["metadata_changed"]) |
+                                                set(id_map["metadata_changed"]))
+        with open(CHUNK_ID_MAP_PATH, "w", encoding="utf-8") as f:
+            json.dump(id_map, f, ensure_ascii=False)
+        print(f"🔁 ID 대응표: 이동 {len(id_map['renamed']):,}개 · "
+              f"메타데이터 변경 {len(id_map['metadata_changed']):,}개 → {CHUNK_ID_MAP_PATH.name}")
+    tmp_path.replace(output_path)
+    LEGACY_CHUNKS_PATH.unlink(missing_ok=True)
+
+    manifest["chunk"] = {
+        "params": params,
+        "fingerprint": fingerprint,
+        "output": chunk_store_digest(output_path),
+        "chunks": chunk_count,
+    }
+    save_manifest(manifest)
 
-    # 챕터 감지를 위한 패턴
-    chapter_patterns = [
-        re.compile(r'(?:제?\s*)?(\d{1,2})\s*[장편]\s*[.:]?\s*(.+)', re.MULTILINE),
-        re.compile(r'CHAPTER\s*(\d{1,2})\s*[.:]?\s*(.+)', re.IGNORECASE | re.MULTILINE),
-        re.compile(r'(?:Part|파트)\s*(\d{1,2})\s*[.:]?\s*(.+)', re.IGNORECASE | re.MULTILINE),
-    ]
+    # 통계
+    avg_size = total_size / chunk_count if chunk_count else 0
+
+    print(f"📄 로드된 페이지: {page_counter[0]}개")
+    print(f"\n{'─' * 40}")
+    print(f"📊 청킹 결과:")
+    print(f"   총 청크 수: {chunk_count:,}개")
+    print(f"   평균 크기: {avg_size:.0f}자")
+    print(f"   청크 크기: {CHUNK_SIZE}자 / 오버랩: {CHUNK_OVERLAP}자"
+          f"{' / 페이지 경계 무시' if cross_page else ''}")
+    print(f"   저장 위치: {output_path}")
+    update_lexical_index(force=force)
+    update_chapter_index(force=force)
+    return True
+
+
+def update_lexical_index(force=False):
+    """청크 저장소로 BM25 역색인(lexical.bin) 생성 — 같은 청크·토큰화 규칙으로 만든 색인이 있으면 건너뜀"""
+    with ChunkStore(CHUNK_STORE_PATH) as store:
+        header = read_lexical_header(LEXICAL_INDEX_PATH)
+        if (not force and header and header.get("chunks") == store.digest
+                and header.get("tokenizer_version") == TOKENIZER_VERSION):
+            print(f"⏭️  어휘 색인 변경 없음 ({len(header['terms']):,}개 용어)")
+            return
+        started = time.time()
+        header = build_lexical_index(store, LEXICAL_INDEX_PATH)
+    print(f"🔤 어휘(BM25) 색인: 용어 {len(header['terms']):,}개 · 포스팅 {header['postings']:,}개 "
+          f"({LEXICAL_INDEX_PATH.stat().st_size / 1e6:,.1f}MB, {time.time() - started:.1f}초) → {LEXICAL_INDEX_PATH.name}")
+
+
+def update_chapter_index(force=False):
+    """청크 저장소의 챕터 열로 챕터 → 청크 구간 색인(chapter_index.json) 생성 — 같은 청크로 만든 색인이 있으면 건너뜀"""
+    with ChunkStore(CHUNK_STORE_PATH) as store:
+        try:
+            index = ChapterIndex.load(CHAPTER_INDEX_PATH)
+        except (OSError, ValueError, KeyError):
+            index = None
+        if not force and index is not None and index.digest == store.digest:
+            print(f"⏭️  챕터 색인 변경 없음 ({len(index):,}개 챕터)")
+            return
+        data = build_chapter_index(store, CHAPTER_INDEX_PATH)
+    ranges = sum(len(entry["ranges"]) for entry in data["chapters"])
+    print(f"📑 챕터 색인: 챕터 {len(data['chapters']):,}개 · 구간 {ranges:,}개 → {CHAPTER_INDEX_PATH.name}")
+
+
+def detect_heading(text, current_chapter, current_part):
+    """페이지 상단에서 챕터/파트 제목을 감지해 (chapter, part) 갱신"""
+    for pattern in CHAPTER_PATTERNS:
+        match = pattern.search(text[:200])  # 페이지 상단에서만 검색
+        if match:
+            num = match.group(1)
+            title = match.group(2).strip()
+            if '장' in pattern.pattern or 'CHAPTER' in pattern.pattern.upper():
+                current_chapter = f"Chapter {num}: {title}"
+            else:
+                current_part = f"Part {num}: {title}"
+            break
+    return current_chapter, current_part
+
+
+def iter_chunks(pages, cross_page=False):
+    """페이지 레코드 스트림을 받아 챕터/파트를 추적하며 청크 레코드를 순서대로 yield
+
+    cross_page=True이면 같은 파일·같은 챕터에 속한 연속 페이지를 하나의 텍스트로
+    이어 붙여 청킹하므로 청크가 페이지 경계에서 잘리지 않는다 (메타데이터의
+    페이지는 청크가 시작되는 페이지).
 
-    chunks = []
+    청크 ID는 텍스트 내용에서 파생되므로 (chunk_content_id) 앞쪽에 페이지가
+    추가·삭제되어도 내용이 같은 청크의 ID는 바뀌지 않는다. 같은 텍스트가 다시
+    나오면 원본 파일 · 페이지 · 페이지 안 오프셋으로 만든 접미사를 붙인다
+    (chunk_position_id — 나온 순서와 무관). chunk_index는 순번.
+    """
+    chunk_id = 0
     current_chapter = "Unknown"
     current_part = "Unknown"
-    chunk_id = 0
+    seen = SeenDigests()   # 이미 나온 텍스트 (청크 100만 개에 약 16MB)
+
+    # 페이지 경계 무시 모드: (파일, 챕터, 파트)가 같은 연속 페이지 묶음
+    group = []
+    group_key = None
+
+    def make_chunk(page, offset, text, chapter, part):
+        base_id = chunk_content_id(text)
+        if seen.add(base_id):
+            base_id += "_" + chunk_position_id(page["source_file"], page["estimated_page"], offset)
+        return {
+            "id": base_id,
+            "text": text,
+            "metadata": {
+                "source_file": page["source_file"],
+                "estimated_page": page["estimated_page"],
+                "chapter": chapter,
+                "part": part,
+                "char_count": len(text),
+                "chunk_index": chunk_id
+            }
+        }
+
+    def flush_group():
+        nonlocal chunk_id
+        if not group:
+            return
+        doc = "\n\n".join(p["text"] for p in group)
+        page_starts = []
+        offset = 0
+        for p in group:
+            page_starts.append(offset)
+            offset += len(p["text"]) + 2
+        _, chapter, part = group_key
+        for start, end in iter_chunk_spans(doc, CHUNK_SIZE, CHUNK_OVERLAP, MIN_CHUNK_SIZE):
+            chunk_id += 1
+            index = bisect.bisect_right(page_starts, start) - 1
+            yield make_chunk(group[index], start - page_starts[index], doc[start:end], chapter, part)
+        group.clear()
 
     for page in pages:
         text = page["text"]
-        
+
         # 챕터/파트 감지
-        for pattern in chapter_patterns:
-            match = pattern.search(text[:200])  # 페이지 상단에서만 검색
-            if match:
-                num = match.group(1)
-                title = match.group(2).strip()
-                if '장' in pattern.pattern or 'CHAPTER' in pattern.pattern.upper():
-                    current_chapter = f"Chapter {num}: {title}"
-                else:
-                    current_part = f"Part {num}: {title}"
+        current_chapter, current_part = detect_heading(text, current_chapter, current_part)
+
+        if cross_page:
+            key = (page["source_file"], current_chapter, current_part)
+            if key != group_key:
+                yield from flush_group()
+                group_key = key
+            group.append(page)
+            continue
+
+        # 텍스트를 청크로 분할 (오프셋 구간 → 청크당 슬라이스 1회)
+        for start, end in iter_chunk_spans(text, CHUNK_SIZE, CHUNK_OVERLAP, MIN_CHUNK_SIZE):
+            chunk_id += 1
+            yield make_chunk(page, start, text[start:end], current_chapter, current_part)
+
+    yield from flush_group()
+
+
+def chunk_content_id(text):
+    """청크 텍스트에서 파생한 안정적인 ID (내용이 같으면 위치가 바뀌어도 동일)"""
+    return "chunk_" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_position_id(source_file, page, offset):
+    """중복 텍스트 청크의 ID 접미사 (원본 파일 · 페이지 · 페이지 안 시작 오프셋에서 파생)"""
+    return hashlib.sha256(f"{source_file}\0{page}\0{offset}".encode("utf-8")).hexdigest()[:8]
+
+
+class SeenDigests:
+    """이미 나온 키의 8바이트 다이제스트 집합 — iter_chunks의 중복 텍스트 판정용
+
+    array('Q') 위의 열린 주소 해시 테이블(선형 탐사, 사용률 50% 이하)이라 항목당
+    약 16바이트로 set[str]보다 훨씬 작고, 블룸 필터와 달리 처음 나온 텍스트를
+    중복으로 판정하지 않는다 (64비트 다이제스트 충돌만 예외).
+    """
+
+    def __init__(self, capacity=1 << 16):
+        size = 1
+        while size < capacity * 2:
+            size <<= 1
+        self._table = array("Q", bytes(8 * size))
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, key):
+        """key를 기록하고, 이미 있었으면 True"""
+        digest = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") or 1
+        if self._insert(self._table, digest):
+            return True
+        self._count += 1
+        if self._count * 2 > len(self._table):
+            table = array("Q", bytes(16 * len(self._table)))
+            for value in self._table:
+                if value:
+                    self._insert(table, value)
+            self._table = table
+        return False
+
+    @staticmethod
+    def _insert(table, digest):
+        """빈 칸(0)에 digest를 넣음 → 이미 있었으면 True"""
+        mask = len(table) - 1
+        i = digest & mask
+        while True:
+            value = table[i]
+            if value == 0:
+                table[i] = digest
+                return False
+            if value == digest:
+                return True
+            i = (i + 1) & mask
+
+
+def chunk_store_digest(path):
+    """청크 저장소 헤더에 기록된 내용 지문 (파일을 다시 해시하지 않음, 읽을 수 없으면 None)"""
+    try:
+        with ChunkStore(path) as store:
+            return store.digest
+    except (OSError, ValueError):
+        return None
+
+
+def build_chunk_id_map(old_chunks, new_chunks):
+    """이전 청크 레코드와 새 청크를 비교해 ID 대응표 생성
+
+    - renamed: 텍스트가 같지만 ID가 달라진 청크 {이전 ID: 새 ID} (예: 순번 ID → 내용 ID)
+    - metadata_changed: ID는 같지만 페이지·챕터 등 메타데이터가 바뀐 새 ID 목록
+    """
+    old_meta = {}
+    old_by_text = {}
+    for chunk in old_chunks:
+        old_meta[chunk["id"]] = chunk["metadata"]
+        old_by_text.setdefault(chunk_content_id(chunk["text"]), deque()).append(chunk["id"])
+
+    renamed = {}
+    metadata_changed = []
+    for chunk in new_chunks:
+        new_id = chunk["id"]
+        if new_id in old_meta:
+            if old_meta[new_id] != chunk["metadata"]:
+                metadata_changed.append(new_id)
+            continue
+        candidates = old_by_text.get(chunk_content_id(chunk["text"]))
+        while candidates:
+            old_id = candidates.popleft()
+            if old_id != new_id:
+                renamed[old_id] = new_id
                 break
 
-        # 텍스트를 청크로 분할
-        page_chunks = create_chunks(
-            text,
-            chunk_size=CHUNK_SIZE,
-            overlap=CHUNK_OVERLAP,
-            min_size=MIN_CHUNK_SIZE
-        )
+    return {"renamed": renamed, "metadata_changed": metadata_changed}
 
-        for chunk_text in page_chunks:
-            chunk_id += 1
-            chunk_data = {
-                "id": f"chunk_{chunk_id:05d}",
-                "text": chunk_text,
-                "metadata": {
-                    "source_file": page["source_file"],
-                    "estimated_page": page["estimated_page"],
-                    "chapter": current_chapter,
-                    "part": current_part,
-                    "char_count": len(chunk_text),
-                    "chunk_index": chunk_id
-                }
-            }
-            chunks.append(chunk_data)
 
-    # 결과 저장
-    output_path = DATA_DIR / "chunks.jsonl"
-    with open(output_path, "w", encoding="utf-8") as f:
-        for chunk in chunks:
-            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+def iter_sentence_spans(text):
+    """문장 경계(한국어 + 영어)로 나눈 (start, end) 오프셋을 앞뒤 공백을 제외하고 yield"""
+    pos = 0
+    boundaries = (m.start() for m in SENTENCE_BOUNDARY.finditer(text))
+    for boundary in itertools.chain(boundaries, (len(text),)):
+        start, end = pos, boundary
+        pos = boundary
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            yield start, end
 
-    # 통계
-    avg_size = sum(c["metadata"]["char_count"] for c in chunks) / len(chunks) if chunks else 0
-    
-    print(f"\n{'─' * 40}")
-    print(f"📊 청킹 결과:")
-    print(f"   총 청크 수: {len(chunks):,}개")
-    print(f"   평균 크기: {avg_size:.0f}자")
-    print(f"   청크 크기: {CHUNK_SIZE}자 / 오버랩: {CHUNK_OVERLAP}자")
-    print(f"   저장 위치: {output_path}")
-    return True
 
+def iter_chunk_spans(text, chunk_size=800, overlap=150, min_size=100):
+    """텍스트를 문장 경계를 고려한 청크 (start, end) 오프셋으로 분할
 
-def create_chunks(text, chunk_size=800, overlap=150, min_size=100):
-    """텍스트를 청크로 분할 (문장 경계 고려)"""
+    문자열을 이어 붙이지 않고 오프셋만 움직이므로 텍스트 길이에 선형이며,
+    오버랩은 직전 청크 끝에서 overlap자 앞으로 시작 위치를 당겨 처리한다.
+    """
     if len(text) <= chunk_size:
-        return [text] if len(text) >= min_size else []
+        # 한 청크에 들어가도 긴 경로와 같이 앞뒤 공백을 빼고 min_size를 판단
+        start, end = 0, len(text)
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end - start >= min_size:
+            yield start, end
+        return
 
-    chunks = []
-    
-    # 문장 분리 (한국어 + 영어)
-    sentences = re.split(r'(?<=[.!?。]\s)|(?<=\n\n)', text)
-    
-    current_chunk = ""
-    
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
+    chunk_start = chunk_end = None
+
+    for sent_start, sent_end in iter_sentence_spans(text):
+        if chunk_start is None:
+            chunk_start, chunk_end = sent_start, sent_end
             continue
-            
-        if len(current_chunk) + len(sentence) <= chunk_size:
-            current_chunk += " " + sentence if current_chunk else sentence
+
+        if sent_end - chunk_start <= chunk_size:
+            chunk_end = sent_end
+            continue
+
+        if chunk_end - chunk_start >= min_size:
+            yield chunk_start, chunk_end
+
+        # 오버랩 처리: 이전 청크의 마지막 부분을 다음 청크 시작에 포함
+        if overlap > 0:
+            chunk_start = max(chunk_end - overlap, chunk_start)
+            while text[chunk_start].isspace():
+                chunk_start += 1
         else:
-            if len(current_chunk) >= min_size:
-                chunks.append(current_chunk.strip())
-            
-            # 오버랩 처리: 이전 청크의 마지막 부분을 다음 청크 시작에 포함
-            if overlap > 0 and current_chunk:
-                overlap_text = current_chunk[-overlap:]
-                current_chunk = overlap_text + " " + sentence
-            else:
-                current_chunk = sentence
+            chunk_start = sent_start
+        chunk_end = sent_end
 
     # 마지막 청크
-    if current_chunk and len(current_chunk) >= min_size:
-        chunks.append(current_chunk.strip())
+    if chunk_start is not None and chunk_end - chunk_start >= min_size:
+        yield chunk_start, chunk_end
+
 
-    return chunks
+def create_chunks(text, chunk_size=800, overlap=150, min_size=100):
+    """텍스트를 청크로 분할 (문장 경계 고려)"""
+    return [text[start:end] for start, end in iter_chunk_spans(text, chunk_size, overlap, min_size)]
 
 
-def step3_build_vectordb(api_key=None):
-    """Step 3: 임베딩 생성 + ChromaDB 저장 (재시작 가능)"""
+def benchmark_chunking(n_pages, cross_page=False):
+    """청킹 처리량 측정: 추출된 페이지(없으면 합성 텍스트)를 n_pages만큼 반복해 한 번에 청킹"""
     print("\n" + "=" * 60)
-    print("Step 3: 임베딩 생성 + ChromaDB 저장")
+    print(f"⏱️  청킹 벤치마크: {n_pages:,}페이지{' (페이지 경계 무시)' if cross_page else ''}")
     print("=" * 60)
 
-    # API 키 확인 (.env 우선 → 환경변수 → 인자)
+    pages_path = DATA_DIR / "extracted_pages.jsonl"
+    sample = []
+    if pages_path.exists():
+        with open(pages_path, "r", encoding="utf-8") as f:
+            sample = [json.loads(line) for line in f]
+    if not sample:
+        sentence = "수요와 공급은 시장 경제를 움직이는 힘이다. Prices adjust to balance supply and demand. "
+        sample = [{"source_file": "synthetic.pdf", "page_index": i, "estimated_page": i + 1,
+                   "text": f"{i // 20 + 1}장 합성 텍스트\n" + sentence * 30} for i in range(200)]
+        print("   추출된 페이지가 없어 합성 텍스트를 사용합니다.")
+
+    pages = itertools.islice(itertools.cycle(sample), n_pages)
+    chunk_count = 0
+    total_chars = 0
+    start = time.perf_counter()
+    for chunk in iter_chunks(pages, cross_page=cross_page):
+        chunk_count += 1
+        total_chars += chunk["metadata"]["char_count"]
+    elapsed = time.perf_counter() - start
+
+    print(f"   청크: {chunk_count:,}개 ({total_chars / 1e6:,.1f}M자)")
+    print(f"   소요: {elapsed:.2f}초 → {n_pages / elapsed:,.0f} 페이지/초, "
+          f"{chunk_count / elapsed:,.0f} 청크/초")
+    return True
+
+
+def resolve_api_key(api_key=None):
+    """Gemini API 키 확인 (인자 → .env → 환경변수), 없으면 안내 후 None"""
     if not api_key:
         # 1순위: .env 파일
         env_path = BASE_DIR / ".env"
@@ -274,7 +948,7 @@ def step3_build_vectordb(api_key=None):
                         api_key = line.strip().split("=", 1)[1].strip().strip('"').strip("'")
                         print(f"   .env에서 API 키 로드됨")
                         break
-    
+
     if not api_key:
         # 2순위: 환경변수
         api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
@@ -285,196 +959,622 @@ def step3_build_vectordb(api_key=None):
         print("   1) python rag/pipeline.py --api-key YOUR_KEY")
         print("   2) 환경변수: set GEMINI_API_KEY=YOUR_KEY")
         print("   3) .env 파일: GEMINI_API_KEY=YOUR_KEY")
-        return False
-
-    # 청크 로드
-    chunks_path = DATA_DIR / "chunks.jsonl"
-    if not chunks_path.exists():
-        print("[ERROR] 청크 파일이 없습니다. Step 2를 먼저 실행하세요.")
-        return False
-
-    chunks = []
-    with open(chunks_path, "r", encoding="utf-8") as f:
-        for line in f:
-            chunks.append(json.loads(line.strip()))
-
-    print(f"   로드된 청크: {len(chunks):,}개")
-
-    # Gemini API 연결 확인 (직접 HTTP 호출 사용 — deprecated 라이브러리 우회)
-    import urllib.request
-    import urllib.error
-
-    def embed_texts(texts_list, api_key_val):
-        """Gemini REST API로 직접 임베딩 생성 (배치)"""
-        model_name = EMBEDDING_MODEL.replace("models/", "")
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:batchEmbedContents?key={api_key_val}"
-        
-        requests_body = []
-        for text in texts_list:
-            requests_body.append({
-                "model": EMBEDDING_MODEL,
-                "content": {"parts": [{"text": text}]},
-                "taskType": "RETRIEVAL_DOCUMENT"
-            })
-        
-        payload = json.dumps({"requests": requests_body}).encode("utf-8")
-        req = urllib.request.Request(url, data=payload, method="POST")
-        req.add_header("Content-Type", "application/json")
-        
+        return None
+    return api_key
+
+
+def get_embedding_cache():
+    """pipeline·server가 공유하는 디스크 임베딩 캐시 (비활성화 시 None)"""
+    global _embedding_cache
+    if EMBEDDING_CACHE_ENABLED and _embedding_cache is None:
+        _embedding_cache = EmbeddingCache()
+    return _embedding_cache
+
+
+def get_embedder(api_key=None):
+    """현재 설정(EMBEDDER)의 임베딩 백엔드 — gemini는 API 키가 없으면 안내 후 None"""
+    global _embedder
+    if _embedder is None:
+        key = None
+        if EMBEDDER == "gemini":
+            key = resolve_api_key(api_key)
+            if not key:
+                return None
         try:
-            with urllib.request.urlopen(req, timeout=60) as resp:
-                data = json.loads(resp.read().decode())
-            return [item["values"] for item in data["embeddings"]]
-        except urllib.error.HTTPError as e:
-            body = e.read().decode()
-            raise Exception(f"HTTP {e.code}: {body[:300]}")
-
-    def embed_single(text, api_key_val):
-        """Gemini REST API로 단일 텍스트 임베딩"""
-        model_name = EMBEDDING_MODEL.replace("models/", "")
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:embedContent?key={api_key_val}"
-        
-        payload = json.dumps({
-            "model": EMBEDDING_MODEL,
-            "content": {"parts": [{"text": text}]},
-            "taskType": "RETRIEVAL_DOCUMENT"
-        }).encode("utf-8")
-        req = urllib.request.Request(url, data=payload, method="POST")
-        req.add_header("Content-Type", "application/json")
-        
+            _embedder = make_embedder(EMBEDDER, api_key=key, dim=EMBEDDING_DIM, model=EMBEDDING_MODEL,
+                                      cache=get_embedding_cache())
+        except ImportError as e:
+            print(f"[ERROR] {e}")
+            return None
+    return _embedder
+
+
+class AdaptiveRateLimiter:
+    """토큰 버킷 + AIMD 방식 요청 속도 제한기 (스레드 안전)
+
+    요청이 성공할 때마다 허용 속도(req/s)를 additive_step만큼 올리고, 429/503을
+    받으면 절반으로 낮춘다. acquire()는 토큰이 생길 때까지 기다린다.
+    """
+
+    def __init__(self, rate=None, max_rate=None, min_rate=0.2, additive_step=0.2, burst=None):
+        self.rate = rate or 1.0 / EMBEDDING_RATE_LIMIT
+        self.max_rate = max_rate or EMBEDDING_MAX_RPS
+        self.min_rate = min_rate
+        self.additive_step = additive_step
+        self.burst = burst or max(1.0, self.rate)
+        self.tokens = 1.0
+        self.throttles = 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """요청 1회분 토큰 확보 (없으면 대기)"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait_time = (1.0 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    def on_success(self):
+        """가산 증가 (Additive Increase)"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.additive_step)
+            self.burst = max(1.0, self.rate)
+
+    def on_throttle(self):
+        """승산 감소 (Multiplicative Decrease) — 쌓인 토큰도 비움"""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * 0.5)
+            self.burst = max(1.0, self.rate)
+            self.tokens = 0.0
+            self.throttles += 1
+
+
+def embed_with_limiter(texts, embedder, limiter, max_attempts=6):
+    """속도 제한기를 거쳐 배치 임베딩 — 429/503이면 속도를 낮추고 재시도 (로컬 임베딩은 limiter=None)"""
+    if limiter is None:
+        return embedder.embed_documents(texts)
+    for attempt in range(max_attempts):
+        limiter.acquire()
         try:
-            with urllib.request.urlopen(req, timeout=30) as resp:
-                data = json.loads(resp.read().decode())
-            return data["embedding"]["values"]
-        except urllib.error.HTTPError as e:
-            body = e.read().decode()
-            raise Exception(f"HTTP {e.code}: {body[:300]}")
+            vectors = embedder.embed_documents(texts)
+        except EmbeddingHTTPError as e:
+            if e.code in THROTTLE_STATUS_CODES and attempt < max_attempts - 1:
+                limiter.on_throttle()
+                continue
+            raise
+        limiter.on_success()
+        return vectors
+
+
+def print_cache_stats():
+    """임베딩 캐시 적중률 출력"""
+    cache = get_embedding_cache()
+    if cache is None:
+        return
+    stats = cache.stats()
+    print(f"   임베딩 캐시: 적중 {stats['hits']:,} / 미적중 {stats['misses']:,} "
+          f"(적중률 {stats['hit_rate'] * 100:.1f}%, 저장 {stats['entries']:,}개)")
 
-    # 연결 테스트
-    print(f"   [DEBUG] API key: {repr(api_key[:8])}...{repr(api_key[-4:])}, len={len(api_key)}")
+
+def check_embedding_api(embedder):
+    """임베딩 백엔드 동작 테스트 (Gemini는 API 연결 확인)"""
+    if embedder.remote:
+        key = embedder.api_key
+        print(f"   [DEBUG] API key: {repr(key[:8])}...{repr(key[-4:])}, len={len(key)}")
     try:
-        test_emb = embed_single("test", api_key)
-        print(f"   Gemini Embedding API 연결 성공 (차원: {len(test_emb)}, 모델: {EMBEDDING_MODEL})")
+        test_emb = embedder.embed_documents(["test"], use_cache=False)[0]
+        print(f"   임베딩 연결 성공: {embedder.describe()} (차원: {len(test_emb)})")
+        return True
     except Exception as e:
-        print(f"[ERROR] Gemini Embedding API 연결 실패: {e}")
+        print(f"[ERROR] 임베딩 연결 실패 ({embedder.name}): {e}")
         return False
 
-    # ChromaDB 설정
+
+def open_collection():
+    """ChromaDB 컬렉션 열기 (있으면 재사용, 없으면 생성) — 재시작 지원"""
     try:
         import chromadb
-        from chromadb.config import Settings
     except ImportError:
         print("[ERROR] chromadb 설치 필요: pip install chromadb")
-        return False
+        return None
 
-    # ChromaDB 클라이언트 생성
     CHROMA_DIR.mkdir(parents=True, exist_ok=True)
     client = chromadb.PersistentClient(path=str(CHROMA_DIR))
-    
-    # 컬렉션 가져오기 (있으면 재사용, 없으면 생성) — 재시작 지원
-    collection_name = "mankiw_economics"
+
     try:
-        collection = client.get_collection(collection_name)
-        existing_count = collection.count()
-        print(f"   기존 컬렉션 발견: {existing_count:,}개 문서")
+        collection = client.get_collection(COLLECTION_NAME)
+        print(f"   기존 컬렉션 발견: {collection.count():,}개 문서")
     except Exception:
         collection = client.create_collection(
-            name=collection_name,
+            name=COLLECTION_NAME,
             metadata={"description": "맨큐의 경제학 제9판 교과서 벡터 DB"}
         )
-        existing_count = 0
-        print(f"   새 컬렉션 생성됨: {collection_name}")
+        print(f"   새 컬렉션 생성됨: {COLLECTION_NAME}")
+    return collection
 
-    # 이미 임베딩된 청크 ID 확인 (재시작 지원)
-    existing_ids = set()
-    if existing_count > 0:
-        try:
-            stored = collection.get(include=[])
-            existing_ids = set(stored['ids'])
-            print(f"   이미 임베딩된 청크: {len(existing_ids):,}개 (건너뜁니다)")
-        except Exception as e:
-            print(f"   기존 ID 조회 실패: {e}")
 
-    # 임베딩할 청크 필터링
-    remaining_chunks = [c for c in chunks if c['id'] not in existing_ids]
-    
-    if not remaining_chunks:
-        print("\n   모든 청크가 이미 임베딩되어 있습니다!")
-        print(f"   DB 크기: {collection.count():,}개 문서")
-        return True
+def write_db_metadata(final_count, target_chunks):
+    """벡터 DB 메타데이터(metadata.json) 저장"""
+    meta = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "total_chunks": final_count,
+        "target_chunks": target_chunks,
+        "embedder": EMBEDDER,
+        "embedding_model": EMBEDDING_MODEL,
+        "embedding_dim": EMBEDDING_DIM,
+        "collection": COLLECTION_NAME,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "source_files": [f.name for f in sorted(RAW_DB_DIR.glob("*.pdf"))],
+        "complete": final_count >= target_chunks
+    }
+    meta_path = CHROMA_DIR / "metadata.json"
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
 
-    print(f"   임베딩할 청크: {len(remaining_chunks):,}개 (전체 {len(chunks):,}개 중)")
 
-    # 배치 임베딩 생성 + DB 저장
-    batch_size = 20
-    rate_limit = 1.2
-    total_batches = (len(remaining_chunks) + batch_size - 1) // batch_size
-    embedded_count = 0
-    error_count = 0
-    consecutive_errors = 0
+def reconcile_collection(collection, chunks, existing_ids):
+    """재청킹 결과와 컬렉션을 맞춤 (existing_ids를 제자리에서 갱신)
+
+    chunk_id_map.json의 renamed 항목은 저장된 벡터를 새 ID로 복사해 재임베딩
+    비용 없이 재사용하고, metadata_changed 항목은 메타데이터만 갱신한다.
+    새 청크 목록에 없는 ID의 벡터는 삭제한다.
+    """
+    chunks_by_id = {c["id"]: c for c in chunks}
+    id_map = {"renamed": {}, "metadata_changed": []}
+    if CHUNK_ID_MAP_PATH.exists():
+        with open(CHUNK_ID_MAP_PATH, "r", encoding="utf-8") as f:
+            id_map = json.load(f)
+
+    batch_size = 500
+
+    # 1) 이동: 이전 ID의 벡터를 새 ID로 복사
+    moves = [(old, new) for old, new in id_map["renamed"].items()
+             if old in existing_ids and new not in existing_ids and new in chunks_by_id]
+    moved = 0
+    for i in range(0, len(moves), batch_size):
+        batch = dict(moves[i:i + batch_size])
+        stored = collection.get(ids=list(batch), include=["embeddings"])
+        new_ids = [batch[old] for old in stored["ids"]]
+        if not new_ids:
+            continue
+        collection.add(
+            ids=new_ids,
+            embeddings=list(stored["embeddings"]),
+            documents=[chunks_by_id[n]["text"] for n in new_ids],
+            metadatas=[chunks_by_id[n]["metadata"] for n in new_ids]
+        )
+        existing_ids.update(new_ids)
+        moved += len(new_ids)
+
+    # 2) 메타데이터만 바뀐 청크 갱신
+    updates = [i for i in id_map["metadata_changed"] if i in existing_ids and i in chunks_by_id]
+    for i in range(0, len(updates), batch_size):
+        batch = updates[i:i + batch_size]
+        collection.update(ids=batch, metadatas=[chunks_by_id[c]["metadata"] for c in batch])
+
+    # 3) 더 이상 없는 청크의 벡터 삭제
+    stale = [i for i in existing_ids if i not in chunks_by_id]
+    for i in range(0, len(stale), batch_size):
+        collection.delete(ids=stale[i:i + batch_size])
+    existing_ids.difference_update(stale)
+
+    if moved or updates or stale:
+        print(f"   재청킹 반영: 벡터 재사용 {moved:,}개 · 메타데이터 갱신 {len(updates):,}개 · "
+              f"오래된 벡터 삭제 {len(stale):,}개")
+    CHUNK_ID_MAP_PATH.unlink(missing_ok=True)
+
+
+class EmbedJournal:
+    """임베딩 재시작용 추가 전용(append-only) 체크포인트 저널
+
+    첫 줄은 헤더 JSON (embed 단계 지문 · 청크 수), 이후 각 줄은 DB에 커밋된
+    청크 순번(청크 저장소의 인덱스) 구간 목록 ("0-499,512,520-530").
+    쓰기 스레드가 upsert에 성공한 뒤에만 기록하므로, 기록 도중 중단되면 그
+    배치는 다시 임베딩·upsert된다 (upsert라 중복 저장되지 않음).
+    로드할 때 워터마크(처음으로 비어 있는 순번)와 비트맵으로 압축해 다시 쓴다.
+    청크 수를 미리 모르는 스트리밍 모드는 total=None — 비트맵이 필요한 만큼 늘어난다.
+    """
+
+    def __init__(self, path, fingerprint, total):
+        self.path = Path(path)
+        self.fingerprint = fingerprint
+        self.total = total
+        self._file = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def encode_ranges(ordinals):
+        ordinals = sorted(ordinals)
+        parts = []
+        start = prev = None
+        for n in ordinals:
+            if prev is not None and n == prev + 1:
+                prev = n
+                continue
+            if start is not None:
+                parts.append(str(start) if start == prev else f"{start}-{prev}")
+            start = prev = n
+        if start is not None:
+            parts.append(str(start) if start == prev else f"{start}-{prev}")
+        return ",".join(parts)
+
+    def load(self):
+        """저널 → 커밋 비트맵 (bytearray, 1=커밋됨). 없거나 지문이 다르면 None"""
+        if not self.path.exists():
+            return None
+        done = bytearray(self.total or 0)
+        with open(self.path, "r", encoding="utf-8") as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return None
+            if header.get("fingerprint") != self.fingerprint or header.get("total") != self.total:
+                return None
+            for line in f:
+                if not line.endswith("\n"):
+                    break   # 기록 도중 중단된 마지막 줄은 무시
+                try:
+                    for part in line.strip().split(","):
+                        if not part:
+                            continue
+                        start, _, end = part.partition("-")
+                        lo = int(start)
+                        hi = int(end) if end else lo
+                        if self.total is None and hi >= len(done):
+                            done.extend(bytes(hi + 1 - len(done)))
+                        elif hi >= len(done):
+                            return None   # 손상된 저널
+                        done[lo:hi + 1] = b"\x01" * (hi - lo + 1)
+                except ValueError:
+                    break
+        return done
+
+    @staticmethod
+    def watermark(done):
+        """처음으로 커밋되지 않은 순번 (전부 커밋됐으면 len(done))"""
+        pos = done.find(0)
+        return len(done) if pos < 0 else pos
+
+    def reset(self, done):
+        """비트맵 내용으로 저널을 새로 씀 (임시 파일 → 교체)"""
+        self.close()
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"fingerprint": self.fingerprint, "total": self.total}) + "\n")
+            ordinals = [i for i, flag in enumerate(done) if flag]
+            if ordinals:
+                f.write(self.encode_ranges(ordinals) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def append(self, ordinals):
+        """커밋된 순번 기록 (fsync까지 끝나야 반환)"""
+        if not ordinals:
+            return
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(self.encode_ranges(ordinals) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ChromaWriter(threading.Thread):
+    """임베딩 결과를 모아 ChromaDB에 대량 upsert하는 전용 쓰기 스레드
+
+    네트워크(임베딩 요청)와 저장(SQLite/세그먼트 쓰기)이 겹쳐서 진행되도록
+    put()으로 받은 배치를 제한된 큐에 넣고, flush_rows행이 모이거나
+    flush_seconds 동안 새 배치가 없으면 한 번의 upsert로 커밋한다.
+    큐가 가득 차면 put()이 대기하므로 메모리 사용량은 큐 크기로 제한된다.
+    journal이 있으면 커밋이 끝난 행의 순번을 저널에 기록한다.
+    """
+
+    def __init__(self, collection, journal=None, flush_rows=WRITER_FLUSH_ROWS,
+                 flush_seconds=WRITER_FLUSH_SECONDS, queue_batches=WRITER_QUEUE_BATCHES):
+        super().__init__(name="chroma-writer", daemon=True)
+        self.collection = collection
+        self.journal = journal
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.queue = queue.Queue(maxsize=queue_batches)
+        self.rows = 0            # 커밋된 행 수
+        self.commits = 0         # upsert 호출 수
+        self.failed_rows = 0     # 커밋 실패로 버려진 행 수 (다음 실행에서 다시 임베딩)
+        self.write_seconds = 0.0
+        self.put_wait_seconds = 0.0  # 큐가 가득 차 임베딩 쪽이 기다린 시간
+
+    def put(self, chunks, embeddings, ordinals=()):
+        """청크 목록과 같은 순서의 벡터(와 저널용 순번)를 쓰기 큐에 넣음 (큐가 가득 차면 대기)"""
+        waited = time.time()
+        self.queue.put((chunks, embeddings, ordinals))
+        self.put_wait_seconds += time.time() - waited
+
+    def close(self):
+        """남은 행을 모두 커밋하고 스레드 종료를 기다림"""
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        ids, embeddings, documents, metadatas, ordinals = [], [], [], [], []
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                item = False   # 시간 초과: 지금까지 모인 행만 기록
+            if item:
+                chunks, vectors, batch_ordinals = item
+                ids.extend(c["id"] for c in chunks)
+                documents.extend(c["text"] for c in chunks)
+                metadatas.extend(c["metadata"] for c in chunks)
+                embeddings.extend(vectors)
+                ordinals.extend(batch_ordinals)
+            if ids and (item is None or item is False or len(ids) >= self.flush_rows):
+                self._commit(ids, embeddings, documents, metadatas, ordinals)
+                ids, embeddings, documents, metadatas, ordinals = [], [], [], [], []
+            if item is None:
+                break
 
-    for batch_idx in range(0, len(remaining_chunks), batch_size):
-        batch = remaining_chunks[batch_idx:batch_idx + batch_size]
-        batch_num = batch_idx // batch_size + 1
-        
-        texts = [c["text"] for c in batch]
-        ids = [c["id"] for c in batch]
-        metadatas = [c["metadata"] for c in batch]
+    def _commit(self, ids, embeddings, documents, metadatas, ordinals):
+        started = time.time()
+        try:
+            self.collection.upsert(ids=ids, embeddings=embeddings,
+                                   documents=documents, metadatas=metadatas)
+            self.rows += len(ids)
+            self.commits += 1
+            if self.journal is not None:
+                self.journal.append(ordinals)
+        except Exception as e:
+            self.failed_rows += len(ids)
+            print(f"\n   [WARN] DB 쓰기 실패 ({len(ids):,}행): {str(e)[:100]}")
+        self.write_seconds += time.time() - started
+
+    def report(self):
+        """커밋 처리량 출력"""
+        per_commit = self.rows / self.commits if self.commits else 0
+        rate = self.rows / self.write_seconds if self.write_seconds else 0
+        print(f"   DB 쓰기: {self.rows:,}행 · 커밋 {self.commits}회 (평균 {per_commit:,.0f}행) · "
+              f"{rate:,.0f} 행/s · 쓰기 {self.write_seconds:.1f}초 · 큐 대기 {self.put_wait_seconds:.1f}초")
+        if self.failed_rows:
+            print(f"   DB 쓰기 실패: {self.failed_rows:,}행 (다시 실행하면 이어서 저장)")
+
+
+def embed_batches(batches, embedder, writer, limiter=None, workers=EMBEDDING_WORKERS, progress=None,
+                  max_consecutive_errors=5):
+    """(청크 순번 목록, 청크 목록) 배치 스트림을 동시 요청 workers개로 임베딩해 쓰기 스레드로 넘김
+
+    step3_build_vectordb와 run_stream_pipeline이 함께 쓴다. 진행 중인 배치 요청을
+    workers * 2개 이내로 유지하므로 batches는 필요한 만큼만 읽는다. 실패한 배치는
+    청크별 요청으로 나눠 같은 executor에서 재시도하고, 배치가 연속 max_consecutive_errors번
+    실패하면 시작하지 않은 요청을 취소하고 이미 실행 중인 요청의 결과만 받아 쓴 뒤 멈춘다.
+    progress(stats)는 배치가 성공할 때마다 호출된다.
+    → {"embedded", "batches", "errors", "aborted"}
+    """
+    stats = {"embedded": 0, "batches": 0, "errors": 0, "aborted": False}
+    consecutive_errors = 0
 
+    def embed_batch(ordinals, batch):
         try:
-            # REST API로 임베딩 생성
-            embeddings = embed_texts(texts, api_key)
-
-            # ChromaDB에 저장
-            collection.add(
-                ids=ids,
-                embeddings=embeddings,
-                documents=texts,
-                metadatas=metadatas
-            )
-            embedded_count += len(batch)
-            consecutive_errors = 0
-            
-            # 진행률 표시
-            total_done = len(existing_ids) + embedded_count
-            pct = (batch_num / total_batches) * 100
-            bar = ">" * int(pct // 2.5) + "-" * (40 - int(pct // 2.5))
-            print(f"\r   [{bar}] {pct:.1f}% ({total_done:,}/{len(chunks):,})", end="", flush=True)
-
-            # Rate limit 대기
-            if batch_idx + batch_size < len(remaining_chunks):
-                time.sleep(rate_limit)
+            return ordinals, batch, embed_with_limiter([c["text"] for c in batch], embedder, limiter), None
+        except Exception as e:
+            return ordinals, batch, None, e
 
+    def embed_chunk(ordinal, chunk):
+        """실패한 배치의 청크 하나 (재시도 없이 한 번, 429/503이면 속도만 낮춤)"""
+        try:
+            if limiter:
+                limiter.acquire()
+            vector = embedder.embed_documents([chunk["text"]])[0]
+            if limiter:
+                limiter.on_success()
+            return [vector], None
         except Exception as e:
-            error_count += 1
-            consecutive_errors += 1
-            error_msg = str(e)
-            print(f"\n   [WARN] 배치 {batch_num} 오류: {error_msg[:100]}")
-            
-            if consecutive_errors >= 5:
-                print(f"\n   [ERROR] 연속 {consecutive_errors}번 오류 발생. 중단합니다.")
-                print(f"   현재까지 {len(existing_ids) + embedded_count:,}개 임베딩 완료 (재시작 가능)")
+            if limiter and isinstance(e, EmbeddingHTTPError) and e.code in THROTTLE_STATUS_CODES:
+                limiter.on_throttle()
+            return None, e
+
+    batch_futures = set()   # 배치 요청 (workers * 2개 이내)
+    pending = set()         # 배치 + 청크별 재시도 요청
+    retries = {}            # 청크별 재시도 future → (순번, 청크)
+    batch_iter = iter(batches)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while not stats["aborted"] and len(batch_futures) < workers * 2:
+                item = next(batch_iter, None)
+                if item is None:
+                    break
+                future = executor.submit(embed_batch, *item)
+                batch_futures.add(future)
+                pending.add(future)
+            if not pending:
                 break
-            
-            wait_time = min(2 ** consecutive_errors, 60)
-            print(f"   {wait_time}초 대기 후 개별 재시도...")
-            time.sleep(wait_time)
-            
-            # 개별 처리로 재시도
-            for i, chunk in enumerate(batch):
-                try:
-                    emb = embed_single(chunk["text"], api_key)
-                    collection.add(
-                        ids=[chunk["id"]],
-                        embeddings=[emb],
-                        documents=[chunk["text"]],
-                        metadatas=[chunk["metadata"]]
-                    )
-                    embedded_count += 1
+
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future.cancelled():
+                    continue
+                if future in retries:
+                    ordinal, chunk = retries.pop(future)
+                    vectors, error = future.result()
+                    if error is None:
+                        writer.put([chunk], vectors, [ordinal])
+                        stats["embedded"] += 1
+                        consecutive_errors = 0
+                    else:
+                        print(f"\n   [FAIL] 청크 {chunk['id']}: {str(error)[:80]}")
+                    continue
+
+                batch_futures.discard(future)
+                ordinals, batch, embeddings, error = future.result()
+                stats["batches"] += 1
+
+                if error is None:
+                    writer.put(batch, embeddings, ordinals)
+                    stats["embedded"] += len(batch)
                     consecutive_errors = 0
-                    time.sleep(0.5)
-                except Exception as e2:
-                    print(f"\n   [FAIL] 청크 {chunk['id']}: {str(e2)[:80]}")
+                    if progress:
+                        progress(stats)
+                    continue
+
+                stats["errors"] += 1
+                consecutive_errors += 1
+                print(f"\n   [WARN] 배치 {stats['batches']} 오류: {str(error)[:100]}")
+                if stats["aborted"]:
+                    continue   # 중단 후 함께 끝난 배치는 재시도하지 않음
+
+                if consecutive_errors >= max_consecutive_errors:
+                    print(f"\n   [ERROR] 연속 {consecutive_errors}번 오류 발생. 중단합니다.")
+                    # 아직 시작하지 않은 요청은 취소, 실행 중인 요청은 끝까지 기다려 성공한 결과를 씀
+                    pending = {f for f in pending if not f.cancel()}
+                    stats["aborted"] = True
+                    continue
+
+                # 청크별 요청으로 나눠 재시도 (다른 배치와 함께 executor에서 동시에)
+                for ordinal, chunk in zip(ordinals, batch):
+                    retry = executor.submit(embed_chunk, ordinal, chunk)
+                    retries[retry] = (ordinal, chunk)
+                    pending.add(retry)
+    return stats
+
+
+def step3_build_vectordb(api_key=None, force=False, workers=EMBEDDING_WORKERS):
+    """Step 3: 임베딩 생성 + ChromaDB 저장 (재시작 가능, 청크·모델이 같고 완료 상태면 건너뜀)"""
+    print("\n" + "=" * 60)
+    print("Step 3: 임베딩 생성 + ChromaDB 저장")
+    print("=" * 60)
+
+    # 청크 확인
+    if not CHUNK_STORE_PATH.exists():
+        if LEGACY_CHUNKS_PATH.exists():
+            print("[ERROR] 이전 형식(chunks.jsonl)입니다. Step 2를 다시 실행해 chunks.bin으로 변환하세요.")
+        else:
+            print("[ERROR] 청크 파일이 없습니다. Step 2를 먼저 실행하세요.")
+        return False
+
+    load_started = time.time()
+    chunks = ChunkStore(CHUNK_STORE_PATH)
+    load_ms = (time.time() - load_started) * 1000
+
+    manifest = load_manifest()
+    embed_params = {
+        "chunks": chunks.digest,
+        "embedding_model": EMBEDDING_MODEL,
+        "collection": COLLECTION_NAME,
+    }
+    if EMBEDDER != "gemini":
+        embed_params["embedder"] = EMBEDDER
+    if EMBEDDING_DIM:
+        embed_params["embedding_dim"] = EMBEDDING_DIM
+    fingerprint = params_fingerprint(embed_params)
+    prev = manifest.get("embed", {})
+    if (not force and prev.get("fingerprint") == fingerprint and prev.get("complete")
+            and (CHROMA_DIR / "metadata.json").exists()):
+        print("   변경 없음 — 모든 청크가 이미 임베딩되어 있습니다. (건너뜀)")
+        return True
+
+    embedder = get_embedder(api_key)
+    if embedder is None:
+        return False
+
+    print(f"   로드된 청크: {len(chunks):,}개 (mmap {load_ms:.1f}ms)")
+
+    # 연결 테스트
+    if not check_embedding_api(embedder):
+        return False
+
+    collection = open_collection()
+    if collection is None:
+        return False
+    existing_count = collection.count()
+
+    # 재시작 지원: 체크포인트 저널이 현재 청크 파일과 맞으면 저널만으로 남은 작업을 계산
+    journal = EmbedJournal(EMBED_JOURNAL_PATH, fingerprint, len(chunks))
+    done = journal.load()
+    if done is not None and done.count(1) <= existing_count:
+        watermark = journal.watermark(done)
+        print(f"   체크포인트 저널: 커밋 {done.count(1):,}개 · 워터마크 {watermark:,} (건너뜁니다)")
+    else:
+        # 저널이 없거나 청크가 바뀜 → 저장된 ID 전체를 조회해 비교 (재청킹 반영 포함)
+        existing_ids = set()
+        if existing_count > 0:
+            try:
+                stored = collection.get(include=[])
+                existing_ids = set(stored['ids'])
+                print(f"   이미 임베딩된 청크: {len(existing_ids):,}개 (건너뜁니다)")
+            except Exception as e:
+                print(f"   기존 ID 조회 실패: {e}")
+
+        # 재청킹 반영: 텍스트가 같은 벡터는 새 ID로 옮기고, 사라진 청크의 벡터는 삭제
+        if existing_ids:
+            reconcile_collection(collection, chunks, existing_ids)
+
+        done = bytearray(chunks.chunk_id(i) in existing_ids for i in range(len(chunks)))
+        journal.reset(done)
+        watermark = journal.watermark(done)
+
+    # 임베딩할 청크 순번 (워터마크 이후에서 커밋되지 않은 것만)
+    already_done = done.count(1)
+    remaining = [i for i in range(watermark, len(chunks)) if not done[i]]
+
+    if not remaining:
+        print("\n   모든 청크가 이미 임베딩되어 있습니다!")
+        print(f"   DB 크기: {collection.count():,}개 문서")
+        write_db_metadata(collection.count(), len(chunks))   # 서버가 이 컬렉션·임베딩을 쓰도록
+        manifest["embed"] = {"params": embed_params, "fingerprint": fingerprint, "complete": True}
+        save_manifest(manifest)
+        return True
+
+    print(f"   임베딩할 청크: {len(remaining):,}개 (전체 {len(chunks):,}개 중)")
+
+    # 배치 임베딩 생성 (동시 요청 workers개, AIMD 속도 제한) → 쓰기 스레드가 대량 커밋
+    batch_size = EMBEDDING_BATCH_SIZE
+    batches = [remaining[i:i + batch_size] for i in range(0, len(remaining), batch_size)]
+    total_batches = len(batches)
+    limiter = AdaptiveRateLimiter() if embedder.remote else None   # 로컬 임베딩은 속도 제한 없음
+    writer = ChromaWriter(collection, journal=journal)
+    writer.start()
+    started = time.time()
+    pace = f"시작 속도 {limiter.rate:.1f} req/s (최대 {EMBEDDING_MAX_RPS} req/s)" if limiter else "로컬 임베딩"
+    print(f"   동시 요청: {workers}개 · 배치 {batch_size}개 · {pace} · 커밋 단위 {writer.flush_rows:,}행")
+
+    def progress(stats):
+        total_done = already_done + stats["embedded"]
+        pct = (stats["batches"] / total_batches) * 100
+        bar = ">" * int(pct // 2.5) + "-" * (40 - int(pct // 2.5))
+        rate = stats["embedded"] / max(time.time() - started, 1e-6)
+        print(f"\r   [{bar}] {pct:.1f}% ({total_done:,}/{len(chunks):,}) "
+              f"{rate:.1f} 청크/s{f' · {limiter.rate:.1f} req/s' if limiter else ''} · "
+              f"커밋 {writer.rows:,}",
+              end="", flush=True)
+
+    try:
+        stats = embed_batches(((ordinals, [chunks[i] for i in ordinals]) for ordinals in batches),
+                              embedder, writer, limiter=limiter, workers=workers, progress=progress)
+    finally:
+        # 중단·예외가 나도 큐에 쌓인 행은 커밋하고 저널을 닫음
+        writer.close()
+        journal.close()
+    embedded_count = stats["embedded"] - writer.failed_rows
+    error_count = stats["errors"]
+    if stats["aborted"]:
+        print(f"   현재까지 {already_done + embedded_count:,}개 임베딩 완료 (재시작 가능)")
+    elapsed = time.time() - started
+    print(f"\n   처리량: {embedded_count / max(elapsed, 1e-6):.1f} 청크/s"
+          + (f" · 최종 속도 {limiter.rate:.1f} req/s · 429/503 응답 {limiter.throttles}회" if limiter else ""))
+    writer.report()
 
     final_count = collection.count()
     print(f"\n\n{'─' * 40}")
@@ -482,28 +1582,587 @@ def step3_build_vectordb(api_key=None):
     print(f"   이번 세션 성공: {embedded_count:,}개")
     print(f"   이전 세션 포함: {final_count:,}개")
     print(f"   오류 배치: {error_count}개")
+    print_cache_stats()
     print(f"   DB 위치: {CHROMA_DIR}")
-    print(f"   컬렉션: {collection_name}")
+    print(f"   컬렉션: {COLLECTION_NAME}")
     
     # 메타데이터 저장
-    meta = {
+    write_db_metadata(final_count, len(chunks))
+    manifest["embed"] = {
+        "params": embed_params,
+        "fingerprint": fingerprint,
+        "complete": final_count >= len(chunks),
+    }
+    save_manifest(manifest)
+
+    if final_count < len(chunks):
+        print(f"\n   [INFO] {len(chunks) - final_count:,}개 청크가 남았습니다.")
+        print(f"   다시 실행하면 이어서 처리됩니다: python rag/pipeline.py --step embed")
+
+    return True
+
+
+def load_collection_matrix(collection, store, batch_size=500):
+    """컬렉션의 벡터를 청크 저장소 순서의 float32 행렬로 읽음 → (행렬, 유효 행 마스크)"""
+    import numpy as np
+
+    matrix = None
+    valid = np.zeros(len(store), dtype=bool)
+    for start in range(0, len(store), batch_size):
+        ids = [store.chunk_id(i) for i in range(start, min(start + batch_size, len(store)))]
+        stored = collection.get(ids=ids, include=["embeddings"])
+        vectors = dict(zip(stored["ids"], stored["embeddings"]))
+        for offset, chunk_id in enumerate(ids):
+            vector = vectors.get(chunk_id)
+            if vector is None:
+                continue
+            if matrix is None:
+                matrix = np.zeros((len(store), len(vector)), dtype=np.float32)
+            matrix[start + offset] = vector
+            valid[start + offset] = True
+    return matrix, valid
+
+
+def step4_compact_vectors(codec=COMPACT_CODEC, n_queries=RECALL_QUERIES, k=RECALL_K):
+    """Step 4 (선택): 컬렉션 벡터를 float16/int8로 압축 저장 + 메모리 절감·재현율 보고"""
+    print("\n" + "=" * 60)
+    print(f"🗜️  Step 4: 압축 벡터 생성 ({codec})")
+    print("=" * 60)
+
+    try:
+        import numpy as np
+    except ImportError:
+        print("[ERROR] numpy 설치 필요: pip install numpy")
+        return False
+
+    if not CHUNK_STORE_PATH.exists():
+        print("❌ 청크 저장소가 없습니다. Step 2를 먼저 실행하세요.")
+        return False
+    store = ChunkStore(CHUNK_STORE_PATH)
+    collection = open_collection()
+    if collection is None:
+        return False
+
+    matrix, valid = load_collection_matrix(collection, store)
+    if matrix is None:
+        print("❌ 컬렉션에 벡터가 없습니다. Step 3을 먼저 실행하세요.")
+        return False
+
+    compact = CompactVectors.from_matrix(matrix, valid, codec, meta={
         "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-        "total_chunks": final_count,
-        "target_chunks": len(chunks),
+        "collection": COLLECTION_NAME,
+        "chunks": store.digest,
         "embedding_model": EMBEDDING_MODEL,
+        "embedding_dim": EMBEDDING_DIM,
+    })
+    compact.save(VECTORS_DIR)
+
+    # 메모리 절감
+    full_bytes = matrix.nbytes
+    print(f"   벡터: {int(valid.sum()):,}개 × {matrix.shape[1]}차원 (청크 {len(store):,}개)")
+    print(f"   float32: {full_bytes / 1e6:,.1f}MB → {codec}: {compact.nbytes / 1e6:,.1f}MB "
+          f"({full_bytes / compact.nbytes:.1f}배 절감)")
+    if EMBEDDER == "gemini" and EMBEDDING_DIM:
+        default_bytes = len(store) * 3072 * 4
+        print(f"   기본 3072차원 float32 대비: {default_bytes / 1e6:,.1f}MB → {compact.nbytes / 1e6:,.1f}MB "
+              f"({default_bytes / compact.nbytes:.1f}배 절감)")
+
+    # 재현율: 표본 청크의 문서 벡터를 쿼리로, float32 전수 검색 결과를 정답으로 사용
+    rows = np.flatnonzero(valid)
+    sample = np.random.default_rng(0).choice(rows, size=min(n_queries, len(rows)), replace=False)
+    truth = [exact_search(matrix, matrix[q], k, valid) for q in sample]
+
+    timings = {}
+    results = {}
+    for label, rescore in (("압축", None), ("압축 + rescore", lambda r: matrix[r])):
+        started = time.perf_counter()
+        results[label] = [compact.search(matrix[q], k, rescore=rescore)[0] for q in sample]
+        timings[label] = (time.perf_counter() - started) * 1000 / max(len(sample), 1)
+
+    print(f"\n   재현율@{k} (표본 쿼리 {len(sample)}개, float32 전수 검색 = 1.0):")
+    for label, found in results.items():
+        recall = recall_at_k(truth, found)
+        print(f"     {label:<14} {recall:.4f} (Δ {recall - 1.0:+.4f}) · {timings[label]:.2f}ms/쿼리")
+
+    # 차원 축소: 전체 차원 컬렉션이 있으면 그 결과를 정답으로 비교
+    if EMBEDDER == "gemini" and EMBEDDING_DIM and COLLECTION_NAME != FULL_COLLECTION_NAME:
+        try:
+            import chromadb
+            full_collection = chromadb.PersistentClient(path=str(CHROMA_DIR)).get_collection(FULL_COLLECTION_NAME)
+            full_matrix, full_valid = load_collection_matrix(full_collection, store)
+        except Exception:
+            full_matrix = None
+        if full_matrix is None:
+            print(f"\n   (전체 차원 컬렉션 {FULL_COLLECTION_NAME}이 없어 차원 축소 재현율은 생략)")
+        else:
+            both = valid & full_valid
+            queries = [q for q in sample if both[q]]
+            full_truth = [exact_search(full_matrix, full_matrix[q], k, both) for q in queries]
+            reduced = [exact_search(matrix, matrix[q], k, both) for q in queries]
+            compacted = [compact.search(matrix[q], k, mask=both, rescore=lambda r: matrix[r])[0]
+                         for q in queries]
+            print(f"\n   재현율@{k} ({full_matrix.shape[1]}차원 float32 = 1.0, 쿼리 {len(queries)}개):")
+            for label, found in ((f"{EMBEDDING_DIM}차원 float32", reduced),
+                                 (f"{EMBEDDING_DIM}차원 {codec} + rescore", compacted)):
+                recall = recall_at_k(full_truth, found)
+                print(f"     {label:<24} {recall:.4f} (Δ {recall - 1.0:+.4f})")
+
+    print(f"\n   저장 위치: {VECTORS_DIR}")
+    return True
+
+
+def benchmark_search(n_queries=RECALL_QUERIES, k=RECALL_K):
+    """ChromaDB vs NumPy 전수 검색 백엔드 비교 (시작 시간 · 쿼리 지연 · 배치 · 필터 · 재현율)"""
+    print("\n" + "=" * 60)
+    print(f"⏱️  검색 백엔드 벤치마크 (쿼리 {n_queries}개, top-{k})")
+    print("=" * 60)
+
+    try:
+        import numpy as np
+        import chromadb
+    except ImportError as e:
+        print(f"[ERROR] 필요한 패키지 없음 ({e.name}): pip install numpy chromadb")
+        return False
+    if not CHUNK_STORE_PATH.exists():
+        print("❌ 청크 저장소가 없습니다. Step 2를 먼저 실행하세요.")
+        return False
+    store = ChunkStore(CHUNK_STORE_PATH)
+
+    started = time.perf_counter()
+    vectors = CompactVectors.load(VECTORS_DIR, mmap=False)
+    if vectors is None:
+        print("❌ rag/data/vectors가 없습니다. --step compact --codec float32 를 먼저 실행하세요.")
+        return False
+    numpy_startup = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    collection = chromadb.PersistentClient(path=str(CHROMA_DIR)).get_collection(COLLECTION_NAME)
+    chroma_startup = (time.perf_counter() - started) * 1000
+
+    # 쿼리: 표본 청크의 float32 원본 벡터, 정답: float32 전수 검색
+    matrix, valid = load_collection_matrix(collection, store)
+    rows = np.flatnonzero(valid)
+    sample = np.random.default_rng(0).choice(rows, size=min(n_queries, len(rows)), replace=False)
+    queries = matrix[sample]
+    truth = [[store.chunk_id(int(r)) for r in exact_search(matrix, q, k, valid)] for q in queries]
+
+    # 필터 쿼리: 청크가 가장 많은 챕터
+    chapter_ids = np.frombuffer(store.chapter_ids, dtype=np.int32)
+    where = {"chapter": store.chapters[int(np.bincount(chapter_ids).argmax())]}
+
+    backends = [
+        ("chroma", chroma_startup, ChromaBackend(collection)),
+        (f"numpy/{vectors.codec}", numpy_startup, NumpyBackend(vectors, store, rescore=lambda r: matrix[r])),
+    ]
+    print(f"   {'백엔드':<14} {'시작(ms)':>9} {'p50(ms)':>8} {'p95(ms)':>8} {'배치(ms/쿼리)':>13} "
+          f"{'필터 p50':>9} {f'재현율@{k}':>9}")
+    for label, startup, backend in backends:
+        backend.search(queries[0], k)   # 워밍업
+        latencies = []
+        found = []
+        for q in queries:
+            t = time.perf_counter()
+            found.append([d["id"] for d in backend.search(q, k)])
+            latencies.append((time.perf_counter() - t) * 1000)
+        t = time.perf_counter()
+        backend.search_batch(queries, k)
+        batch_ms = (time.perf_counter() - t) * 1000 / len(queries)
+        filtered = []
+        for q in queries[:50]:
+            t = time.perf_counter()
+            backend.search(q, k, where)
+            filtered.append((time.perf_counter() - t) * 1000)
+
+        latencies.sort()
+        filtered.sort()
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"   {label:<14} {startup:>9.1f} {p50:>8.2f} {p95:>8.2f} {batch_ms:>13.3f} "
+              f"{filtered[len(filtered) // 2]:>9.2f} {recall_at_k(truth, found):>9.4f}")
+
+    print(f"\n   필터: {where}")
+    print(f"   벡터 행렬: {len(vectors):,}×{vectors.dim} {vectors.codec} ({vectors.nbytes / 1e6:,.1f}MB)")
+    return True
+
+
+def step5_build_ann_index(kinds=ANN_TYPES, n_queries=RECALL_QUERIES, k=RECALL_K,
+                          target_recall=ANN_TARGET_RECALL, build_params=None):
+    """Step 5 (선택): 컬렉션 벡터로 HNSW · IVF-PQ 색인 구축 + 재현율@k·지연 표 → rag/ann_index/{종류}/"""
+    print("\n" + "=" * 60)
+    print(f"🧭 Step 5: ANN 색인 구축 ({', '.join(kinds)})")
+    print("=" * 60)
+
+    try:
+        import numpy as np
+        import faiss  # noqa: F401
+    except ImportError as e:
+        print(f"[ERROR] 필요한 패키지 없음 ({e.name}): pip install numpy faiss-cpu")
+        return False
+
+    if not CHUNK_STORE_PATH.exists():
+        print("❌ 청크 저장소가 없습니다. Step 2를 먼저 실행하세요.")
+        return False
+    store = ChunkStore(CHUNK_STORE_PATH)
+    collection = open_collection()
+    if collection is None:
+        return False
+
+    matrix, valid = load_collection_matrix(collection, store)
+    if matrix is None:
+        print("❌ 컬렉션에 벡터가 없습니다. Step 3을 먼저 실행하세요.")
+        return False
+    n_vectors = int(valid.sum())
+    print(f"   벡터: {n_vectors:,}개 × {matrix.shape[1]}차원 ({matrix.nbytes / 1e6:,.1f}MB float32)")
+
+    # 정답: float32 전수 검색 (쿼리 = 표본 청크의 문서 벡터)
+    rows = np.flatnonzero(valid)
+    sample = np.random.default_rng(0).choice(rows, size=min(n_queries, len(rows)), replace=False)
+    queries = matrix[sample]
+    exact = CompactVectors.from_matrix(matrix, valid, "float32")
+    started = time.perf_counter()
+    truth = [exact.search(q, k)[0] for q in queries]
+    exact_ms = (time.perf_counter() - started) * 1000 / max(len(queries), 1)
+
+    def percentile(values, p):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+    print(f"\n   재현율@{k} vs 지연 (쿼리 {len(queries)}개, 정답 = float32 전수 검색 {exact_ms:.2f}ms/쿼리)")
+    print(f"   {'색인':<7} {'파라미터':<12} {f'재현율@{k}':>9} {'+rescore':>9} {'p50(ms)':>8} "
+          f"{'p95(ms)':>8} {'배치(ms/쿼리)':>13} {'전수 대비':>9}")
+
+    build_params = build_params or {}
+    for kind in kinds:
+        started = time.perf_counter()
+        index = AnnIndex.build(kind, matrix, valid, meta={
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "collection": COLLECTION_NAME,
+            "chunks": store.digest,
+            "embedding_model": EMBEDDING_MODEL,
+            "embedding_dim": EMBEDDING_DIM,
+        }, **build_params.get(kind, {}))
+        build_s = time.perf_counter() - started
+        param_name = SEARCH_PARAM_NAMES[kind]
+
+        # 근사 거리 색인(IVF-PQ)은 서버 기본 동작처럼 float32 원본으로 다시 채점한 재현율도 잰다
+        rescore = None if index.exact_distances else (lambda r: matrix[r])
+        sweep = []
+        for value in index.sweep_values():
+            index.search(queries[0], k, search_param=value)   # 워밍업
+            latencies = []
+            found = []
+            for q in queries:
+                t = time.perf_counter()
+                found.append(index.search(q, k, search_param=value)[0])
+                latencies.append((time.perf_counter() - t) * 1000)
+            t = time.perf_counter()
+            index.search_batch(queries, k, search_param=value)
+            batch_ms = (time.perf_counter() - t) * 1000 / len(queries)
+            recall = recall_at_k(truth, found)
+            rescored = None
+            if rescore is not None:
+                rescored = recall_at_k(truth, [index.search(q, k, search_param=value, rescore=rescore)[0]
+                                               for q in queries])
+            p50 = percentile(latencies, 0.5)
+            sweep.append({"value": value, "recall": round(recall, 4),
+                          "rescore_recall": None if rescored is None else round(rescored, 4),
+                          "p50_ms": round(p50, 3), "p95_ms": round(percentile(latencies, 0.95), 3),
+                          "batch_ms": round(batch_ms, 3)})
+            rescored_text = "-" if rescored is None else f"{rescored:.4f}"
+            print(f"   {kind:<7} {f'{param_name}={value}':<12} {recall:>9.4f} {rescored_text:>9} "
+                  f"{p50:>8.3f} {sweep[-1]['p95_ms']:>8.3f} {batch_ms:>13.3f} "
+                  f"{exact_ms / max(p50, 1e-6):>8.1f}x")
+
+        # 목표 재현율을 넘는 가장 작은 검색 파라미터 (없으면 가장 큰 값)를 서버 기본값으로 저장
+        best = "recall" if rescore is None else "rescore_recall"
+        chosen = next((s for s in sweep if s[best] >= target_recall), sweep[-1])
+        index.set_search_param(chosen["value"])
+        index.meta["sweep"] = sweep
+        index.meta["recall_k"] = k
+        index.save(ANN_DIR / kind)
+        params = ", ".join(f"{key}={value}" for key, value in index.meta["params"].items())
+        print(f"   → {kind}: {params} · 구축 {build_s:.1f}s · {index.nbytes / 1e6:,.1f}MB · "
+              f"기본 {param_name}={chosen['value']} (재현율 {chosen[best]:.4f})\n")
+
+    print(f"   저장 위치: {ANN_DIR}")
+    print(f"   서버에서 사용: python rag/server.py --backend ann --ann-index {kinds[0]}")
+    return True
+
+
+def step6_build_shards(shard_by=SHARD_BY, force=False):
+    """Step 6 (선택): 컬렉션을 책·파트별 샤드 컬렉션으로 나눔 (벡터 복사, 재임베딩 없음) → shards.json"""
+    field = SHARD_FIELDS[shard_by]
+    print("\n" + "=" * 60)
+    print(f"🧩 Step 6: 샤드 컬렉션 구축 ({field}별)")
+    print("=" * 60)
+
+    if not CHUNK_STORE_PATH.exists():
+        print("❌ 청크 저장소가 없습니다. Step 2를 먼저 실행하세요.")
+        return False
+    store = ChunkStore(CHUNK_STORE_PATH)
+    collection = open_collection()
+    if collection is None:
+        return False
+    if collection.count() == 0:
+        print("❌ 컬렉션에 벡터가 없습니다. Step 3을 먼저 실행하세요.")
+        return False
+
+    manifest = load_manifest()
+    shard_params = {"chunks": store.digest, "collection": COLLECTION_NAME,
+                    "documents": collection.count(), "shard_by": field}
+    fingerprint = params_fingerprint(shard_params)
+    previous = {}
+    if SHARDS_PATH.exists():
+        with open(SHARDS_PATH, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    if not force and manifest.get("shard", {}).get("fingerprint") == fingerprint and previous:
+        print(f"   변경 없음 — 샤드 {len(previous['shards'])}개가 최신입니다. (건너뜀)")
+        return True
+
+    # 샤드 컬렉션 이름은 "{컬렉션}_{필드}{순번}" (Chroma 이름 규칙상 한글 값을 그대로 쓸 수 없음)
+    import chromadb
+    client = chromadb.PersistentClient(path=str(CHROMA_DIR))
+    values = store.source_files if field == "source_file" else store.parts
+    shards = {value: {"name": value, "collection": f"{COLLECTION_NAME}_{shard_by}{i:02d}", "documents": 0}
+              for i, value in enumerate(values)}
+    stale = {s["collection"] for s in previous.get("shards", [])} | {s["collection"] for s in shards.values()}
+    for name in stale:
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+    targets = {
+        value: client.create_collection(
+            name=shard["collection"],
+            metadata={"description": f"맨큐의 경제학 샤드 ({field}: {value or '-'})"})
+        for value, shard in shards.items()
+    }
+
+    started = time.time()
+    for start in range(0, len(store), SHARD_COPY_BATCH):
+        rows = range(start, min(start + SHARD_COPY_BATCH, len(store)))
+        ids = [store.chunk_id(i) for i in rows]
+        stored = collection.get(ids=ids, include=["embeddings"])
+        vectors = dict(zip(stored["ids"], stored["embeddings"]))
+        groups = {}
+        for i, chunk_id in zip(rows, ids):
+            vector = vectors.get(chunk_id)
+            if vector is None:
+                continue
+            metadata = store.metadata(i)
+            group = groups.setdefault(metadata[field], ([], [], [], []))
+            group[0].append(chunk_id)
+            group[1].append(vector)
+            group[2].append(store.text(i))
+            group[3].append(metadata)
+        for value, (group_ids, embeddings, documents, metadatas) in groups.items():
+            targets[value].upsert(ids=group_ids, embeddings=embeddings,
+                                  documents=documents, metadatas=metadatas)
+            shards[value]["documents"] += len(group_ids)
+        print(f"\r   복사: {min(start + SHARD_COPY_BATCH, len(store)):,}/{len(store):,}", end="", flush=True)
+    print()
+
+    shard_list = [s for s in shards.values() if s["documents"]]
+    for shard in shards.values():
+        if not shard["documents"]:
+            client.delete_collection(shard["collection"])
+    with open(SHARDS_PATH, "w", encoding="utf-8") as f:
+        json.dump({
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "collection": COLLECTION_NAME,
+            "chunks": store.digest,
+            "shard_by": field,
+            "shards": shard_list,
+        }, f, ensure_ascii=False, indent=2)
+    manifest["shard"] = {"params": shard_params, "fingerprint": fingerprint}
+    save_manifest(manifest)
+
+    print(f"\n   {'샤드':<40} {'컬렉션':<40} {'문서':>7}")
+    for shard in shard_list:
+        print(f"   {(shard['name'] or '-')[:40]:<40} {shard['collection']:<40} {shard['documents']:>7,}")
+    print(f"\n   샤드 {len(shard_list)}개 · {sum(s['documents'] for s in shard_list):,}개 문서 · "
+          f"{time.time() - started:.1f}초")
+    print(f"   서버에서 사용: python rag/server.py --backend shards")
+    return True
+
+
+def iter_batches(items, size):
+    """스트림을 size개씩 묶어 yield"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_stream_pipeline(api_key=None, max_rss_mb=EXTRACT_MAX_RSS_MB, cross_page=CHUNK_CROSS_PAGE,
+                        workers=EMBEDDING_WORKERS):
+    """추출 → 정제 → 청킹 → 임베딩/저장을 제한된 큐로 연결해 한 번에 실행
+
+    중간 결과(extracted_pages.jsonl, chunks.bin)를 만들지 않으며, 메모리에는
+    큐에 대기 중인 최대 STREAM_QUEUE_BATCHES개 배치만 유지된다. 임베딩·저장은
+    Step 3과 같은 경로(embed_batches → ChromaWriter)를 쓰고, 커밋된 청크의 스트림
+    순번을 stream_journal.log에 기록해 입력이 같으면 중단된 지점부터 이어서 실행한다.
+    """
+    print("\n" + "=" * 60)
+    print("🌊 Stream: PDF 추출 → 청킹 → 임베딩 + ChromaDB 저장")
+    print("=" * 60)
+
+    embedder = get_embedder(api_key)
+    if embedder is None:
+        return False
+
+    pdf_files = sorted(RAW_DB_DIR.glob("*.pdf"))
+    if not pdf_files:
+        print("❌ PDF 파일을 찾을 수 없습니다:", RAW_DB_DIR)
+        return False
+
+    try:
+        import pdfplumber
+    except ImportError:
+        print("❌ pdfplumber 설치 필요: pip install pdfplumber")
+        return False
+
+    if not check_embedding_api(embedder):
+        return False
+
+    collection = open_collection()
+    if collection is None:
+        return False
+
+    # 스트림 지문: PDF 내용 + 청킹·임베딩 설정 (같으면 청크 순번이 같으므로 저널을 이어서 씀)
+    manifest = load_manifest()
+    prev = manifest.get("stream", {})
+    files = {p.name: pdf_fingerprint(p, prev.get("files", {}).get(p.name)) for p in pdf_files}
+    params = {
+        "pdfs": [[name, f["sha256"]] for name, f in files.items()],
+        "pdfplumber": getattr(pdfplumber, "__version__", "unknown"),
         "chunk_size": CHUNK_SIZE,
         "chunk_overlap": CHUNK_OVERLAP,
-        "source_files": [f.name for f in sorted(RAW_DB_DIR.glob("*.pdf"))],
-        "complete": final_count >= len(chunks)
+        "min_chunk_size": MIN_CHUNK_SIZE,
+        "cross_page": cross_page,
+        "chunker_version": CHUNKER_VERSION,
+        "embedder": EMBEDDER,
+        "embedding_model": EMBEDDING_MODEL,
+        "embedding_dim": EMBEDDING_DIM,
+        "collection": COLLECTION_NAME,
     }
-    meta_path = CHROMA_DIR / "metadata.json"
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
+    fingerprint = params_fingerprint(params)
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    journal = EmbedJournal(STREAM_JOURNAL_PATH, fingerprint, None)
+    done = journal.load()
+    if done is None:
+        done = bytearray()
+        journal.reset(done)
+    elif done.count(1):
+        print(f"   체크포인트 저널: 커밋 {done.count(1):,}개 · 워터마크 {journal.watermark(done):,} (건너뜁니다)")
+
+    limiter = AdaptiveRateLimiter() if embedder.remote else None   # 로컬 임베딩은 속도 제한 없음
+    pace = f"시작 속도 {limiter.rate:.1f} req/s" if limiter else "로컬 임베딩"
+    print(f"   PDF {len(pdf_files)}개 · 배치 {EMBEDDING_BATCH_SIZE}개 · 큐 {STREAM_QUEUE_BATCHES}배치 · "
+          f"동시 요청 {workers}개 · {pace}")
+
+    batches = queue.Queue(maxsize=STREAM_QUEUE_BATCHES)
+    stop = threading.Event()
+    producer_errors = []
+
+    def put(item):
+        # 소비자가 중단되면 더 이상 기다리지 않음
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
 
-    if final_count < len(chunks):
-        print(f"\n   [INFO] {len(chunks) - final_count:,}개 청크가 남았습니다.")
-        print(f"   다시 실행하면 이어서 처리됩니다: python rag/pipeline.py --step embed")
+    def produce():
+        try:
+            pages = iter_pdf_pages(pdf_files, max_rss_mb)
+            chunks = iter_chunks(pages, cross_page=cross_page)
+            for batch in iter_batches(chunks, EMBEDDING_BATCH_SIZE):
+                if not put(batch):
+                    return
+        except Exception as e:
+            producer_errors.append(e)
+        finally:
+            put(None)
+
+    counts = {"produced": 0, "skipped": 0}
+
+    def pending_batches():
+        """큐의 청크 배치 → (스트림 순번 목록, 아직 저장되지 않은 청크 목록)"""
+        while True:
+            batch = batches.get()
+            if batch is None:
+                return
+            counts["produced"] += len(batch)
+            # 저널에 커밋된 순번은 건너뛰고, 나머지는 같은 ID가 이미 DB에 있는지 확인 (Step 3 등으로 저장된 청크)
+            rows = [(c["metadata"]["chunk_index"] - 1, c) for c in batch]
+            rows = [(n, c) for n, c in rows if n >= len(done) or not done[n]]
+            try:
+                existing = set(collection.get(ids=[c["id"] for _, c in rows], include=[])["ids"]) if rows else set()
+            except Exception:
+                existing = set()
+            journal.append([n for n, c in rows if c["id"] in existing])
+            rows = [(n, c) for n, c in rows if c["id"] not in existing]
+            counts["skipped"] += len(batch) - len(rows)
+            if rows:
+                yield [n for n, _ in rows], [c for _, c in rows]
+
+    def progress(stats):
+        print(f"\r   청크 {counts['produced']:,}개 처리 (임베딩 {stats['embedded']:,} · 커밋 {writer.rows:,} · "
+              f"대기 배치 {batches.qsize()})", end="", flush=True)
+
+    producer = threading.Thread(target=produce, name="stream-producer", daemon=True)
+    writer = ChromaWriter(collection, journal=journal)
+    started = time.time()
+    producer.start()
+    writer.start()
+    try:
+        stats = embed_batches(pending_batches(), embedder, writer, limiter=limiter, workers=workers,
+                              progress=progress)
+    finally:
+        stop.set()
+        producer.join()
+        writer.close()
+        journal.close()
+
+    stored = stats["embedded"] - writer.failed_rows
+    elapsed = time.time() - started
+    print(f"\n   처리량: {stored / max(elapsed, 1e-6):.1f} 청크/s"
+          + (f" · 최종 속도 {limiter.rate:.1f} req/s · 429/503 응답 {limiter.throttles}회" if limiter else ""))
+    writer.report()
 
+    final_count = collection.count()
+    print(f"\n\n{'─' * 40}")
+    print(f"   스트리밍 결과:")
+    print(f"   생성된 청크: {counts['produced']:,}개")
+    print(f"   이번 세션 저장: {stored:,}개 (건너뜀 {counts['skipped']:,}개)")
+    print(f"   DB 크기: {final_count:,}개 문서")
+    print_cache_stats()
+
+    # chunks.bin을 거치지 않은 행이 컬렉션에 들어갔으면 embed 단계 지문·저널은 더 이상 믿을 수 없음
+    # (다음 Step 3이 저장된 ID 전체를 다시 비교해 재청킹 반영)
+    if stored > 0:
+        manifest.pop("embed", None)
+        EMBED_JOURNAL_PATH.unlink(missing_ok=True)
+    complete = not (producer_errors or stats["aborted"] or writer.failed_rows)
+    manifest["stream"] = {"params": params, "fingerprint": fingerprint, "files": files,
+                          "chunks": counts["produced"], "complete": complete}
+    save_manifest(manifest)
+
+    if producer_errors:
+        print(f"   [ERROR] 추출/청킹 오류: {producer_errors[0]}")
+        return False
+    if not complete:
+        print(f"   다시 실행하면 이어서 처리됩니다: python rag/pipeline.py --step stream")
+        return False
+
+    write_db_metadata(final_count, counts["produced"])
     return True
 
 
@@ -512,39 +2171,22 @@ def test_query(query="수요와 공급의 균형", api_key=None):
     print(f"\n🔍 테스트 쿼리: \"{query}\"")
     print("─" * 40)
 
-    if not api_key:
-        api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
-
-    if not api_key:
-        env_path = BASE_DIR / ".env"
-        if env_path.exists():
-            with open(env_path, "r") as f:
-                for line in f:
-                    if line.strip().startswith("GEMINI_API_KEY=") or line.strip().startswith("GOOGLE_API_KEY="):
-                        api_key = line.strip().split("=", 1)[1].strip().strip('"').strip("'")
-                        break
-
-    if not api_key:
-        print("❌ API 키가 없습니다.")
+    embedder = get_embedder(api_key)
+    if embedder is None:
+        print("❌ 임베딩 백엔드를 사용할 수 없습니다.")
         return
 
-    import google.generativeai as genai
     import chromadb
 
-    genai.configure(api_key=api_key)
     client = chromadb.PersistentClient(path=str(CHROMA_DIR))
-    collection = client.get_collection("mankiw_economics")
+    collection = client.get_collection(COLLECTION_NAME)
 
     # 쿼리 임베딩 생성
-    query_result = genai.embed_content(
-        model=EMBEDDING_MODEL,
-        content=query,
-        task_type="retrieval_query"
-    )
+    query_embedding = embedder.embed_query(query)
 
     # 유사 문서 검색
     results = collection.query(
-        query_embeddings=[query_result['embedding']],
+        query_embeddings=[query_embedding],
         n_results=5
     )
 
@@ -562,13 +2204,64 @@ def test_query(query="수요와 공급의 균형", api_key=None):
 
 def main():
     parser = argparse.ArgumentParser(description="맨큐의 경제학 RAG 파이프라인")
-    parser.add_argument("--step", choices=["extract", "chunk", "embed", "test", "all"],
+    parser.add_argument("--step", choices=["extract", "chunk", "embed", "stream", "compact", "index",
+                                           "shard", "test", "bench-chunk", "bench-search", "all"],
                        default="all", help="실행할 단계")
     parser.add_argument("--api-key", type=str, help="Gemini API 키")
+    parser.add_argument("--workers", type=int, default=1,
+                       help="PDF 추출 병렬 프로세스 수 (기본: 1 = 직렬)")
+    parser.add_argument("--max-rss-mb", type=int, default=EXTRACT_MAX_RSS_MB,
+                       help="PDF 추출 프로세스별 RSS 상한 MB (0 = 제한 없음)")
+    parser.add_argument("--cross-page", action="store_true", default=CHUNK_CROSS_PAGE,
+                       help="같은 챕터 안에서 페이지 경계를 넘어 청킹")
+    parser.add_argument("--bench-pages", type=int, default=100000,
+                       help="청킹 벤치마크 페이지 수 (--step bench-chunk 사용 시)")
+    parser.add_argument("--embed-workers", type=int, default=EMBEDDING_WORKERS,
+                       help="동시에 진행할 임베딩 배치 요청 수 (속도는 AIMD 제한기가 조절)")
+    parser.add_argument("--embedder", choices=EMBEDDERS, default="gemini",
+                       help="임베딩 백엔드 (gemini: API, hashing · onnx: 네트워크 없이 로컬 CPU)")
+    parser.add_argument("--embed-model", type=str, default=None,
+                       help=f"onnx 임베딩 모델 이름 (기본: {ONNX_MODEL})")
+    parser.add_argument("--embed-dim", type=int, default=None,
+                       help="임베딩 차원 — gemini: outputDimensionality (예: 768, 기본 3072), "
+                            f"hashing: 버킷 수 (기본 {HASHING_DIM})")
+    parser.add_argument("--codec", choices=CODECS, default=COMPACT_CODEC,
+                       help="벡터 저장 형식 (--step compact 사용 시, float32 = numpy 백엔드 전수 검색용)")
+    parser.add_argument("--recall-queries", type=int, default=RECALL_QUERIES,
+                       help="재현율·벤치마크 표본 쿼리 수 (--step compact / index / bench-search 사용 시)")
+    parser.add_argument("--index-type", choices=list(ANN_TYPES) + ["all"], default="all",
+                       help="만들 ANN 색인 종류 (--step index 사용 시, 기본: 둘 다)")
+    parser.add_argument("--hnsw-m", type=int, default=None,
+                       help="HNSW 노드당 이웃 수 (기본: ann_index.HNSW_M)")
+    parser.add_argument("--ivf-nlist", type=int, default=None,
+                       help="IVF-PQ 클러스터 수 (기본: 4·√n)")
+    parser.add_argument("--pq-m", type=int, default=None,
+                       help="IVF-PQ 부분 벡터 수 = 벡터당 바이트, 차원의 약수 (기본: 차원/8 이하 최대 약수)")
+    parser.add_argument("--target-recall", type=float, default=ANN_TARGET_RECALL,
+                       help="서버 기본 efSearch/nprobe를 고를 목표 재현율@k")
+    parser.add_argument("--shard-by", choices=list(SHARD_FIELDS), default=SHARD_BY,
+                       help="샤드를 나눌 기준 (--step shard 사용 시, source: 책(PDF)별, part: 파트별)")
+    parser.add_argument("--no-embed-cache", action="store_true",
+                       help="디스크 임베딩 캐시(rag/cache/embeddings.sqlite)를 사용하지 않음")
+    parser.add_argument("--force", action="store_true",
+                       help="매니페스트 지문을 무시하고 모든 단계를 다시 실행")
     parser.add_argument("--query", type=str, default="수요와 공급의 균형",
                        help="테스트 쿼리 (--step test 사용 시)")
     args = parser.parse_args()
 
+    global EMBEDDING_CACHE_ENABLED, EMBEDDER, EMBEDDING_MODEL, EMBEDDING_DIM, COLLECTION_NAME
+    if args.no_embed_cache:
+        EMBEDDING_CACHE_ENABLED = False
+    EMBEDDER = args.embedder
+    if EMBEDDER == "hashing":
+        EMBEDDING_MODEL = HASHING_MODEL
+        EMBEDDING_DIM = args.embed_dim or HASHING_DIM
+    elif EMBEDDER == "onnx":
+        EMBEDDING_MODEL = args.embed_model or ONNX_MODEL
+    elif args.embed_dim:
+        EMBEDDING_DIM = args.embed_dim
+    COLLECTION_NAME = collection_name(FULL_COLLECTION_NAME, EMBEDDER, EMBEDDING_DIM, EMBEDDING_MODEL)
+
     print("╔════════════════════════════════════════╗")
     print("║  맨큐의 경제학 RAG 파이프라인           ║")
     print("║  PDF → 청킹 → 임베딩 → ChromaDB       ║")
@@ -582,19 +2275,49 @@ def main():
     success = True
 
     if args.step in ("extract", "all"):
-        success = step1_extract_pdfs()
+        success = step1_extract_pdfs(workers=args.workers, max_rss_mb=args.max_rss_mb,
+                                     force=args.force)
         if not success and args.step == "all":
             print("❌ PDF 추출 실패. 파이프라인을 중단합니다.")
             return
 
     if args.step in ("chunk", "all"):
-        success = step2_chunk_text()
+        success = step2_chunk_text(cross_page=args.cross_page, force=args.force)
         if not success and args.step == "all":
             print("❌ 청킹 실패. 파이프라인을 중단합니다.")
             return
 
     if args.step in ("embed", "all"):
-        success = step3_build_vectordb(api_key=args.api_key)
+        success = step3_build_vectordb(api_key=args.api_key, force=args.force,
+                                       workers=args.embed_workers)
+
+    if args.step == "stream":
+        success = run_stream_pipeline(api_key=args.api_key, max_rss_mb=args.max_rss_mb,
+                                      cross_page=args.cross_page, workers=args.embed_workers)
+
+    if args.step == "compact":
+        success = step4_compact_vectors(codec=args.codec, n_queries=args.recall_queries)
+
+    if args.step == "index":
+        build_params = {"hnsw": {}, "ivfpq": {}}
+        if args.hnsw_m:
+            build_params["hnsw"]["m"] = args.hnsw_m
+        if args.ivf_nlist:
+            build_params["ivfpq"]["nlist"] = args.ivf_nlist
+        if args.pq_m:
+            build_params["ivfpq"]["pq_m"] = args.pq_m
+        kinds = ANN_TYPES if args.index_type == "all" else (args.index_type,)
+        success = step5_build_ann_index(kinds=kinds, n_queries=args.recall_queries,
+                                        target_recall=args.target_recall, build_params=build_params)
+
+    if args.step == "shard":
+        success = step6_build_shards(shard_by=args.shard_by, force=args.force)
+
+    if args.step == "bench-search":
+        success = benchmark_search(n_queries=args.recall_queries)
+
+    if args.step == "bench-chunk":
+        success = benchmark_chunking(args.bench_pages, cross_page=args.cross_page)
 
     if args.step == "test":
         test_query(query=args.query, api_key=args.api_key)
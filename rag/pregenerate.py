@@ -0,0 +1,353 @@
+"""
+맨큐의 경제학 - 챕터별 수업자료 사전 생성
+==========================================
+js/data.js의 고정 챕터 목록을 돌며 챕터 × 형식(강의 노트 · 슬라이드 · 토론 · 수업 개요, 기본 퀴즈)을
+미리 생성해 버전별 정적 저장소(rag/pregenerated/<버전>/)에 쓴다.
+
+server.py는 주제 없이 챕터만 지정한 강의자료 · 기본 퀴즈 요청을 이 저장소에서 바로 돌려주고,
+사용자 주제가 있거나 "fresh": true일 때만 실시간으로 생성한다.
+
+  - 생성은 async_server.py와 같은 REST generateContent + keep-alive 연결 풀로 보내고,
+    동시에 진행하는 항목 수를 --concurrency로 제한한다 (쿼터 보호).
+  - 새 버전 디렉토리를 다 쓴 뒤 current.json을 원자적으로 바꿔, 서버는 항상 완성된 버전만 읽는다.
+  - 직전 버전과 생성 모델 · 청크 저장소가 같으면 이미 만든 항목은 그대로 가져오고
+    빠지거나 실패한 항목만 생성한다 (--force면 전부 새로 생성).
+
+저장소 구조:
+  rag/pregenerated/current.json           {"version"}
+  rag/pregenerated/<버전>/manifest.json    {"version", "created", "created_at", "model", "chunks",
+                                           "items": {키: 항목}, "failed"}
+  rag/pregenerated/<버전>/<종류>-<형식>/ch04.json   {"kind", "format", "chapter", "title", "response", "sources"}
+
+pip install aiohttp
+
+사용법:
+  python rag/pregenerate.py                            # 모든 챕터 × 모든 형식 (동시 4개)
+  python rag/pregenerate.py --chapters 1-5,9 --formats notes,slides --concurrency 8
+  python rag/pregenerate.py --kinds quiz               # 기본 퀴즈만
+  python rag/pregenerate.py --dry-run                  # 생성할 항목만 출력
+  python rag/pregenerate.py --force --keep 2           # 전부 다시 생성, 최근 2개 버전만 보관
+"""
+
+import re
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+from pathlib import Path
+
+# ── 경로 설정 ──
+BASE_DIR = Path(__file__).resolve().parent.parent
+CATALOGUE_PATH = BASE_DIR / "js" / "data.js"
+PREGENERATED_DIR = BASE_DIR / "rag" / "pregenerated"
+
+# ── 생성 설정 ──
+LECTURE_FORMATS = ("notes", "slides", "discussion", "overview")
+PREGEN_KINDS = ("lecture", "quiz")
+QUIZ_COUNT = 5                                  # 사전 생성 퀴즈 = js/rag_client.js의 기본 요청
+QUIZ_TYPES = ("multiple", "tf", "short")
+PREGEN_CONCURRENCY = 4
+PREGEN_KEEP_VERSIONS = 3
+
+CHAPTER_ENTRY = re.compile(r'\{\s*id:\s*(\d+),\s*title:\s*"([^"]*)",\s*pages:')
+
+
+def load_catalogue(path=CATALOGUE_PATH):
+    """js/data.js의 챕터 목록 → [(번호, 제목), ...] (파트 항목에는 pages가 없어 챕터만 걸림)"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [(int(number), title) for number, title in CHAPTER_ENTRY.findall(f.read())]
+
+
+def item_key(kind, format_type, chapter):
+    """저장소 항목 키: "lecture/notes/4", "quiz/default/4" """
+    return f"{kind}/{format_type}/{chapter}"
+
+
+class PregeneratedStore:
+    """사전 생성된 현재 버전 (항목 파일은 처음 요청될 때 읽어 메모리에 보관)"""
+
+    def __init__(self, root, manifest):
+        self.root = Path(root)
+        self.version = manifest["version"]
+        self.model = manifest.get("model")
+        self.chunks = manifest.get("chunks")
+        self.items = manifest["items"]
+        self._loaded = {}
+
+    @classmethod
+    def load(cls, root=PREGENERATED_DIR):
+        """current.json이 가리키는 버전 로드 (없으면 None)"""
+        root = Path(root)
+        pointer = root / "current.json"
+        if not pointer.exists():
+            return None
+        with open(pointer, "r", encoding="utf-8") as f:
+            version = json.load(f)["version"]
+        with open(root / version / "manifest.json", "r", encoding="utf-8") as f:
+            return cls(root / version, json.load(f))
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, kind, format_type, chapter):
+        """항목 → {"response", "sources", "pregenerated": 버전} (없으면 None)"""
+        entry = self.items.get(item_key(kind, format_type, chapter))
+        if entry is None:
+            return None
+        data = self._loaded.get(entry["file"])
+        if data is None:
+            with open(self.root / entry["file"], "r", encoding="utf-8") as f:
+                data = self._loaded[entry["file"]] = json.load(f)
+        return {"response": data["response"], "sources": data["sources"], "pregenerated": self.version}
+
+    def stats(self):
+        kinds = {}
+        for key in self.items:
+            kind = key.split("/", 1)[0]
+            kinds[kind] = kinds.get(kind, 0) + 1
+        return {"version": self.version, "model": self.model, "items": len(self.items), "kinds": kinds}
+
+
+# ── 사전 생성 작업 ──
+
+def parse_chapters(spec, catalogue):
+    """"1-5,9" → 챕터 번호 집합 (없으면 전체)"""
+    numbers = {number for number, _ in catalogue}
+    if not spec:
+        return numbers
+    selected = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if "-" in part:
+            start, end = part.split("-", 1)
+            selected.update(range(int(start), int(end) + 1))
+        elif part:
+            selected.add(int(part))
+    return selected & numbers
+
+
+def plan_items(catalogue, chapters, kinds, formats):
+    """(키, 종류, 형식, 챕터 번호, 제목, 요청 본문) 목록"""
+    items = []
+    for number, title in catalogue:
+        if number not in chapters:
+            continue
+        if "lecture" in kinds:
+            for format_type in formats:
+                items.append((item_key("lecture", format_type, number), "lecture", format_type, number, title,
+                              {"chapter": str(number), "format": format_type, "fresh": True}))
+        if "quiz" in kinds:
+            items.append((item_key("quiz", "default", number), "quiz", "default", number, title,
+                          {"chapter": str(number), "count": QUIZ_COUNT, "types": list(QUIZ_TYPES), "fresh": True}))
+    return items
+
+
+def previous_version(root, model, chunks):
+    """직전 버전의 (디렉토리, manifest) — 생성 모델 · 청크 저장소가 다르면 (None, None)"""
+    try:
+        store = PregeneratedStore.load(root)
+    except (OSError, ValueError, KeyError):
+        return None, None
+    if store is None or store.model != model or store.chunks != chunks:
+        return None, None
+    return store.root, store.items
+
+
+def write_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    tmp_path.replace(path)
+
+
+def new_version_name(root):
+    """생성 시각으로 버전 이름 (같은 초에 다시 실행하면 -2, -3 …을 붙임)"""
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    version, n = stamp, 1
+    while (root / version).exists():
+        n += 1
+        version = f"{stamp}-{n}"
+    return version
+
+
+def version_created(path):
+    """버전 생성 시각 (manifest의 created, 없으면 — 쓰다 만 버전 · 수동 복사본 — 디렉토리 수정 시각)"""
+    try:
+        with open(path / "manifest.json", "r", encoding="utf-8") as f:
+            return float(json.load(f)["created"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return path.stat().st_mtime
+
+
+def prune_versions(root, keep):
+    """생성 시각 기준 최근 keep개 버전만 남기고 삭제 (current.json이 가리키는 버전은 항상 보관)"""
+    if keep <= 0:
+        return
+    try:
+        with open(root / "current.json", "r", encoding="utf-8") as f:
+            current = json.load(f)["version"]
+    except (OSError, ValueError, KeyError):
+        current = None
+    versions = sorted((p for p in root.iterdir() if p.is_dir()), key=lambda p: (version_created(p), p.name))
+    for path in versions[:-keep]:
+        if path.name != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+async def generate_items(server, items, concurrency, on_done):
+    """항목마다 검색(스레드) → REST 생성(코루틴), 동시에 concurrency개까지"""
+    from async_server import UpstreamClient, generate
+
+    handlers = {"lecture": server.handle_lecture, "quiz": server.handle_quiz}
+    client = UpstreamClient(pool_size=max(concurrency, 1))
+    previous_transport = server.set_embedder_transport(client.post_json_threadsafe)
+    slots = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def run(item):
+        kind, body = item[1], item[5]
+        async with slots:
+            try:
+                result = await loop.run_in_executor(None, handlers[kind], body)
+                if isinstance(result, server.GenerationTask):
+                    result = await generate(client, result, server.api_key, server.GENERATION_MAX_TOKENS)
+            except Exception as e:
+                result = {"error": f"생성 오류: {str(e)}"}
+        on_done(item, result)
+
+    try:
+        await asyncio.gather(*(run(item) for item in items))
+    finally:
+        server.set_embedder_transport(previous_transport)
+        await client.close()
+    return client.stats()
+
+
+def build_version(root, items, model, chunks, generate, force=False, keep=PREGEN_KEEP_VERSIONS):
+    """새 버전 디렉토리 작성 → current.json 교체 → 오래된 버전 정리
+
+    직전 버전에서 가져올 수 있는 항목은 복사하고, 나머지만 generate(pending, on_done)로 생성한다
+    (generate는 항목마다 on_done(item, result)를 부르고 업스트림 통계를 돌려줌).
+    → (버전 디렉토리, manifest, 업스트림 통계 또는 None)
+    """
+    root = Path(root)
+    version = new_version_name(root)
+    version_dir = root / version
+    version_dir.mkdir(parents=True)
+    prev_dir, prev_items = (None, None) if force else previous_version(root, model, chunks)
+
+    manifest_items = {}
+    pending = []
+    for item in items:
+        key = item[0]
+        entry = (prev_items or {}).get(key)
+        if entry is not None and (prev_dir / entry["file"]).exists():
+            target = version_dir / entry["file"]
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(prev_dir / entry["file"], target)
+            manifest_items[key] = entry
+        else:
+            pending.append(item)
+    if manifest_items:
+        print(f"   직전 버전에서 가져옴: {len(manifest_items)}개 → 새로 생성: {len(pending)}개")
+
+    failed = []
+    started = time.time()
+
+    def on_done(item, result):
+        key, kind, format_type, number, title, _ = item
+        if "error" in result:
+            failed.append({"key": key, "error": result["error"]})
+            print(f"   ❌ {key}: {result['error'][:120]}")
+            return
+        relative = f"{kind}-{format_type}/ch{number:02d}.json"
+        write_json(version_dir / relative, {
+            "kind": kind, "format": format_type, "chapter": number, "title": title,
+            "response": result["response"], "sources": result["sources"],
+        })
+        manifest_items[key] = {"file": relative, "chapter": number, "title": title}
+        done = len(manifest_items) + len(failed)
+        print(f"   ✅ [{done}/{len(items)}] {key} ({title}) {time.time() - started:.1f}초")
+
+    upstream = generate(pending, on_done) if pending else None
+
+    manifest = {
+        "version": version,
+        "created": time.time(),
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "model": model,
+        "chunks": chunks,
+        "items": dict(sorted(manifest_items.items())),
+        "failed": failed,
+    }
+    write_json(version_dir / "manifest.json", manifest)
+    write_json(root / "current.json", {"version": version})
+    prune_versions(root, keep)
+    return version_dir, manifest, upstream
+
+
+def main():
+    parser = argparse.ArgumentParser(description="맨큐의 경제학 챕터별 수업자료 사전 생성")
+    parser.add_argument("--chapters", type=str, default=None, help="챕터 번호 (예: 1-5,9, 기본: 전체)")
+    parser.add_argument("--kinds", type=str, default=",".join(PREGEN_KINDS),
+                        help=f"생성할 종류 (기본: {','.join(PREGEN_KINDS)})")
+    parser.add_argument("--formats", type=str, default=",".join(LECTURE_FORMATS),
+                        help=f"강의자료 형식 (기본: {','.join(LECTURE_FORMATS)})")
+    parser.add_argument("--concurrency", type=int, default=PREGEN_CONCURRENCY,
+                        help=f"동시에 생성하는 항목 수 (기본: {PREGEN_CONCURRENCY})")
+    parser.add_argument("--keep", type=int, default=PREGEN_KEEP_VERSIONS,
+                        help=f"보관할 버전 수 (기본: {PREGEN_KEEP_VERSIONS})")
+    parser.add_argument("--force", action="store_true", help="직전 버전의 항목을 가져오지 않고 전부 새로 생성")
+    parser.add_argument("--dry-run", action="store_true", help="생성할 항목만 출력")
+    parser.add_argument("--api-key", type=str, help="Gemini API 키")
+    parser.add_argument("--output", type=str, default=str(PREGENERATED_DIR), help="저장소 디렉토리")
+    args = parser.parse_args()
+
+    kinds = [k.strip() for k in args.kinds.split(",") if k.strip()]
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    unknown = [k for k in kinds if k not in PREGEN_KINDS] + [f for f in formats if f not in LECTURE_FORMATS]
+    if unknown:
+        print(f"❌ 지원하지 않는 종류/형식: {', '.join(unknown)}")
+        sys.exit(1)
+
+    catalogue = load_catalogue()
+    items = plan_items(catalogue, parse_chapters(args.chapters, catalogue), kinds, formats)
+    print("=" * 60)
+    print("📚 챕터별 수업자료 사전 생성")
+    print("=" * 60)
+    print(f"   챕터 목록: {len(catalogue)}개 ({CATALOGUE_PATH.name})")
+    print(f"   생성 항목: {len(items)}개 (종류: {', '.join(kinds)} / 형식: {', '.join(formats)})")
+    if args.dry_run:
+        for key, _, _, _, title, _ in items:
+            print(f"   - {key} ({title})")
+        return
+
+    import server   # 검색 · 프롬프트는 서버 핸들러를 그대로 사용 (같은 컨텍스트 · 같은 응답 형식)
+    server.init_services(key=args.api_key)
+    if not server.api_key:
+        print("❌ Gemini API 키가 없습니다. --api-key 또는 GEMINI_API_KEY를 설정하세요.")
+        sys.exit(1)
+
+    started = time.time()
+    concurrency = max(args.concurrency, 1)
+    version_dir, manifest, upstream = build_version(
+        Path(args.output), items, server.GENERATION_MODEL,
+        server.chunk_store.digest if server.chunk_store else None,
+        lambda pending, on_done: asyncio.run(generate_items(server, pending, concurrency, on_done)),
+        force=args.force, keep=args.keep)
+
+    version, failed = manifest["version"], manifest["failed"]
+    print(f"\n✅ 버전 {version}: {len(manifest['items'])}/{len(items)}개 항목 ({time.time() - started:.1f}초)")
+    if upstream:
+        print(f"   업스트림: 요청 {upstream['requests']} · 새 연결 {upstream['connections_created']} · "
+              f"최대 동시 {upstream['peak_in_flight']}")
+    if failed:
+        print(f"   ⚠️ 실패 {len(failed)}개 — 다시 실행하면 실패한 항목만 생성합니다")
+    print(f"   저장 위치: {version_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+맨큐의 경제학 - 쿼리 캐시
+==========================
+server.py가 쓰는 프로세스 내 LRU + TTL 캐시 (쿼리 임베딩 · 검색 결과).
+
+학생들이 매주 같은 질문("수요와 공급의 균형", "기회비용")을 반복하므로, 공백 · 문장부호 ·
+대소문자만 다른 쿼리를 같은 키로 접어(normalize_query) 임베딩 요청과 벡터 검색을 건너뛴다.
+디스크 임베딩 캐시(embed_cache.py)보다 앞단에서 SQLite 조회 없이 바로 돌려준다.
+
+사용 예:
+  cache = LRUCache(max_entries=1024, ttl=3600)
+  key = (normalize_query("수요와 공급의 균형?"), 5)
+  value = cache.get(key)          # 없거나 만료되면 None
+  cache.put(key, value)
+  cache.stats()   # {"entries", "hits", "misses", "hit_rate", "expired", "evictions", ...}
+"""
+
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+
+QUERY_CACHE_SIZE = 1024     # 캐시별 최대 항목 수 (초과 시 가장 오래 안 쓴 항목부터 삭제)
+QUERY_CACHE_TTL = 3600      # 항목 유효 시간 (초, 0 = 만료 없음)
+
+_PUNCT_SPACE = re.compile(r"[\W_]+")
+
+
+def normalize_query(text):
+    """캐시 키용 쿼리 정규화: NFKC · 소문자 · 문장부호와 공백 연속을 공백 하나로"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return _PUNCT_SPACE.sub(" ", text).strip()
+
+
+class LRUCache:
+    """스레드 안전 LRU + TTL 인메모리 캐시 (적중 · 미적중 · 만료 · 삭제 수 집계)"""
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.clears = 0
+        self._items = OrderedDict()   # 키 → (저장 시각, 값), 뒤쪽이 최근 사용
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """값 조회 (없거나 TTL이 지났으면 None)"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and self.ttl and time.monotonic() - item[0] > self.ttl:
+                del self._items[key]
+                self.expired += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        """값 저장 (같은 키는 덮어씀)"""
+        with self._lock:
+            self._items[key] = (time.monotonic(), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """모든 항목 삭제 (통계는 유지)"""
+        with self._lock:
+            self._items.clear()
+            self.clears += 1
+
+    def stats(self):
+        """캐시 통계 (항목 수, 적중/미적중, 적중률, 만료 · 삭제 · 비우기 수)"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "clears": self.clears,
+            }
@@ -0,0 +1,356 @@
+"""
+맨큐의 경제학 - 검색 백엔드
+============================
+server.py의 search_vectordb가 사용하는 교체 가능한 벡터 검색 구현.
+
+  ChromaBackend  — chromadb 컬렉션의 query (기존 방식)
+  NumpyBackend   — rag/data/vectors의 행렬(float32 · float16 · int8)을 메모리 또는
+                   mmap에 올려 행렬-벡터 곱 한 번 + argpartition으로 전수 검색.
+                   메타데이터 필터(where)는 청크 저장소 열로 미리 만든 마스크로 처리
+  AnnBackend     — rag/ann_index의 faiss HNSW · IVF-PQ 색인(ann_index.py)으로 근사 검색.
+                   필터는 NumpyBackend와 같은 마스크를 색인 안의 선택자로 넘김
+  ShardedBackend — 책(source_file)·파트별로 나눈 샤드 컬렉션(pipeline.py --step shard)에
+                   같은 쿼리를 스레드 풀로 동시에 보내고, 샤드별 상위 k 목록을 힙으로 병합.
+                   where 필터가 닿지 않는 샤드는 건너뛴다
+
+모든 백엔드의 search / search_batch가 같은 형식의 문서 목록을 돌려준다:
+  {"id", "text", "metadata", "distance", "similarity"}
+"""
+
+import json
+import time
+import heapq
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+# where 필터에서 쓸 수 있는 메타데이터 필드 → (청크 저장소 열, 사전 테이블 또는 None)
+FIELD_COLUMNS = {
+    "chapter": ("chapter_ids", "chapters"),
+    "part": ("part_ids", "parts"),
+    "source_file": ("source_ids", "source_files"),
+    "estimated_page": ("pages", None),
+    "char_count": ("char_counts", None),
+    "chunk_index": ("chunk_indexes", None),
+}
+MASK_CACHE_SIZE = 256
+SHARD_LATENCY_WINDOW = 1000   # 샤드별 지연 통계(p50/p95)에 쓰는 최근 검색 수
+
+
+def make_doc(chunk_id, text, metadata, distance):
+    return {
+        "id": chunk_id,
+        "text": text,
+        "metadata": metadata,
+        "distance": distance,
+        "similarity": round(1 - distance, 4)
+    }
+
+
+class ChromaBackend:
+    """chromadb 컬렉션 검색"""
+
+    name = "chroma"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def search_batch(self, query_embeddings, n_results, where=None):
+        embeddings = [q.tolist() if hasattr(q, "tolist") else list(q) for q in query_embeddings]
+        params = {"query_embeddings": embeddings, "n_results": n_results}
+        if where:
+            params["where"] = where
+        results = self.collection.query(**params)
+        batches = []
+        for q in range(len(results["documents"])):
+            batches.append([
+                make_doc(results["ids"][q][i], results["documents"][q][i],
+                         results["metadatas"][q][i], results["distances"][q][i])
+                for i in range(len(results["documents"][q]))
+            ])
+        return batches
+
+    def search(self, query_embedding, n_results, where=None):
+        return self.search_batch([query_embedding], n_results, where)[0]
+
+    def stats(self):
+        return {"backend": self.name, "documents": self.collection.count()}
+
+
+class StoreFilter:
+    """청크 저장소 열로 Chroma 형식 where 필터를 행 마스크로 바꾸는 공통 부분"""
+
+    def __init__(self, store):
+        import numpy as np
+
+        self.np = np
+        self.store = store
+        self._columns = {
+            field: np.frombuffer(getattr(store, column), dtype=np.int32)
+            for field, (column, _) in FIELD_COLUMNS.items()
+        }
+        self._masks = {}
+        self._masks_lock = threading.Lock()
+        # 가장 자주 쓰는 챕터·파트 필터는 미리 계산
+        for field in ("chapter", "part"):
+            for value in getattr(store, FIELD_COLUMNS[field][1]):
+                self.mask({field: value})
+
+    def docs(self, results):
+        """[(행 번호 배열, 거리 배열), ...] → 쿼리별 문서 목록"""
+        store = self.store
+        return [
+            [make_doc(store.chunk_id(int(r)), store.text(int(r)), store.metadata(int(r)), float(d))
+             for r, d in zip(rows, distances)]
+            for rows, distances in results
+        ]
+
+    # ── 메타데이터 필터 → 행 마스크 ──
+
+    def mask(self, where):
+        """Chroma 형식 where 필터 → bool 마스크 (필터가 없으면 None, 결과는 캐시)"""
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True, ensure_ascii=False)
+        cached = self._masks.get(key)
+        if cached is None:
+            cached = self._build_mask(where)
+            with self._masks_lock:
+                if len(self._masks) >= MASK_CACHE_SIZE:
+                    self._masks.pop(next(iter(self._masks)))
+                self._masks[key] = cached
+        return cached
+
+    def _build_mask(self, where):
+        np = self.np
+        if "$and" in where:
+            masks = [self._build_mask(w) for w in where["$and"]]
+            return np.logical_and.reduce(masks) if masks else np.ones(len(self.store), dtype=bool)
+        if "$or" in where:
+            masks = [self._build_mask(w) for w in where["$or"]]
+            return np.logical_or.reduce(masks) if masks else np.zeros(len(self.store), dtype=bool)
+        masks = [self._field_mask(field, cond) for field, cond in where.items()]
+        return np.logical_and.reduce(masks)
+
+    def _encode(self, field, value):
+        """사전 인코딩된 필드의 값 → 정수 ID (없는 값은 -1: 어떤 행과도 일치하지 않음)"""
+        table = FIELD_COLUMNS[field][1]
+        if table is None:
+            return value
+        values = getattr(self.store, table)
+        return values.index(value) if value in values else -1
+
+    def _field_mask(self, field, cond):
+        np = self.np
+        if field not in FIELD_COLUMNS:
+            raise ValueError(f"필터할 수 없는 필드: {field}")
+        column = self._columns[field]
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        mask = np.ones(len(column), dtype=bool)
+        for op, value in cond.items():
+            if op in ("$in", "$nin"):
+                hit = np.isin(column, [self._encode(field, v) for v in value])
+                mask &= hit if op == "$in" else ~hit
+                continue
+            value = self._encode(field, value)
+            if op == "$eq":
+                mask &= column == value
+            elif op == "$ne":
+                mask &= column != value
+            elif op == "$gt":
+                mask &= column > value
+            elif op == "$gte":
+                mask &= column >= value
+            elif op == "$lt":
+                mask &= column < value
+            elif op == "$lte":
+                mask &= column <= value
+            else:
+                raise ValueError(f"지원하지 않는 필터 연산자: {op}")
+        return mask
+
+
+class NumpyBackend(StoreFilter):
+    """인메모리(또는 mmap) NumPy 전수 검색
+
+    vectors: vector_codec.CompactVectors (행 = 청크 저장소 순번),
+    rescore: 압축 형식일 때 상위 후보를 다시 채점할 float32 원본을 주는 함수 (선택)
+    """
+
+    name = "numpy"
+
+    def __init__(self, vectors, store, rescore=None):
+        self.vectors = vectors
+        self.rescore = rescore if vectors.codec != "float32" else None
+        super().__init__(store)
+
+    def search_batch(self, query_embeddings, n_results, where=None):
+        results = self.vectors.search_batch(query_embeddings, n_results,
+                                            mask=self.mask(where), rescore=self.rescore)
+        return self.docs(results)
+
+    def search(self, query_embedding, n_results, where=None):
+        return self.search_batch([query_embedding], n_results, where)[0]
+
+    def stats(self):
+        return {
+            "backend": self.name,
+            "documents": int(self.np.count_nonzero(self.vectors.valid)),
+            "codec": self.vectors.codec,
+            "rows": len(self.vectors),
+            "dim": self.vectors.dim,
+            "bytes": self.vectors.nbytes,
+            "mmap": isinstance(self.vectors.data, self.np.memmap),
+            "rescore": self.rescore is not None,
+            "cached_masks": len(self._masks),
+        }
+
+
+class AnnBackend(StoreFilter):
+    """faiss 근사 검색 (ann_index.AnnIndex, 행 = 청크 저장소 순번)
+
+    rescore: 거리가 근사값인 색인(IVF-PQ)의 상위 후보를 다시 채점할 float32 원본을 주는 함수 (선택)
+    """
+
+    name = "ann"
+
+    def __init__(self, index, store, rescore=None):
+        self.index = index
+        self.rescore = rescore if not index.exact_distances else None
+        super().__init__(store)
+
+    def search_batch(self, query_embeddings, n_results, where=None):
+        results = self.index.search_batch(query_embeddings, n_results,
+                                          mask=self.mask(where), rescore=self.rescore)
+        return self.docs(results)
+
+    def search(self, query_embedding, n_results, where=None):
+        return self.search_batch([query_embedding], n_results, where)[0]
+
+    def stats(self):
+        return {
+            "backend": self.name,
+            "documents": len(self.index),
+            "index": self.index.kind,
+            "params": self.index.meta.get("params"),
+            "search_param": self.index.search_param,
+            "dim": self.index.dim,
+            "rescore": self.rescore is not None,
+            "cached_masks": len(self._masks),
+        }
+
+
+class ShardedBackend:
+    """샤드 백엔드 여러 개에 동시에 검색을 보내고 거리 순으로 병합
+
+    shards: {샤드 이름(= field 값): 백엔드}, field: 샤드를 나눈 메타데이터 필드,
+    router: where 필터가 닿는 샤드를 고를 StoreFilter (없으면 항상 전체 샤드)
+    """
+
+    name = "shards"
+
+    def __init__(self, shards, field, router=None, workers=None):
+        self.shards = shards
+        self.field = field
+        self.router = router
+        self._pool = ThreadPoolExecutor(max_workers=workers or len(shards),
+                                        thread_name_prefix="shard")
+        self._lock = threading.Lock()
+        self._latencies = {name: deque(maxlen=SHARD_LATENCY_WINDOW) for name in shards}
+        self._queries = dict.fromkeys(shards, 0)
+        self._errors = dict.fromkeys(shards, 0)
+        self._skipped = dict.fromkeys(shards, 0)
+
+    def route(self, where=None):
+        """where 필터가 닿는 샤드 이름 목록 (라우터가 없거나 필터가 없으면 전체 샤드)"""
+        selected = list(self.shards)
+        if where and self.router is not None:
+            np = self.router.np
+            values = getattr(self.router.store, FIELD_COLUMNS[self.field][1])
+            column = self.router._columns[self.field]
+            try:
+                mask = self.router.mask(where)
+            except ValueError:
+                return selected   # 저장소 열에 없는 필드 — 각 샤드의 where 처리에 맡김
+            hit = {values[i] for i in np.unique(column[mask])}
+            selected = [name for name in selected if name in hit]
+            with self._lock:
+                for name in self.shards:
+                    if name not in hit:
+                        self._skipped[name] += 1
+        return selected
+
+    def _search_shard(self, name, query_embeddings, n_results, where):
+        started = time.perf_counter()
+        try:
+            batches = self.shards[name].search_batch(query_embeddings, n_results, where)
+        except Exception as e:
+            print(f"   [WARN] 샤드 {name} 검색 오류: {str(e)[:100]}")
+            batches = None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._queries[name] += 1
+            self._latencies[name].append(elapsed_ms)
+            if batches is None:
+                self._errors[name] += 1
+        if batches is None:
+            return [[] for _ in query_embeddings]
+        for docs in batches:
+            for doc in docs:
+                doc["shard"] = name
+        return batches
+
+    def search_batch(self, query_embeddings, n_results, where=None):
+        names = self.route(where)
+        if not names:
+            return [[] for _ in query_embeddings]
+        if len(names) == 1:
+            partials = [self._search_shard(names[0], query_embeddings, n_results, where)]
+        else:
+            futures = [self._pool.submit(self._search_shard, name, query_embeddings, n_results, where)
+                       for name in names]
+            partials = [future.result() for future in futures]
+        # 샤드별 결과는 이미 거리 순 → 힙 병합으로 상위 n_results개만
+        return [
+            list(islice(heapq.merge(*(partial[q] for partial in partials),
+                                    key=lambda doc: doc["distance"]), n_results))
+            for q in range(len(query_embeddings))
+        ]
+
+    def search(self, query_embedding, n_results, where=None):
+        return self.search_batch([query_embedding], n_results, where)[0]
+
+    def shard_stats(self):
+        """샤드별 문서 수 · 검색 횟수 · 건너뛴 횟수 · 오류 · 지연(ms)"""
+        stats = {}
+        with self._lock:
+            latencies = {name: sorted(values) for name, values in self._latencies.items()}
+            counts = {name: (self._queries[name], self._skipped[name], self._errors[name])
+                      for name in self.shards}
+        for name, backend in self.shards.items():
+            values = latencies[name]
+            queries, skipped, errors = counts[name]
+            stats[name] = {
+                "documents": backend.stats()["documents"],
+                "queries": queries,
+                "skipped": skipped,
+                "errors": errors,
+                "p50_ms": round(values[len(values) // 2], 2) if values else None,
+                "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))], 2) if values else None,
+            }
+        return stats
+
+    def stats(self):
+        shards = self.shard_stats()
+        return {
+            "backend": self.name,
+            "documents": sum(s["documents"] for s in shards.values()),
+            "shard_by": self.field,
+            "routing": self.router is not None,
+            "shards": shards,
+        }
+
+    def close(self):
+        self._pool.shutdown(wait=False)
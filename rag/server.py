@@ -7,6 +7,14 @@ ChromaDB + Gemini API 기반 RAG 서버
   python rag/server.py                          # 기본 실행 (port 5000)
   python rag/server.py --port 8080              # 포트 지정
   python rag/server.py --api-key YOUR_KEY       # API 키 지정
+  python rag/server.py --backend numpy          # NumPy 전수 검색 (rag/data/vectors, ChromaDB 불필요)
+  python rag/server.py --backend chroma         # ChromaDB query로 검색
+  python rag/server.py --backend ann --ann-index hnsw  # faiss ANN 색인 (pipeline.py --step index)
+  python rag/server.py --backend shards         # 책·파트별 샤드 컬렉션에 동시 검색 (pipeline.py --step shard)
+  python rag/server.py --search-mode lexical    # BM25만 사용 (쿼리 임베딩 API 호출 없음)
+  python rag/server.py --workers 16             # 동시에 처리할 요청 수 (1 = 한 번에 하나씩)
+  python rag/server.py --async                  # asyncio 서버 + keep-alive 업스트림 연결 풀 (async_server.py)
+  python rag/server.py --no-generation-cache    # 생성 결과 캐시(rag/cache/generations.sqlite) 끄기
 
 API 엔드포인트:
   POST /api/search    - 교과서 검색
@@ -15,8 +23,16 @@ API 엔드포인트:
   POST /api/lecture    - 강의자료 생성
   POST /api/report    - 보고서 초안 생성
   POST /api/chat      - 일반 질의응답
+  POST /api/chat/stream, /api/lecture/stream, /api/report/stream
+                      - 생성 텍스트를 도착하는 대로 보내는 SSE 스트림 (sources → delta… → done | error)
   GET  /api/status    - 서버 상태 확인
   POST /api/set-key   - API 키 설정
+
+주제 없이 챕터만 지정한 강의자료 · 기본 퀴즈는 pregenerate.py가 미리 만든 버전(rag/pregenerated)에서
+바로 돌려준다.
+search · quiz · exam · lecture 요청 본문의 "cache": false는 생성 결과 캐시를 쓰지 않고,
+"fresh": true는 사전 생성본과 캐시된 응답을 건너뛰고 새로 생성해 생성 결과 캐시만 덮어쓴다
+(사전 생성본은 pregenerate.py를 다시 실행해야 바뀐다).
 """
 
 import os
@@ -24,47 +40,103 @@ import sys
 import json
 import time
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import traceback
 
+from embed_cache import EmbeddingCache
+from chunk_store import ChunkStore
+from vector_codec import CompactVectors
+from embedder import GEMINI_MODEL, make_embedder
+from retrieval import AnnBackend, ChromaBackend, NumpyBackend, ShardedBackend, StoreFilter, make_doc
+from lexical import TOKENIZER_VERSION, LexicalIndex, reciprocal_rank_fusion
+from chapter_index import ChapterIndex, chapter_number
+from pregenerate import PREGENERATED_DIR, QUIZ_COUNT, QUIZ_TYPES, PregeneratedStore
+from query_cache import QUERY_CACHE_SIZE, QUERY_CACHE_TTL, LRUCache, normalize_query
+from generation_cache import GenerationCache
+from ann_index import ANN_TYPES, AnnIndex
+
 # ── 경로 설정 ──
 BASE_DIR = Path(__file__).resolve().parent.parent
 CHROMA_DIR = BASE_DIR / "rag" / "chroma_db"
-EMBEDDING_MODEL = "models/gemini-embedding-001"
+CHUNK_STORE_PATH = BASE_DIR / "rag" / "data" / "chunks.bin"
+VECTORS_DIR = BASE_DIR / "rag" / "data" / "vectors"
+ANN_DIR = BASE_DIR / "rag" / "ann_index"
+LEXICAL_INDEX_PATH = BASE_DIR / "rag" / "data" / "lexical.bin"
+SHARDS_PATH = BASE_DIR / "rag" / "chroma_db" / "shards.json"
+CHAPTER_INDEX_PATH = BASE_DIR / "rag" / "data" / "chapter_index.json"
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+HYBRID_CANDIDATES = 4    # 하이브리드 검색에서 각 방식이 융합 전에 가져오는 후보 배수 (n_results × 이 값)
+COLLECTION_NAME = "mankiw_economics"   # metadata.json의 collection 값이 있으면 그것을 사용
+# 로컬 스텁으로 테스트할 때: GEMINI_API_BASE=http://localhost:8765/v1beta (rag/stub_gemini.py, embedder.py가 읽음)
 GENERATION_MODEL = "gemini-2.0-flash"
+GENERATION_MAX_TOKENS = 4096
+SERVER_WORKERS = 8       # 동시에 처리하는 요청 수 (생성 API를 기다리는 동안 다른 요청·정적 파일도 처리)
+LISTEN_BACKLOG = 64      # 워커가 모두 바쁠 때 연결 대기열 길이
 
 # ── 전역 상태 ──
+# 요청은 워커 스레드에서 동시에 처리된다. 아래 객체들은 읽기 전용이거나 자체 잠금을 가지며
+# (ChunkStore·LexicalIndex mmap, EmbeddingCache·LRUCache·StoreFilter 잠금), 전역 참조를 바꾸는
+# init_services(/api/set-key)만 services_lock으로 한 번에 하나씩 실행한다.
+services_lock = threading.RLock()
 api_key = None
 genai = None
 chroma_client = None
 collection = None
+embedding_cache = None   # pipeline.py와 공유하는 디스크 임베딩 캐시 (--no-embed-cache 시 None)
+embedding_cache_enabled = True
+generation_cache = None  # 생성 결과 디스크 캐시 (--no-generation-cache 시 None)
+generation_cache_enabled = True
+chunk_store = None       # pipeline.py Step 2가 만든 열 지향 청크 저장소 (mmap, 없으면 None)
+embedding_dim = None     # 컬렉션을 만들 때 쓴 outputDimensionality (metadata.json, None = 기본)
+query_embedder = None    # 컬렉션과 같은 임베딩 백엔드 (embedder.py, metadata.json의 embedder · 모델 · 차원)
+embedder_transport = None  # query_embedder(원격)의 요청 함수 (async_server.py가 연결 풀로 지정, None = urllib)
+retrieval_backend = None  # search_vectordb가 쓰는 검색 백엔드 (retrieval.py)
+backend_choice = "auto"  # auto: rag/data/vectors가 맞으면 numpy, 아니면 chroma (ann · shards는 명시할 때만)
+ann_kind = "hnsw"        # ann 백엔드가 읽을 rag/ann_index 하위 색인 (hnsw | ivfpq)
+ann_search_param = None  # efSearch/nprobe (None = 색인을 만들 때 고른 기본값)
+lexical_index = None     # pipeline.py Step 2가 만든 BM25 역색인 (mmap, 없으면 None)
+chapter_index = None     # pipeline.py Step 2가 만든 챕터 → 청크 구간 색인 (없으면 챕터도 의미 검색)
+pregenerated = None      # pregenerate.py가 만든 챕터별 수업자료 현재 버전 (없으면 실시간 생성만)
+pregenerated_mtime = None  # 로드할 때의 rag/pregenerated/current.json 수정 시각
+lexical_filter = None    # 어휘 검색용 where 필터 → 행 마스크 (retrieval_backend가 못 주면 따로 만듦)
+search_mode = "hybrid"   # hybrid: 벡터 + BM25 순위 융합, vector: 벡터만, lexical: BM25만 (API 호출 없음)
+numpy_mmap = False       # numpy 백엔드 행렬을 RAM에 올리지 않고 mmap으로 사용
+query_cache_enabled = True   # 쿼리 임베딩 · 검색 결과 인메모리 LRU 캐시 (--no-query-cache 시 사용 안 함)
+query_cache_size = QUERY_CACHE_SIZE
+query_cache_ttl = QUERY_CACHE_TTL
+query_embedding_cache = None  # (임베딩 모델, 정규화 쿼리) → 쿼리 벡터
+search_result_cache = None    # (정규화 쿼리, 개수, 필터, 검색 방식) → 문서 목록
+query_cache_generation = None  # 캐시를 채울 때의 metadata.json · 청크 저장소 수정 시각
+compact_rescore = True   # 압축(float16/int8) 검색 상위 후보를 ChromaDB의 float32 벡터로 다시 채점
 
 
-def embed_query_rest(query_text, key):
-    """Gemini REST API로 쿼리 임베딩 생성 (deprecated 라이브러리 우회)"""
-    import urllib.request
-    model_name = EMBEDDING_MODEL.replace("models/", "")
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:embedContent?key={key}"
-    
-    payload = json.dumps({
-        "model": EMBEDDING_MODEL,
-        "content": {"parts": [{"text": query_text}]},
-        "taskType": "RETRIEVAL_QUERY"
-    }).encode("utf-8")
-    req = urllib.request.Request(url, data=payload, method="POST")
-    req.add_header("Content-Type", "application/json")
-    
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        data = json.loads(resp.read().decode())
-    
-    return data["embedding"]["values"]
+def init_services(key=None):
+    """서비스 초기화 (/api/set-key로 요청 스레드에서 다시 불려도 한 번에 하나만 실행)"""
+    with services_lock:
+        _init_services(key)
 
 
-def init_services(key=None):
+def set_embedder_transport(transport):
+    """쿼리 임베딩 요청을 보낼 함수 지정 (None = urllib) — 현재 query_embedder와
+    /api/set-key로 다시 만드는 것에 적용하고 이전 값을 돌려줌"""
+    global embedder_transport
+    with services_lock:
+        previous = embedder_transport
+        embedder_transport = transport
+        if query_embedder is not None and query_embedder.remote:
+            query_embedder.transport = transport
+    return previous
+
+
+def _init_services(key=None):
     """서비스 초기화"""
-    global api_key, genai, chroma_client, collection
+    global api_key, genai, chroma_client, collection, embedding_cache, generation_cache, chunk_store
+    global embedding_dim, query_embedder, retrieval_backend, lexical_index, lexical_filter, chapter_index
+    global query_embedding_cache, search_result_cache
 
     # API 키 설정 (.env 우선 → 환경변수)
     if key:
@@ -84,7 +156,7 @@ def init_services(key=None):
         if not api_key:
             api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
 
-    # Gemini API 초기화 (텍스트 생성용 — 임베딩은 REST API 직접 호출)
+    # Gemini API 초기화 (텍스트 생성용 — 임베딩은 embedder.py가 REST API 직접 호출)
     if api_key:
         try:
             import google.generativeai as _genai
@@ -95,74 +167,494 @@ def init_services(key=None):
             print(f"   [WARN] Gemini API 초기화 오류: {e}")
             genai = None
 
-    # ChromaDB 초기화
-    if CHROMA_DIR.exists():
+    # 임베딩 캐시 (한 번만 열어 재사용)
+    if embedding_cache_enabled and embedding_cache is None:
         try:
-            import chromadb
-            chroma_client = chromadb.PersistentClient(path=str(CHROMA_DIR))
-            collection = chroma_client.get_collection("mankiw_economics")
-            print(f"   ChromaDB 연결됨 ({collection.count():,}개 문서)")
+            embedding_cache = EmbeddingCache()
         except Exception as e:
-            print(f"   [WARN] ChromaDB 초기화 오류: {e}")
-            collection = None
-    else:
-        print(f"   [WARN] ChromaDB 디렉토리 없음: {CHROMA_DIR}")
-        print(f"   먼저 python rag/pipeline.py 를 실행하세요.")
+            print(f"   [WARN] 임베딩 캐시 초기화 오류: {e}")
 
+    # 생성 결과 캐시 (엔드포인트별 테이블, 한 번만 열어 재사용)
+    if generation_cache_enabled and generation_cache is None:
+        try:
+            generation_cache = GenerationCache()
+        except Exception as e:
+            print(f"   [WARN] 생성 결과 캐시 초기화 오류: {e}")
 
-def search_vectordb(query, n_results=5, where_filter=None):
-    """벡터 DB에서 관련 청크 검색 (REST API 임베딩 사용)"""
-    if not collection or not api_key:
-        return []
+    # 쿼리 캐시 (프로세스 내, 컬렉션을 다시 만들면 check_query_cache가 비움)
+    if query_cache_enabled and search_result_cache is None:
+        query_embedding_cache = LRUCache(query_cache_size, query_cache_ttl)
+        search_result_cache = LRUCache(query_cache_size, query_cache_ttl)
 
-    try:
-        # REST API로 쿼리 임베딩 생성
-        query_embedding = embed_query_rest(query, api_key)
+    # 청크 저장소 (mmap — 청크 수와 무관하게 즉시 열림)
+    if chunk_store is None and CHUNK_STORE_PATH.exists():
+        try:
+            chunk_store = ChunkStore(CHUNK_STORE_PATH)
+            print(f"   청크 저장소 연결됨 ({len(chunk_store):,}개 청크)")
+        except Exception as e:
+            print(f"   [WARN] 청크 저장소 초기화 오류: {e}")
+    if chapter_index is None and chunk_store is not None:
+        chapter_index = load_chapter_index()
+    if pregenerated is None:
+        load_pregenerated()
 
-        # 검색 파라미터
-        search_params = {
-            "query_embeddings": [query_embedding],
-            "n_results": n_results,
-        }
-        if where_filter:
-            search_params["where"] = where_filter
-
-        results = collection.query(**search_params)
-
-        # 결과 정리
-        docs = []
-        for i in range(len(results['documents'][0])):
-            docs.append({
-                "text": results['documents'][0][i],
-                "metadata": results['metadatas'][0][i],
-                "distance": results['distances'][0][i],
-                "similarity": round(1 - results['distances'][0][i], 4)
-            })
-        return docs
+    # 컬렉션 이름·임베딩 차원은 pipeline이 기록한 metadata.json을 따름
+    meta_path = CHROMA_DIR / "metadata.json"
+    meta = {}
+    if meta_path.exists():
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    collection_name = meta.get("collection") or COLLECTION_NAME
+    embedding_dim = meta.get("embedding_dim")
 
+    # 쿼리 임베딩은 컬렉션을 만든 것과 같은 백엔드로 (gemini만 API 키 필요)
+    embedder_kind = meta.get("embedder", "gemini")
+    if query_embedder is None or key:
+        try:
+            if embedder_kind != "gemini" or api_key:
+                query_embedder = make_embedder(embedder_kind, api_key=api_key, dim=embedding_dim,
+                                               model=meta.get("embedding_model") or GEMINI_MODEL,
+                                               cache=embedding_cache)
+                if query_embedder.remote:
+                    query_embedder.transport = embedder_transport
+                print(f"   쿼리 임베딩: {query_embedder.describe()}")
+        except Exception as e:
+            print(f"   [WARN] 쿼리 임베딩 초기화 오류: {e}")
+            query_embedder = None
+
+    # 샤드 컬렉션 (같은 컬렉션·같은 청크 저장소로 나눈 샤드만 사용)
+    sharded = None
+    if backend_choice == "shards" and retrieval_backend is None:
+        sharded = load_shards(collection_name)
+        if sharded is None:
+            print("   [WARN] shards 백엔드를 쓸 수 없어 numpy/ChromaDB로 검색합니다.")
+
+    # ANN 색인 (같은 컬렉션·같은 청크 저장소로 만든 색인만 사용)
+    ann = None
+    if backend_choice == "ann" and retrieval_backend is None:
+        ann = load_ann_index(collection_name)
+        if ann is None:
+            print("   [WARN] ann 백엔드를 쓸 수 없어 numpy/ChromaDB로 검색합니다.")
+
+    # NumPy 백엔드 (같은 컬렉션·같은 청크 저장소로 만든 벡터만 사용)
+    vectors = None
+    if (backend_choice in ("auto", "numpy", "ann", "shards") and ann is None and sharded is None
+            and retrieval_backend is None):
+        vectors = load_numpy_vectors(collection_name)
+        if vectors is None and backend_choice == "numpy":
+            print("   [WARN] numpy 백엔드를 쓸 수 없어 ChromaDB로 검색합니다.")
+
+    # ChromaDB 초기화 (chroma 백엔드이거나 압축 벡터 rescore에 float32 원본이 필요할 때)
+    if sharded is not None:
+        needs_chroma = False
+    elif ann is not None:
+        needs_chroma = not ann.exact_distances and compact_rescore
+    else:
+        needs_chroma = vectors is None or (vectors.codec != "float32" and compact_rescore)
+    if needs_chroma and collection is None:
+        if CHROMA_DIR.exists():
+            try:
+                import chromadb
+                started = time.time()
+                chroma_client = chromadb.PersistentClient(path=str(CHROMA_DIR))
+                collection = chroma_client.get_collection(collection_name)
+                print(f"   ChromaDB 연결됨 ({collection_name}: {collection.count():,}개 문서"
+                      f"{f', {embedding_dim}차원' if embedding_dim else ''}, "
+                      f"{(time.time() - started) * 1000:.0f}ms)")
+            except Exception as e:
+                print(f"   [WARN] ChromaDB 초기화 오류: {e}")
+                collection = None
+        else:
+            print(f"   [WARN] ChromaDB 디렉토리 없음: {CHROMA_DIR}")
+            print(f"   먼저 python rag/pipeline.py 를 실행하세요.")
+
+    if retrieval_backend is None:
+        if sharded is not None:
+            retrieval_backend = sharded
+        elif ann is not None:
+            rescore = fetch_full_vectors if compact_rescore and collection else None
+            retrieval_backend = AnnBackend(ann, chunk_store, rescore=rescore)
+        elif vectors is not None:
+            rescore = fetch_full_vectors if compact_rescore and collection else None
+            retrieval_backend = NumpyBackend(vectors, chunk_store, rescore=rescore)
+        elif collection is not None:
+            retrieval_backend = ChromaBackend(collection)
+        if retrieval_backend is not None:
+            print(f"   검색 백엔드: {retrieval_backend.name}")
+
+    # 어휘(BM25) 색인 (같은 청크 저장소·토큰화 규칙으로 만든 색인만 사용)
+    if lexical_index is None and search_mode != "vector" and chunk_store is not None:
+        lexical_index = load_lexical_index()
+        if lexical_index is not None:
+            if isinstance(retrieval_backend, StoreFilter):
+                lexical_filter = retrieval_backend
+            elif isinstance(retrieval_backend, ShardedBackend) and retrieval_backend.router:
+                lexical_filter = retrieval_backend.router
+            else:
+                try:
+                    lexical_filter = StoreFilter(chunk_store)
+                except ImportError:
+                    print("   [WARN] numpy가 없어 어휘 검색에서 챕터 필터를 쓸 수 없습니다.")
+    if search_mode != "vector":
+        print(f"   검색 방식: {search_mode if lexical_index else 'vector (어휘 색인 없음)'}")
+
+
+def load_lexical_index():
+    """rag/data/lexical.bin 로드 (없거나 현재 청크 저장소와 맞지 않으면 None)"""
+    if not LEXICAL_INDEX_PATH.exists():
+        print(f"   [WARN] 어휘 색인 없음: {LEXICAL_INDEX_PATH} (python rag/pipeline.py --step chunk 로 생성)")
+        return None
+    try:
+        index = LexicalIndex(LEXICAL_INDEX_PATH)
+    except Exception as e:
+        print(f"   [WARN] 어휘 색인 로드 오류: {e}")
+        return None
+    if index.digest != chunk_store.digest or index.tokenizer_version != TOKENIZER_VERSION:
+        print(f"   [WARN] 어휘 색인이 현재 청크와 맞지 않아 사용하지 않습니다. "
+              f"(python rag/pipeline.py --step chunk 로 다시 생성)")
+        index.close()
+        return None
+    stats = index.stats()
+    print(f"   어휘 색인 연결됨 (용어 {stats['terms']:,}개, {stats['bytes'] / 1e6:,.1f}MB)")
+    return index
+
+
+def load_chapter_index():
+    """rag/data/chapter_index.json 로드 (없거나 현재 청크 저장소와 맞지 않으면 None)"""
+    try:
+        index = ChapterIndex.load(CHAPTER_INDEX_PATH)
+    except Exception as e:
+        print(f"   [WARN] 챕터 색인 로드 오류: {e}")
+        return None
+    if index is None:
+        print(f"   [WARN] 챕터 색인 없음: {CHAPTER_INDEX_PATH} (python rag/pipeline.py --step chunk 로 생성)")
+        return None
+    if index.digest != chunk_store.digest:
+        print(f"   [WARN] 챕터 색인이 현재 청크와 맞지 않아 사용하지 않습니다. "
+              f"(python rag/pipeline.py --step chunk 로 다시 생성)")
+        return None
+    print(f"   챕터 색인 연결됨 ({len(index):,}개 챕터)")
+    return index
+
+
+def load_pregenerated():
+    """rag/pregenerated/current.json이 가리키는 사전 생성 버전 로드 (없으면 None)"""
+    global pregenerated, pregenerated_mtime
+    pointer = PREGENERATED_DIR / "current.json"
+    pregenerated_mtime = pointer.stat().st_mtime if pointer.exists() else None
+    try:
+        pregenerated = PregeneratedStore.load(PREGENERATED_DIR)
+    except Exception as e:
+        print(f"   [WARN] 사전 생성 자료 로드 오류: {e}")
+        pregenerated = None
+        return
+    if pregenerated is None:
+        return
+    if chunk_store is not None and pregenerated.chunks != chunk_store.digest:
+        print(f"   [WARN] 사전 생성 자료가 현재 청크와 다른 색인으로 만들어졌습니다. "
+              f"(python rag/pregenerate.py 로 다시 생성)")
+    print(f"   사전 생성 자료 연결됨 (버전 {pregenerated.version}, {len(pregenerated):,}개 항목)")
+
+
+def pregenerated_result(kind, format_type, chapter):
+    """챕터 요청 → 사전 생성된 응답 (없으면 None, pregenerate.py가 새 버전을 쓰면 다시 로드)"""
+    pointer = PREGENERATED_DIR / "current.json"
+    mtime = pointer.stat().st_mtime if pointer.exists() else None
+    if mtime != pregenerated_mtime:
+        with services_lock:
+            if mtime != pregenerated_mtime:
+                load_pregenerated()
+    number = chapter_number(chapter) if chapter not in (None, "") else None
+    if pregenerated is None or number is None:
+        return None
+    return pregenerated.get(kind, format_type, number)
+
+
+def load_numpy_vectors(collection_name):
+    """rag/data/vectors 로드 (없거나 현재 컬렉션·청크 저장소와 맞지 않으면 None)"""
+    if chunk_store is None:
+        return None
+    try:
+        started = time.time()
+        vectors = CompactVectors.load(VECTORS_DIR, mmap=numpy_mmap)
+    except Exception as e:
+        print(f"   [WARN] 벡터 로드 오류: {e}")
+        return None
+    if vectors is None:
+        return None
+    if vectors.meta.get("collection") != collection_name or vectors.meta.get("chunks") != chunk_store.digest:
+        print(f"   [WARN] rag/data/vectors가 현재 컬렉션/청크와 맞지 않아 사용하지 않습니다. "
+              f"(python rag/pipeline.py --step compact 로 다시 생성)")
+        return None
+    print(f"   벡터 행렬 로드됨 ({vectors.codec}, {len(vectors):,}×{vectors.dim}, "
+          f"{vectors.nbytes / 1e6:,.1f}MB{', mmap' if numpy_mmap else ''}, "
+          f"{(time.time() - started) * 1000:.0f}ms)")
+    return vectors
+
+
+def load_ann_index(collection_name):
+    """rag/ann_index/{ann_kind} 로드 (없거나 현재 컬렉션·청크 저장소와 맞지 않으면 None)"""
+    if chunk_store is None:
+        return None
+    try:
+        started = time.time()
+        index = AnnIndex.load(ANN_DIR / ann_kind)
+    except Exception as e:
+        print(f"   [WARN] ANN 색인 로드 오류: {e}")
+        return None
+    if index is None:
+        print(f"   [WARN] ANN 색인 없음: {ANN_DIR / ann_kind} "
+              f"(python rag/pipeline.py --step index --index-type {ann_kind} 로 생성)")
+        return None
+    if index.meta.get("collection") != collection_name or index.meta.get("chunks") != chunk_store.digest:
+        print(f"   [WARN] rag/ann_index/{ann_kind}가 현재 컬렉션/청크와 맞지 않아 사용하지 않습니다. "
+              f"(python rag/pipeline.py --step index 로 다시 생성)")
+        return None
+    if ann_search_param:
+        index.set_search_param(ann_search_param)
+    params = ", ".join(f"{key}={value}" for key, value in index.meta.get("params", {}).items())
+    print(f"   ANN 색인 로드됨 ({index.kind}: {params}, {len(index):,}개 벡터, "
+          f"검색 파라미터 {index.search_param}, {(time.time() - started) * 1000:.0f}ms)")
+    return index
+
+
+def load_shards(collection_name):
+    """rag/chroma_db/shards.json의 샤드 컬렉션 → ShardedBackend (없거나 현재 컬렉션·청크와 맞지 않으면 None)"""
+    global chroma_client
+    if not SHARDS_PATH.exists():
+        print(f"   [WARN] 샤드 목록 없음: {SHARDS_PATH} (python rag/pipeline.py --step shard 로 생성)")
+        return None
+    with open(SHARDS_PATH, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("collection") != collection_name or (
+            chunk_store is not None and manifest.get("chunks") != chunk_store.digest):
+        print(f"   [WARN] 샤드가 현재 컬렉션/청크와 맞지 않아 사용하지 않습니다. "
+              f"(python rag/pipeline.py --step shard 로 다시 생성)")
+        return None
+    try:
+        import chromadb
+        started = time.time()
+        if chroma_client is None:
+            chroma_client = chromadb.PersistentClient(path=str(CHROMA_DIR))
+        shards = {s["name"]: ChromaBackend(chroma_client.get_collection(s["collection"]))
+                  for s in manifest["shards"]}
+    except Exception as e:
+        print(f"   [WARN] 샤드 컬렉션 로드 오류: {e}")
+        return None
+
+    # 챕터 등 다른 필드의 where 필터도 청크 저장소 열로 해당 샤드만 고름
+    router = None
+    if chunk_store is not None:
+        try:
+            router = StoreFilter(chunk_store)
+        except ImportError:
+            print("   [WARN] numpy가 없어 샤드 라우팅 없이 모든 샤드를 검색합니다.")
+    print(f"   샤드 {len(shards)}개 연결됨 ({manifest['shard_by']}별, "
+          f"{sum(s['documents'] for s in manifest['shards']):,}개 문서, "
+          f"{(time.time() - started) * 1000:.0f}ms)")
+    return ShardedBackend(shards, manifest["shard_by"], router=router)
+
+
+def fetch_full_vectors(rows):
+    """청크 순번 목록 → ChromaDB에 저장된 float32 원본 벡터 (rescore용, 같은 순서)"""
+    ids = [chunk_store.chunk_id(int(r)) for r in rows]
+    stored = collection.get(ids=ids, include=["embeddings"])
+    by_id = dict(zip(stored["ids"], stored["embeddings"]))
+    return [by_id[i] for i in ids]
+
+
+def search_vectordb(query, n_results=5, where_filter=None, mode=None, shards=None):
+    """관련 청크 검색 (mode: hybrid | vector | lexical, None = --search-mode)
+
+    vector는 쿼리 임베딩(query_embedder) + retrieval_backend, lexical은 BM25 색인만 사용(외부 호출 없음),
+    hybrid는 두 결과를 reciprocal rank fusion으로 합친다. 어휘 색인이 없으면 vector,
+    벡터 검색을 쓸 수 없으면(API 키·백엔드 없음, 임베딩 오류) lexical로 대신한다.
+    shards: 검색할 샤드 이름 목록 (shards 백엔드일 때, 샤드 필드 조건으로 where에 더함)
+    """
+    return search_vectordb_batch([query], n_results, where_filter, mode, shards)[0]
+
+
+def search_vectordb_batch(queries, n_results=5, where_filter=None, mode=None, shards=None, dedupe=False):
+    """여러 쿼리를 한 번에 검색 → 쿼리별 문서 목록 (queries와 같은 순서, 검색 방식은 search_vectordb와 같음)
+
+    쿼리 임베딩은 한 번의 요청(batchEmbedContents, 캐시에 있는 쿼리는 제외)으로 만들고,
+    벡터 검색도 backend.search_batch 한 번(ChromaDB 다중 벡터 query · NumPy 행렬 곱 한 번)으로 처리한다.
+    where_filter: 모든 쿼리에 같은 필터(dict) 또는 쿼리별 필터 목록 (같은 필터끼리 묶어 검색)
+    dedupe=True면 앞 쿼리 결과에 이미 나온 청크를 뒤 쿼리에서 빼고 다음 후보로 채운다.
+    """
+    if not queries:
+        return []
+    mode = mode or search_mode
+    wheres = list(where_filter) if isinstance(where_filter, list) else [where_filter] * len(queries)
+    if shards and isinstance(retrieval_backend, ShardedBackend):
+        shard_where = {retrieval_backend.field: {"$in": list(shards)}}
+        wheres = [{"$and": [where, shard_where]} if where else shard_where for where in wheres]
+    if lexical_index is None:
+        mode = "vector"
+    elif mode == "hybrid" and (not retrieval_backend or not query_embedder):
+        mode = "lexical"
+    # 중복을 빼면 i번째 쿼리는 앞 쿼리들이 가져간 최대 i × n_results개를 잃으므로 쿼리 수만큼 후보를 가져옴
+    n_fetch = n_results * len(queries) if dedupe else n_results
+
+    # 캐시에 있는 쿼리는 그대로, 나머지만 한 번에 검색
+    results = [None] * len(queries)
+    keys = None
+    if search_result_cache is not None:
+        check_query_cache()
+        keys = [(normalize_query(query), n_fetch, json.dumps(where, sort_keys=True, ensure_ascii=False), mode)
+                for query, where in zip(queries, wheres)]
+        for i, key in enumerate(keys):
+            cached = search_result_cache.get(key)
+            if cached is not None:
+                results[i] = [dict(doc) for doc in cached]
+    todo = [i for i, docs in enumerate(results) if docs is None]
+    if todo:
+        found, cacheable = search_uncached([queries[i] for i in todo], [wheres[i] for i in todo], n_fetch, mode)
+        for i, docs in zip(todo, found):
+            results[i] = docs
+            if keys is not None and cacheable:
+                search_result_cache.put(keys[i], [dict(doc) for doc in docs])
+
+    if dedupe:
+        results = dedupe_results(results, n_results)
+    return results
+
+
+def search_uncached(queries, wheres, n_fetch, mode):
+    """search_vectordb_batch의 실제 검색 → (쿼리별 문서 목록, 캐시해도 되는지)
+
+    벡터 검색을 할 수 없거나 오류로 대체 결과를 돌려줄 때는 캐시하지 않는다.
+    """
+    def lexical_results(n):
+        return [search_lexical(query, n, where) for query, where in zip(queries, wheres)]
+
+    if mode == "lexical":
+        return lexical_results(n_fetch), True
+    if not retrieval_backend or not query_embedder:
+        return [[] for _ in queries], False
+
+    n_candidates = n_fetch * HYBRID_CANDIDATES if mode == "hybrid" else n_fetch
+    try:
+        # 쿼리 임베딩 생성 (인메모리 · 디스크 캐시 우선, 나머지는 한 번에)
+        embeddings = embed_queries(queries)
+        groups = {}
+        for i, where in enumerate(wheres):
+            groups.setdefault(json.dumps(where, sort_keys=True, ensure_ascii=False), []).append(i)
+        vector_results = [None] * len(queries)
+        for indexes in groups.values():
+            batch = retrieval_backend.search_batch([embeddings[i] for i in indexes], n_candidates,
+                                                   wheres[indexes[0]])
+            for i, docs in zip(indexes, batch):
+                vector_results[i] = docs
     except Exception as e:
         print(f"검색 오류: {e}")
+        return (lexical_results(n_fetch) if mode == "hybrid" else [[] for _ in queries]), False
+
+    if mode == "vector":
+        return vector_results, True
+    return [reciprocal_rank_fusion([vector_docs, lexical_docs], n_fetch)
+            for vector_docs, lexical_docs in zip(vector_results, lexical_results(n_candidates))], True
+
+
+def embed_queries(queries):
+    """쿼리 목록 → 임베딩 (인메모리 캐시에 없는 쿼리만 query_embedder로 한 번에)"""
+    if query_embedding_cache is None:
+        return query_embedder.embed(list(queries), "RETRIEVAL_QUERY")
+    keys = [(query_embedder.cache_tag, normalize_query(query)) for query in queries]
+    vectors = [query_embedding_cache.get(key) for key in keys]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        fetched = query_embedder.embed([queries[i] for i in missing], "RETRIEVAL_QUERY")
+        for i, vector in zip(missing, fetched):
+            vectors[i] = vector
+            query_embedding_cache.put(keys[i], vector)
+    return vectors
+
+
+def check_query_cache():
+    """컬렉션·청크를 다시 만들었으면(metadata.json · chunks.bin 수정 시각 변경) 쿼리 캐시를 비움"""
+    global query_cache_generation
+    generation = tuple(path.stat().st_mtime_ns if path.exists() else None
+                       for path in (CHROMA_DIR / "metadata.json", CHUNK_STORE_PATH))
+    if generation == query_cache_generation:
+        return
+    with services_lock:
+        if generation == query_cache_generation:
+            return
+        if query_cache_generation is not None:
+            print("  [CACHE] 벡터 DB가 다시 만들어져 쿼리 캐시를 비웁니다.")
+            query_embedding_cache.clear()
+            search_result_cache.clear()
+        query_cache_generation = generation
+
+
+def dedupe_results(results, n_results):
+    """쿼리별 결과에서 앞 쿼리에 이미 나온 청크를 빼고 쿼리마다 n_results개씩 남김"""
+    seen = set()
+    deduped = []
+    for docs in results:
+        kept = [doc for doc in docs if doc["id"] not in seen][:n_results]
+        seen.update(doc["id"] for doc in kept)
+        deduped.append(kept)
+    return deduped
+
+
+def search_lexical(query, n_results=5, where_filter=None):
+    """BM25 검색 → 문서 목록 (similarity = 최고 점수 대비 비율, 원래 점수는 "bm25")"""
+    if lexical_index is None:
+        return []
+    mask = None
+    if where_filter:
+        if lexical_filter is None:
+            return []
+        mask = lexical_filter.mask(where_filter)
+    hits = lexical_index.search(query, n_results, mask)
+    if not hits:
         return []
+    top = hits[0][1]
+    docs = []
+    for row, score in hits:
+        doc = make_doc(chunk_store.chunk_id(row), chunk_store.text(row), chunk_store.metadata(row),
+                       1 - score / top)
+        doc["bm25"] = round(score, 4)
+        docs.append(doc)
+    return docs
+
+
+def chapter_docs(chapter, n_results):
+    """챕터 색인으로 챕터 전체에 고르게 퍼진 청크 n개를 바로 꺼냄 (임베딩·벡터 검색 없음)"""
+    return [
+        make_doc(chunk_store.chunk_id(row), chunk_store.text(row), chunk_store.metadata(row), 0.0)
+        for row in chapter_index.sample(chapter, n_results)
+    ]
 
 
-def generate_with_context(query, context_docs, system_prompt, temperature=0.7):
-    """Gemini API로 컨텍스트 기반 응답 생성"""
-    if not genai:
-        return {"error": "Gemini API가 설정되지 않았습니다. API 키를 확인해주세요."}
+def search_chapter(chapter, n_results, topic=None):
+    """챕터 범위 자료 — 주제가 있으면 챕터 필터를 붙여 검색, 없으면 챕터 색인에서 바로 꺼냄
+
+    챕터 색인이 없거나 챕터를 찾지 못했거나 결과가 없으면 None (호출한 쪽이 기존 방식으로 검색)
+    """
+    if chapter_index is None:
+        return None
+    where = chapter_index.where(chapter)
+    if where is None:
+        return None
+    docs = search_vectordb(topic, n_results, where_filter=where) if topic else chapter_docs(chapter, n_results)
+    return docs or None
+
+
+def build_prompt(query, context_docs, system_prompt):
+    """시스템 지시 + 교과서 참고 자료 + 사용자 요청 → 생성 API에 보낼 프롬프트"""
+    context_parts = []
+    for i, doc in enumerate(context_docs):
+        meta = doc["metadata"]
+        context_parts.append(
+            f"[출처 {i+1}: {meta.get('source_file', 'N/A')} p.{meta.get('estimated_page', 'N/A')} "
+            f"({meta.get('chapter', 'N/A')})]\n{doc['text']}"
+        )
+    context_text = "\n\n---\n\n".join(context_parts)
 
-    try:
-        # 컨텍스트 구성
-        context_parts = []
-        for i, doc in enumerate(context_docs):
-            meta = doc["metadata"]
-            context_parts.append(
-                f"[출처 {i+1}: {meta.get('source_file', 'N/A')} p.{meta.get('estimated_page', 'N/A')} "
-                f"({meta.get('chapter', 'N/A')})]\n{doc['text']}"
-            )
-        context_text = "\n\n---\n\n".join(context_parts)
-
-        # 프롬프트 구성
-        full_prompt = f"""{system_prompt}
+    return f"""{system_prompt}
 
 ## 교과서 참고 자료 (맨큐의 경제학 제10판)
 {context_text}
@@ -171,50 +663,217 @@ def generate_with_context(query, context_docs, system_prompt, temperature=0.7):
 {query}
 """
 
+
+def generation_sources(context_docs):
+    """응답에 함께 보내는 출처 목록"""
+    return [
+        {
+            "file": doc["metadata"].get("source_file", ""),
+            "page": doc["metadata"].get("estimated_page", ""),
+            "chapter": doc["metadata"].get("chapter", ""),
+            "similarity": doc.get("similarity", 0),
+            "preview": doc["text"][:200] + "..."
+        }
+        for doc in context_docs
+    ]
+
+
+def generate_with_context(query, context_docs, system_prompt, temperature=0.7):
+    """Gemini API로 컨텍스트 기반 응답 생성"""
+    if not genai:
+        return {"error": "Gemini API가 설정되지 않았습니다. API 키를 확인해주세요."}
+
+    try:
         model = genai.GenerativeModel(
             GENERATION_MODEL,
             generation_config={
                 "temperature": temperature,
-                "max_output_tokens": 4096,
+                "max_output_tokens": GENERATION_MAX_TOKENS,
             }
         )
-        response = model.generate_content(full_prompt)
-        
+        response = model.generate_content(build_prompt(query, context_docs, system_prompt))
+
         return {
             "response": response.text,
-            "sources": [
-                {
-                    "file": doc["metadata"].get("source_file", ""),
-                    "page": doc["metadata"].get("estimated_page", ""),
-                    "chapter": doc["metadata"].get("chapter", ""),
-                    "similarity": doc.get("similarity", 0),
-                    "preview": doc["text"][:200] + "..."
-                }
-                for doc in context_docs
-            ]
+            "sources": generation_sources(context_docs)
         }
 
     except Exception as e:
         return {"error": f"생성 오류: {str(e)}"}
 
 
+class GenerationTask:
+    """검색까지 끝나고 생성만 남은 요청 — 핸들러가 돌려주면 서버가 실행
+
+    동기 서버는 run()으로 SDK를 호출하고, 비동기 서버(async_server.py)는 prompt()를
+    REST generateContent로 보내 기다린 뒤 complete()로 같은 형식의 응답을 만든다.
+    finish: 생성 결과 dict(오류 포함)를 받아 최종 응답을 만드는 함수 (선택)
+    cache: (엔드포인트, 키) — cached_generation이 정하며, 생성에 성공하면 생성 결과 캐시에 저장
+    """
+
+    model = GENERATION_MODEL
+
+    def __init__(self, query, context_docs, system_prompt, temperature=0.7, finish=None):
+        self.query = query
+        self.context_docs = context_docs
+        self.system_prompt = system_prompt
+        self.temperature = temperature
+        self.finish = finish
+        self.cache = None
+
+    def prompt(self):
+        return build_prompt(self.query, self.context_docs, self.system_prompt)
+
+    def complete(self, text=None, error=None):
+        """생성된 텍스트(또는 오류 메시지) → 응답 dict"""
+        if error is not None:
+            result = {"error": error}
+        else:
+            result = {"response": text, "sources": generation_sources(self.context_docs)}
+            self.remember(result)
+        return self.finish(result) if self.finish else result
+
+    def run(self):
+        result = generate_with_context(self.query, self.context_docs, self.system_prompt, self.temperature)
+        if "error" not in result:
+            self.remember(result)
+        return self.finish(result) if self.finish else result
+
+    def remember(self, result):
+        """성공한 생성 결과를 생성 결과 캐시에 저장 (finish 적용 전 {"response", "sources"})"""
+        if self.cache and generation_cache:
+            endpoint, key = self.cache
+            generation_cache.put(endpoint, key, result)
+
+    def stream(self):
+        """생성 텍스트 조각을 도착하는 대로 내보내는 제너레이터 (SDK stream=True)"""
+        model = genai.GenerativeModel(
+            self.model,
+            generation_config={
+                "temperature": self.temperature,
+                "max_output_tokens": GENERATION_MAX_TOKENS,
+            }
+        )
+        for chunk in model.generate_content(self.prompt(), stream=True):
+            if chunk.parts:
+                yield chunk.text
+
+
+def sse_event(event, data):
+    """Server-Sent Events 한 건 (event 이름 + JSON data 한 줄)"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def stream_events(result):
+    """핸들러 결과 → (event, data) 순서: sources → delta… → done (실패하면 error로 끝남)
+
+    출처를 생성 시작 전에 먼저 보내므로 첫 바이트는 검색이 끝나자마자 나간다.
+    """
+    if not isinstance(result, GenerationTask):
+        yield from result_events(result)
+        return
+    if not genai:
+        yield "error", {"error": "Gemini API가 설정되지 않았습니다. API 키를 확인해주세요."}
+        return
+    sources = generation_sources(result.context_docs)
+    yield "sources", {"sources": sources}
+    chars = 0
+    texts = []
+    try:
+        for text in result.stream():
+            chars += len(text)
+            texts.append(text)
+            yield "delta", {"text": text}
+    except Exception as e:
+        yield "error", {"error": f"생성 오류: {str(e)}"}
+        return
+    result.remember({"response": "".join(texts), "sources": sources})
+    yield "done", {"chars": chars}
+
+
+def result_events(result):
+    """이미 완성된 응답 dict(오류 또는 생성 결과 캐시 적중) → 같은 이벤트 순서"""
+    if "error" in result:
+        yield "error", result
+        return
+    yield "sources", {"sources": result.get("sources", [])}
+    yield "delta", {"text": result["response"]}
+    yield "done", {"chars": len(result["response"]), "cached": bool(result.get("cached"))}
+
+
+def cached_generation(endpoint, handler):
+    """핸들러를 생성 결과 캐시로 감쌈 — 요청 값과 검색된 청크가 같으면 생성 없이 저장된 응답을 돌려줌
+
+    검색은 그대로 실행하므로(청크 ID가 키에 들어감) 색인이 바뀌면 자연히 새로 생성된다.
+    """
+    def cached_handler(body):
+        result = handler(body)
+        if (not isinstance(result, GenerationTask) or generation_cache is None
+                or not generation_cache.enabled(endpoint) or body.get("cache") is False):
+            return result
+        key = generation_cache.make_key(endpoint, body, [doc["id"] for doc in result.context_docs],
+                                        result.model, result.temperature)
+        if not body.get("fresh"):
+            cached = generation_cache.get(endpoint, key)
+            if cached is not None:
+                cached["cached"] = True
+                return result.finish(cached) if result.finish else cached
+        result.cache = (endpoint, key)
+        return result
+
+    cached_handler.__doc__ = handler.__doc__
+    return cached_handler
+
+
+def dispatch(handler, body):
+    """API 핸들러 실행 → 응답 dict (GenerationTask면 생성까지 이 스레드에서 실행)"""
+    result = handler(body)
+    return result.run() if isinstance(result, GenerationTask) else result
+
+
 # ── API 핸들러들 ──
 
 def handle_search(body):
     """교과서 자료 검색"""
     query = body.get("query", "")
     n_results = body.get("n_results", 8)
+    queries = text_list(body.get("queries"))   # 여러 검색어를 한 번에 (요약 없이 검색어별 결과만)
+    mode = body.get("mode")   # hybrid | vector | lexical (없으면 서버 기본값)
+    shards = body.get("shards")   # 검색할 샤드(책·파트) 이름 목록 (없으면 전체)
 
-    if not query:
+    if queries is None:
+        return {"error": "queries는 검색어(문자열) 목록이어야 합니다."}
+    if not query and not queries:
         return {"error": "검색어를 입력해주세요."}
-
-    docs = search_vectordb(query, n_results=n_results)
+    if mode and mode not in SEARCH_MODES:
+        return {"error": f"지원하지 않는 검색 방식: {mode}"}
+    if isinstance(shards, str):
+        shards = [shards]
+    if shards and isinstance(retrieval_backend, ShardedBackend):
+        unknown = [name for name in shards if name not in retrieval_backend.shards]
+        if unknown:
+            return {"error": f"알 수 없는 샤드: {', '.join(unknown)} "
+                             f"(가능: {', '.join(retrieval_backend.shards)})"}
+
+    if queries:
+        batch = search_vectordb_batch(queries, n_results=n_results, mode=mode, shards=shards,
+                                      dedupe=body.get("dedupe", False))
+        return {"queries": queries, "results": [raw_results(docs) for docs in batch]}
+
+    docs = search_vectordb(query, n_results=n_results, mode=mode, shards=shards)
     
     if not docs:
         return {"results": [], "message": "검색 결과가 없습니다."}
 
-    # Gemini로 요약 생성
-    result = generate_with_context(
+    def finish(result):
+        result["query"] = query
+        result["raw_results"] = raw_results(docs)
+        return result
+
+    # "summarize": false면 요약 없이 검색 결과만 (lexical과 함께 쓰면 외부 호출 없음)
+    if not body.get("summarize", True):
+        return finish({})
+    return GenerationTask(
         query=f"'{query}'에 대해 교과서 내용을 기반으로 정리해주세요.",
         context_docs=docs,
         system_prompt="""당신은 맨큐의 경제학 제10판의 교과서 도우미입니다.
@@ -222,20 +881,34 @@ def handle_search(body):
 교과서에 없는 내용은 추측하지 마세요.
 핵심 개념, 정의, 예시를 포함하여 학생이 이해하기 쉽게 설명해주세요.
 한국어로 답변하세요.""",
-        temperature=0.3
+        temperature=0.3,
+        finish=finish
     )
 
-    result["query"] = query
-    result["raw_results"] = [
+
+def text_list(value):
+    """요청의 문자열 목록 값 → list (없으면 [], 문자열 하나면 [값], 빈 문자열이 섞이거나 목록이 아니면 None)"""
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, list) or not all(isinstance(v, str) and v.strip() for v in value):
+        return None
+    return value
+
+
+def raw_results(docs):
+    """검색 결과 → 응답용 요약 (본문 앞 300자 · 페이지 · 챕터 · 출처 · 유사도)"""
+    return [
         {
             "text": doc["text"][:300],
             "page": doc["metadata"].get("estimated_page"),
             "chapter": doc["metadata"].get("chapter"),
+            "source_file": doc["metadata"].get("source_file"),
             "similarity": doc.get("similarity", 0)
         }
         for doc in docs
     ]
-    return result
 
 
 def handle_quiz(body):
@@ -245,8 +918,15 @@ def handle_quiz(body):
     count = body.get("count", 5)
     question_types = body.get("types", ["multiple", "tf", "short"])
 
+    # 주제 없는 기본 퀴즈는 사전 생성본 (pregenerate.py)
+    if not topic and count == QUIZ_COUNT and sorted(question_types) == sorted(QUIZ_TYPES) \
+            and not body.get("fresh"):
+        stored = pregenerated_result("quiz", "default", chapter)
+        if stored:
+            return stored
+
     query = topic if topic else f"{chapter} 관련 핵심 개념"
-    docs = search_vectordb(query, n_results=6)
+    docs = search_chapter(chapter, 6, topic) or search_vectordb(query, n_results=6)
 
     if not docs:
         return {"error": "관련 내용을 찾을 수 없습니다."}
@@ -257,7 +937,7 @@ def handle_quiz(body):
         "short": "단답형"
     }.get(t, t) for t in question_types)
 
-    result = generate_with_context(
+    return GenerationTask(
         query=f"'{query}'에 대한 연습문제 {count}개를 만들어주세요. 문제 유형: {type_str}",
         context_docs=docs,
         system_prompt=f"""당신은 경제학 교수로서 맨큐의 경제학 제10판을 기반으로 연습문제를 출제합니다.
@@ -290,8 +970,6 @@ def handle_quiz(body):
         temperature=0.5
     )
 
-    return result
-
 
 def handle_exam(body):
     """시험문제 생성"""
@@ -300,11 +978,16 @@ def handle_exam(body):
     difficulty = body.get("difficulty", "medium")
     question_types = body.get("types", ["multiple", "tf", "short"])
 
-    # 챕터별 검색
-    all_docs = []
-    for ch in chapters[:5]:  # 최대 5개 챕터
-        docs = search_vectordb(f"Chapter {ch} 핵심 개념과 이론", n_results=3)
-        all_docs.extend(docs)
+    # 챕터별 자료 (챕터 색인에서 바로 꺼내고, 색인에 없는 챕터만 한 번에 묶어 의미 검색)
+    chapters = chapters[:5]  # 최대 5개 챕터
+    per_chapter = [search_chapter(ch, 3) for ch in chapters]
+    missing = [i for i, docs in enumerate(per_chapter) if docs is None]
+    if missing:
+        batch = search_vectordb_batch([f"Chapter {chapters[i]} 핵심 개념과 이론" for i in missing],
+                                      n_results=3, dedupe=True)
+        for i, docs in zip(missing, batch):
+            per_chapter[i] = docs
+    all_docs = [doc for docs in per_chapter for doc in docs]
 
     if not all_docs:
         # 일반 검색
@@ -318,7 +1001,7 @@ def handle_exam(body):
         "multiple": "객관식(4지선다)", "tf": "참/거짓", "short": "단답형", "essay": "서술형"
     }.get(t, t) for t in question_types)
 
-    result = generate_with_context(
+    return GenerationTask(
         query=f"맨큐의 경제학 시험문제 {count}개 출제. 난이도: {diff_label}, 유형: {type_str}",
         context_docs=all_docs[:10],
         system_prompt=f"""당신은 대학교 경제학 교수입니다. 맨큐의 경제학 제10판을 기반으로 시험문제를 출제합니다.
@@ -354,17 +1037,21 @@ def handle_exam(body):
         temperature=0.6
     )
 
-    return result
-
 
 def handle_lecture(body):
     """강의자료 생성"""
     chapter = body.get("chapter", "")
     topic = body.get("topic", "")
-    format_type = body.get("format", "notes")  # notes, slides, discussion
+    format_type = body.get("format", "notes")  # notes, slides, discussion, overview
+
+    # 주제 없이 챕터만 지정하면 사전 생성본 (pregenerate.py), 사용자 주제는 실시간 생성
+    if not topic and not body.get("fresh"):
+        stored = pregenerated_result("lecture", format_type, chapter)
+        if stored:
+            return stored
 
     query = topic if topic else f"Chapter {chapter}"
-    docs = search_vectordb(query, n_results=8)
+    docs = search_chapter(chapter, 8, topic) or search_vectordb(query, n_results=8)
 
     if not docs:
         return {"error": "관련 내용을 찾을 수 없습니다."}
@@ -376,7 +1063,7 @@ def handle_lecture(body):
         "overview": "수업 개요를 작성하세요. 학습 목표, 수업 진행표(시간대별 활동), 준비물을 포함하세요."
     }.get(format_type, "강의 노트 형식으로 작성하세요.")
 
-    result = generate_with_context(
+    return GenerationTask(
         query=f"'{query}'에 대한 강의자료를 만들어주세요.",
         context_docs=docs,
         system_prompt=f"""당신은 대학교 경제학 교수로서 맨큐의 경제학 제10판을 기반으로 강의자료를 작성합니다.
@@ -392,18 +1079,28 @@ def handle_lecture(body):
         temperature=0.5
     )
 
-    return result
-
 
 def handle_report(body):
     """보고서 초안 생성"""
     topic = body.get("topic", "")
+    topics = text_list(body.get("topics"))   # 여러 주제 (비교 분석 등) — 주제별 자료를 한 번에 검색
     chapter = body.get("chapter", "")
     report_type = body.get("type", "analysis")
     length = body.get("length", "medium")
 
-    query = topic if topic else f"Chapter {chapter} 관련 경제학 분석"
-    docs = search_vectordb(query, n_results=10)
+    if topics is None:
+        return {"error": "topics는 주제(문자열) 목록이어야 합니다."}
+    if len(topics) > 1:
+        where = chapter_index.where(chapter) if chapter_index and chapter else None
+        per_topic = max(3, 10 // len(topics))
+        batch = search_vectordb_batch(topics, n_results=per_topic, where_filter=where, dedupe=True)
+        # 주제를 번갈아 담아 앞쪽 컨텍스트가 한 주제에 쏠리지 않게
+        docs = [docs[i] for i in range(per_topic) for docs in batch if i < len(docs)]
+        topic = topic or ", ".join(topics)
+    else:
+        topic = topic or (topics[0] if topics else "")
+        query = topic if topic else f"Chapter {chapter} 관련 경제학 분석"
+        docs = search_chapter(chapter, 10, topic) or search_vectordb(query, n_results=10)
 
     if not docs:
         return {"error": "관련 내용을 찾을 수 없습니다."}
@@ -420,7 +1117,7 @@ def handle_report(body):
         "long": "A4 10매 이상 분량 (약 10000자 이상)"
     }.get(length, "A4 5-7매 분량")
 
-    result = generate_with_context(
+    return GenerationTask(
         query=f"'{topic}'에 대한 {type_label} 작성",
         context_docs=docs,
         system_prompt=f"""당신은 경제학 교수로서 학생의 보고서 작성을 도와줍니다.
@@ -448,8 +1145,6 @@ def handle_report(body):
         temperature=0.6
     )
 
-    return result
-
 
 def handle_chat(body):
     """일반 질의응답"""
@@ -462,7 +1157,7 @@ def handle_chat(body):
     if not docs:
         return {"error": "관련 내용을 찾을 수 없습니다. 다른 질문을 해보세요."}
 
-    result = generate_with_context(
+    return GenerationTask(
         query=query,
         context_docs=docs,
         system_prompt="""당신은 맨큐의 경제학 제10판 전문 교과서 도우미입니다.
@@ -477,8 +1172,6 @@ def handle_chat(body):
         temperature=0.4
     )
 
-    return result
-
 
 def handle_set_key(body):
     """API 키 설정"""
@@ -488,17 +1181,26 @@ def handle_set_key(body):
 
     init_services(key=new_key)
     
-    if genai and collection:
-        return {"status": "ok", "message": "API 키가 설정되었습니다.", "db_count": collection.count()}
+    if genai and retrieval_backend:
+        return {"status": "ok", "message": "API 키가 설정되었습니다.", "db_count": document_count()}
     elif genai:
         return {"status": "partial", "message": "API 키가 설정되었으나 ChromaDB가 초기화되지 않았습니다."}
     else:
         return {"error": "API 키 설정에 실패했습니다."}
 
 
+def document_count():
+    """검색 가능한 문서 수 (ChromaDB가 없으면 numpy 백엔드 기준)"""
+    if collection:
+        return collection.count()
+    if retrieval_backend:
+        return retrieval_backend.stats()["documents"]
+    return len(lexical_index) if lexical_index else 0
+
+
 def handle_status():
     """서버 상태 확인"""
-    db_count = collection.count() if collection else 0
+    db_count = document_count()
     meta_path = CHROMA_DIR / "metadata.json"
     meta = {}
     if meta_path.exists():
@@ -508,17 +1210,80 @@ def handle_status():
     return {
         "status": "ok",
         "gemini_api": "connected" if genai and api_key else "not_configured",
-        "chromadb": "connected" if collection else "not_available",
+        "chromadb": "connected" if retrieval_backend else "not_available",
         "document_count": db_count,
-        "embedding_model": EMBEDDING_MODEL,
+        "embedding_model": query_embedder.describe() if query_embedder else None,
         "generation_model": GENERATION_MODEL,
         "metadata": meta,
-        "api_key_set": bool(api_key)
+        "api_key_set": bool(api_key),
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+        "generation_cache": generation_cache.stats() if generation_cache else None,
+        "query_cache": {"embeddings": query_embedding_cache.stats(), "results": search_result_cache.stats()}
+                       if search_result_cache else None,
+        "chunk_store": {"chunks": len(chunk_store), "chapters": len(chunk_store.chapters)}
+                       if chunk_store else None,
+        "retrieval": retrieval_backend.stats() if retrieval_backend else None,
+        "search_mode": search_mode if lexical_index else "vector",
+        "lexical": lexical_index.stats() if lexical_index else None,
+        "chapter_index": chapter_index.stats() if chapter_index else None,
+        "pregenerated": pregenerated.stats() if pregenerated else None
     }
 
 
+# POST 경로 → 핸들러 (동기 · 비동기 서버 공용)
+API_ROUTES = {
+    "/api/search": cached_generation("search", handle_search),
+    "/api/quiz": cached_generation("quiz", handle_quiz),
+    "/api/exam": cached_generation("exam", handle_exam),
+    "/api/lecture": cached_generation("lecture", handle_lecture),
+    "/api/report": handle_report,
+    "/api/chat": handle_chat,
+    "/api/set-key": handle_set_key,
+}
+
+# 스트리밍 경로 → 핸들러 (같은 핸들러의 GenerationTask를 SSE로 흘려보냄)
+STREAM_ROUTES = {
+    "/api/chat/stream": handle_chat,
+    "/api/lecture/stream": cached_generation("lecture", handle_lecture),
+    "/api/report/stream": handle_report,
+}
+
+
 # ── HTTP 서버 ──
 
+class PooledHTTPServer(HTTPServer):
+    """고정 크기 워커 풀에서 요청을 동시에 처리하는 HTTPServer
+
+    워커가 모두 바쁘면 accept를 멈추고 연결을 OS 대기열(LISTEN_BACKLOG)에 남겨,
+    처리 중인 요청 수가 workers개를 넘지 않는다.
+    """
+
+    request_queue_size = LISTEN_BACKLOG
+
+    def __init__(self, server_address, handler_class, workers=SERVER_WORKERS):
+        super().__init__(server_address, handler_class)
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http")
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self._pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False)
+
+
 class RAGHandler(SimpleHTTPRequestHandler):
     """RAG API 요청 핸들러"""
 
@@ -557,20 +1322,18 @@ class RAGHandler(SimpleHTTPRequestHandler):
                 return
 
         # 라우팅
-        routes = {
-            "/api/search": handle_search,
-            "/api/quiz": handle_quiz,
-            "/api/exam": handle_exam,
-            "/api/lecture": handle_lecture,
-            "/api/report": handle_report,
-            "/api/chat": handle_chat,
-            "/api/set-key": handle_set_key,
-        }
-
-        handler = routes.get(parsed.path)
-        if handler:
+        handler = API_ROUTES.get(parsed.path)
+        if parsed.path in STREAM_ROUTES:
+            try:
+                result = STREAM_ROUTES[parsed.path](body)
+            except Exception as e:
+                traceback.print_exc()
+                self.send_json({"error": f"서버 오류: {str(e)}"}, 500)
+                return
+            self.send_event_stream(result)
+        elif handler:
             try:
-                result = handler(body)
+                result = dispatch(handler, body)
                 self.send_json(result)
             except Exception as e:
                 traceback.print_exc()
@@ -586,6 +1349,22 @@ class RAGHandler(SimpleHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
 
+    def send_event_stream(self, result):
+        """SSE 응답 전송 — 이벤트마다 바로 소켓에 씀 (연결을 닫아 스트림 끝을 알림)"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.send_cors_headers()
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for event, data in stream_events(result):
+                self.wfile.write(sse_event(event, data))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass   # 클라이언트가 중간에 끊음
+
     def send_cors_headers(self):
         """CORS 헤더"""
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -607,8 +1386,53 @@ def main():
     parser = argparse.ArgumentParser(description="맨큐의 경제학 RAG API 서버")
     parser.add_argument("--port", type=int, default=5000, help="서버 포트")
     parser.add_argument("--api-key", type=str, help="Gemini API 키")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS,
+                        help=f"동시에 처리할 요청 수 (기본: {SERVER_WORKERS}, 1 = 한 번에 하나씩)")
+    parser.add_argument("--async", dest="async_mode", action="store_true",
+                        help="asyncio 서버로 실행 (aiohttp 필요, 생성 · 쿼리 임베딩을 keep-alive 연결 풀로 호출, "
+                             "--workers는 검색 스레드 수)")
+    parser.add_argument("--upstream-pool", type=int, default=None,
+                        help="--async 모드의 업스트림(Gemini) 동시 연결 수 상한 (기본: 64)")
+    parser.add_argument("--no-embed-cache", action="store_true",
+                        help="디스크 임베딩 캐시(rag/cache/embeddings.sqlite)를 사용하지 않음")
+    parser.add_argument("--no-generation-cache", action="store_true",
+                        help="생성 결과 캐시(rag/cache/generations.sqlite)를 사용하지 않음")
+    parser.add_argument("--backend", choices=["auto", "chroma", "numpy", "ann", "shards"], default="auto",
+                        help="검색 백엔드 (auto: rag/data/vectors가 있으면 numpy, ann: rag/ann_index, "
+                             "shards: rag/chroma_db/shards.json의 샤드 컬렉션)")
+    parser.add_argument("--ann-index", choices=ANN_TYPES, default="hnsw",
+                        help="ann 백엔드가 읽을 색인 종류 (기본: hnsw)")
+    parser.add_argument("--ann-search-param", type=int, default=None,
+                        help="ann 검색 파라미터 efSearch/nprobe (기본: 색인을 만들 때 고른 값)")
+    parser.add_argument("--search-mode", choices=SEARCH_MODES, default="hybrid",
+                        help="검색 방식 (hybrid: 벡터 + BM25 순위 융합, lexical: 임베딩 API 호출 없이 BM25만)")
+    parser.add_argument("--no-query-cache", action="store_true",
+                        help="쿼리 임베딩 · 검색 결과 인메모리 캐시를 사용하지 않음")
+    parser.add_argument("--query-cache-size", type=int, default=QUERY_CACHE_SIZE,
+                        help=f"쿼리 캐시 최대 항목 수 (기본: {QUERY_CACHE_SIZE})")
+    parser.add_argument("--query-cache-ttl", type=int, default=QUERY_CACHE_TTL,
+                        help=f"쿼리 캐시 유효 시간 초 (0 = 만료 없음, 기본: {QUERY_CACHE_TTL})")
+    parser.add_argument("--mmap", action="store_true",
+                        help="numpy 백엔드 행렬을 RAM에 올리지 않고 mmap으로 사용")
+    parser.add_argument("--no-rescore", action="store_true",
+                        help="압축(또는 IVF-PQ) 검색 결과를 float32 원본으로 다시 채점하지 않음")
     args = parser.parse_args()
 
+    global embedding_cache_enabled, generation_cache_enabled, backend_choice, numpy_mmap, compact_rescore
+    global ann_kind, ann_search_param, search_mode
+    global query_cache_enabled, query_cache_size, query_cache_ttl
+    embedding_cache_enabled = not args.no_embed_cache
+    generation_cache_enabled = not args.no_generation_cache
+    backend_choice = args.backend
+    ann_kind = args.ann_index
+    ann_search_param = args.ann_search_param
+    search_mode = args.search_mode
+    numpy_mmap = args.mmap
+    compact_rescore = not args.no_rescore
+    query_cache_enabled = not args.no_query_cache
+    query_cache_size = args.query_cache_size
+    query_cache_ttl = args.query_cache_ttl
+
     print("+--------------------------------------------+")
     print("|  Mankiw Economics - RAG API Server         |")
     print("|  ChromaDB + Gemini API                     |")
@@ -618,9 +1442,22 @@ def main():
     init_services(key=args.api_key)
 
     # 서버 시작
-    server = HTTPServer(('localhost', args.port), RAGHandler)
-    
-    print(f"\n[START] Server: http://localhost:{args.port}")
+    if args.async_mode:
+        import async_server
+        try:
+            async_server.serve(sys.modules[__name__], port=args.port, workers=max(args.workers, 1),
+                               pool_size=args.upstream_pool or async_server.UPSTREAM_POOL_SIZE)
+        except ImportError as e:
+            print(f"[ERROR] {e}")
+            sys.exit(1)
+        return
+
+    if args.workers > 1:
+        server = PooledHTTPServer(('localhost', args.port), RAGHandler, workers=args.workers)
+    else:
+        server = HTTPServer(('localhost', args.port), RAGHandler)
+
+    print(f"\n[START] Server: http://localhost:{args.port} (workers: {max(args.workers, 1)})")
     print(f"[FILES] Static: {BASE_DIR}")
     print(f"[API]   Status: http://localhost:{args.port}/api/status")
     print(f"\n[INFO]  Press Ctrl+C to stop.\n")
@@ -0,0 +1,209 @@
+"""
+맨큐의 경제학 - Gemini API 로컬 스텁
+=====================================
+실제 API 키/쿼터 없이 임베딩 파이프라인의 동시성·속도 제한 동작과 서버 부하를 시험하기 위한
+Gemini 호환 HTTP 서버. 텍스트 해시로 만든 결정적 벡터를 돌려주고, 초당 요청 수가
+쿼터를 넘으면 429를 응답한다. HTTP/1.1 keep-alive를 지원하고 맺은 연결 수를 센다.
+
+지원 엔드포인트:
+  POST /v1beta/models/{model}:embedContent
+  POST /v1beta/models/{model}:batchEmbedContents
+  POST /v1beta/models/{model}:generateContent    (고정 형식의 짧은 응답, --gen-latency-ms 지연)
+  POST /v1beta/models/{model}:streamGenerateContent?alt=sse
+                                                 (같은 지연을 STUB_STREAM_CHUNKS개 조각에 나눠 SSE로 전송)
+  GET  /stats                                    (요청 · 429 · 텍스트 · 생성 · 연결 수)
+
+사용법:
+  python rag/stub_gemini.py --port 8765 --rps 5 --latency-ms 200
+  GEMINI_API_BASE=http://localhost:8765/v1beta python rag/pipeline.py --step embed --embed-workers 8
+  python rag/stub_gemini.py --rps 0 --latency-ms 20 --gen-latency-ms 1500   # 서버 부하 측정용
+"""
+
+import json
+import time
+import hashlib
+import argparse
+import threading
+from array import array
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+# ── 스텁 설정 (main에서 덮어씀) ──
+STUB_RPS = 5.0          # 초당 허용 요청 수 (0이면 무제한)
+STUB_LATENCY_MS = 200   # 요청당 인위적 지연
+STUB_DIM = 768          # 벡터 차원
+STUB_GEN_LATENCY_MS = 1000   # generateContent 지연 (생성 API 대기 시간 흉내)
+STUB_STREAM_CHUNKS = 8       # streamGenerateContent 응답 조각 수
+
+_window_lock = threading.Lock()
+_window = []            # 최근 1초간 허용된 요청 시각
+_stats = {"requests": 0, "throttled": 0, "texts": 0, "generations": 0, "connections": 0}
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def fake_vector(text, dim=None):
+    """텍스트 해시로 만든 결정적 단위 벡터"""
+    dim = dim or STUB_DIM
+    values = array("f")
+    counter = 0
+    while len(values) < dim:
+        digest = hashlib.sha256(f"{counter}\0{text}".encode("utf-8")).digest()
+        values.extend((b - 127.5) / 127.5 for b in digest)
+        counter += 1
+    del values[dim:]
+    norm = sum(v * v for v in values) ** 0.5 or 1.0
+    return [v / norm for v in values]
+
+
+def admit():
+    """슬라이딩 윈도우 쿼터 확인 — 초과하면 False"""
+    if STUB_RPS <= 0:
+        return True
+    now = time.monotonic()
+    with _window_lock:
+        while _window and now - _window[0] > 1.0:
+            _window.pop(0)
+        if len(_window) >= STUB_RPS:
+            return False
+        _window.append(now)
+        return True
+
+
+def request_text(request):
+    parts = request.get("content", request).get("parts", [])
+    return "".join(p.get("text", "") for p in parts)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive (한 연결로 여러 요청)
+
+    def setup(self):
+        super().setup()
+        with _window_lock:
+            _stats["connections"] += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length).decode("utf-8")) if length else {}
+        except json.JSONDecodeError:
+            self.send_json({"error": {"code": 400, "message": "Invalid JSON"}}, 400)
+            return
+
+        path = self.path.split("?", 1)[0]
+        with _window_lock:
+            _stats["requests"] += 1
+
+        if not admit():
+            with _window_lock:
+                _stats["throttled"] += 1
+            self.send_json({"error": {"code": 429, "message": "Resource has been exhausted",
+                                      "status": "RESOURCE_EXHAUSTED"}}, 429)
+            return
+
+        if path.endswith(":streamGenerateContent"):
+            prompt = "".join(request_text(c) for c in body.get("contents", []))
+            with _window_lock:
+                _stats["generations"] += 1
+            self.send_stream(prompt)
+            return
+
+        if path.endswith(":generateContent"):
+            time.sleep(STUB_GEN_LATENCY_MS / 1000)
+            prompt = "".join(request_text(c) for c in body.get("contents", []))
+            with _window_lock:
+                _stats["generations"] += 1
+            self.send_json({"candidates": [{
+                "content": {"role": "model", "parts": [{"text": f"[stub] 프롬프트 {len(prompt)}자에 대한 응답입니다."}]},
+                "finishReason": "STOP"}]})
+            return
+
+        time.sleep(STUB_LATENCY_MS / 1000)
+
+        if path.endswith(":batchEmbedContents"):
+            texts = [request_text(r) for r in body.get("requests", [])]
+            with _window_lock:
+                _stats["texts"] += len(texts)
+            self.send_json({"embeddings": [{"values": fake_vector(t, r.get("outputDimensionality"))}
+                                           for t, r in zip(texts, body.get("requests", []))]})
+        elif path.endswith(":embedContent"):
+            with _window_lock:
+                _stats["texts"] += 1
+            self.send_json({"embedding": {"values": fake_vector(request_text(body),
+                                                                body.get("outputDimensionality"))}})
+        else:
+            self.send_json({"error": {"code": 404, "message": f"Unknown endpoint: {path}"}}, 404)
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] == "/stats":
+            with _window_lock:
+                self.send_json(dict(_stats))
+        else:
+            self.send_json({"error": {"code": 404, "message": "Not found"}}, 404)
+
+    def send_stream(self, prompt):
+        """생성 응답을 조각마다 지연을 두고 SSE(data: JSON)로 전송, 연결을 닫아 끝을 알림"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for i in range(STUB_STREAM_CHUNKS):
+            time.sleep(STUB_GEN_LATENCY_MS / 1000 / STUB_STREAM_CHUNKS)
+            chunk = {"candidates": [{"content": {"role": "model", "parts": [
+                {"text": f"[stub {i + 1}/{STUB_STREAM_CHUNKS}] 프롬프트 {len(prompt)}자에 대한 응답입니다.\n"}]}}]}
+            if i == STUB_STREAM_CHUNKS - 1:
+                chunk["candidates"][0]["finishReason"] = "STOP"
+            try:
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\r\n\r\n".encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+    def send_json(self, data, status=200):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    global STUB_RPS, STUB_LATENCY_MS, STUB_DIM, STUB_GEN_LATENCY_MS
+
+    parser = argparse.ArgumentParser(description="Gemini API 로컬 스텁 (임베딩 · 생성)")
+    parser.add_argument("--port", type=int, default=8765, help="포트 (기본: 8765)")
+    parser.add_argument("--rps", type=float, default=STUB_RPS, help="초당 허용 요청 수, 0=무제한")
+    parser.add_argument("--latency-ms", type=int, default=STUB_LATENCY_MS, help="요청당 지연 (ms)")
+    parser.add_argument("--dim", type=int, default=STUB_DIM, help="벡터 차원")
+    parser.add_argument("--gen-latency-ms", type=int, default=STUB_GEN_LATENCY_MS,
+                        help="generateContent 요청당 지연 (ms)")
+    args = parser.parse_args()
+
+    STUB_RPS = args.rps
+    STUB_LATENCY_MS = args.latency_ms
+    STUB_DIM = args.dim
+    STUB_GEN_LATENCY_MS = args.gen_latency_ms
+
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), StubHandler)
+    print(f"[STUB] Gemini 스텁: http://localhost:{args.port}/v1beta "
+          f"(쿼터 {args.rps:g} req/s · 지연 {args.latency_ms}ms · 생성 {args.gen_latency_ms}ms · {args.dim}차원)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        with _window_lock:
+            print(f"\n[STUB] 종료 — 요청 {_stats['requests']} · 429 {_stats['throttled']} · "
+                  f"텍스트 {_stats['texts']} · 생성 {_stats['generations']} · 연결 {_stats['connections']}")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
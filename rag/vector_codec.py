@@ -0,0 +1,229 @@
+"""
+맨큐의 경제학 - 압축 벡터 저장
+================================
+ChromaDB에 저장된 float32 임베딩을 그대로(float32) 또는 float16 · int8(벡터별
+스케일)로 양자화해 rag/data/vectors/에 저장하고, 저장된 형태 그대로 전수 검색한다.
+압축 형식은 상위 후보를 선택적으로 원래 정밀도(float32) 벡터로 다시 채점(rescore)한다.
+
+행 순서는 청크 저장소(chunks.bin)의 순번과 같으므로 검색 결과 행 번호로 바로
+청크 텍스트·메타데이터를 읽을 수 있다. 거리는 ChromaDB 기본 공간(l2, 제곱 거리)과
+같은 값이므로 server.py의 similarity(1 - distance) 계산이 그대로 유지된다.
+
+pipeline.py --step compact가 파일을 만들고, server.py가 있으면 읽어 사용한다.
+numpy 필요: pip install numpy
+"""
+
+import json
+import math
+from pathlib import Path
+
+CODECS = ("float32", "float16", "int8")
+RESCORE_FACTOR = 4          # rescore 시 압축 검색에서 가져올 후보 배수 (k × 이 값)
+SEARCH_BLOCK_ROWS = 65536   # 한 번에 float32로 풀어 계산하는 행 수 (임시 메모리 상한)
+META_FILE = "meta.json"
+
+
+def _numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("numpy 설치 필요: pip install numpy")
+    return np
+
+
+def normalize_values(values):
+    """벡터(list)를 단위 길이로 정규화 — outputDimensionality로 줄인 Gemini 임베딩용"""
+    norm = math.sqrt(sum(v * v for v in values))
+    return [v / norm for v in values] if norm else list(values)
+
+
+def quantize(matrix, codec):
+    """float32 행렬 → (압축 데이터, 벡터별 스케일 또는 None)"""
+    np = _numpy()
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if codec == "float32":
+        return np.ascontiguousarray(matrix), None
+    if codec == "float16":
+        return matrix.astype(np.float16), None
+    if codec == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        data = np.rint(matrix / scales[:, None]).clip(-127, 127).astype(np.int8)
+        return data, scales.astype(np.float32)
+    raise ValueError(f"지원하지 않는 코덱: {codec} (가능: {', '.join(CODECS)})")
+
+
+def l2_distances(matrix, query):
+    """행렬의 각 행과 쿼리 사이의 제곱 l2 거리 (float32)"""
+    np = _numpy()
+    diff = np.asarray(matrix, dtype=np.float32) - np.asarray(query, dtype=np.float32)
+    return np.einsum("ij,ij->i", diff, diff)
+
+
+def top_k(distances, k):
+    """거리가 가장 작은 k개의 행 번호 (가까운 순)"""
+    np = _numpy()
+    k = min(k, len(distances))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    rows = np.argpartition(distances, k - 1)[:k]
+    return rows[np.argsort(distances[rows], kind="stable")]
+
+
+class CompactVectors:
+    """압축 벡터 행렬 (행 = 청크 순번) + 검색
+
+    data: float32 · float16 · int8 [n, dim], scales: int8일 때 벡터별 스케일 [n],
+    sq_norms: 원래 float32 벡터의 제곱 노름 [n] (l2 거리 계산용),
+    valid: 컬렉션에 벡터가 있는 행 [n] (bool)
+    """
+
+    def __init__(self, codec, data, scales, sq_norms, valid, meta=None):
+        self.codec = codec
+        self.data = data
+        self.scales = scales
+        self.sq_norms = sq_norms
+        self.valid = valid
+        self.meta = meta or {}
+
+    @classmethod
+    def from_matrix(cls, matrix, valid, codec, meta=None):
+        np = _numpy()
+        matrix = np.asarray(matrix, dtype=np.float32)
+        data, scales = quantize(matrix, codec)
+        sq_norms = np.einsum("ij,ij->i", matrix, matrix).astype(np.float32)
+        meta = dict(meta or {}, codec=codec, count=int(matrix.shape[0]), dim=int(matrix.shape[1]))
+        return cls(codec, data, scales, sq_norms, np.asarray(valid, dtype=bool), meta)
+
+    @property
+    def dim(self):
+        return self.data.shape[1]
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def nbytes(self):
+        """검색에 쓰이는 압축 데이터 크기 (바이트)"""
+        total = self.data.nbytes + self.sq_norms.nbytes + self.valid.nbytes
+        if self.scales is not None:
+            total += self.scales.nbytes
+        return total
+
+    def save(self, directory):
+        np = _numpy()
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "data.npy", self.data)
+        np.save(directory / "sq_norms.npy", self.sq_norms)
+        np.save(directory / "valid.npy", self.valid)
+        if self.scales is not None:
+            np.save(directory / "scales.npy", self.scales)
+        else:
+            (directory / "scales.npy").unlink(missing_ok=True)
+        with open(directory / META_FILE, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """저장된 벡터를 엶 (mmap=False면 연속 메모리로 모두 읽음, 파일이 없으면 None)"""
+        np = _numpy()
+        directory = Path(directory)
+        meta_path = directory / META_FILE
+        if not meta_path.exists():
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        scales_path = directory / "scales.npy"
+        return cls(
+            meta["codec"],
+            np.load(directory / "data.npy", mmap_mode=mode),
+            np.load(scales_path, mmap_mode=mode) if scales_path.exists() else None,
+            np.load(directory / "sq_norms.npy", mmap_mode=mode),
+            np.load(directory / "valid.npy", mmap_mode=mode),
+            meta,
+        )
+
+    def distances_batch(self, queries, mask=None):
+        """쿼리 [m, dim] × 모든 행의 제곱 l2 거리 [m, n] (유효하지 않거나 mask 밖인 행은 inf)
+
+        float32 행렬은 블록 하나(≤ SEARCH_BLOCK_ROWS행)면 행렬곱 한 번으로 끝난다.
+        """
+        np = _numpy()
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        out = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, len(self))
+            block = self.data[start:end]
+            if block.dtype != np.float32:
+                block = block.astype(np.float32)
+            dots = queries @ block.T
+            if self.scales is not None:
+                dots *= self.scales[start:end]
+            out[:, start:end] = self.sq_norms[start:end] - 2.0 * dots
+        out += np.einsum("ij,ij->i", queries, queries)[:, None]
+        out[:, ~np.asarray(self.valid)] = np.inf
+        if mask is not None:
+            out[:, ~mask] = np.inf
+        return out
+
+    def distances(self, query, mask=None):
+        """모든 행과 쿼리 사이의 제곱 l2 거리"""
+        return self.distances_batch([query], mask)[0]
+
+    def search_batch(self, queries, k, mask=None, rescore=None, factor=RESCORE_FACTOR):
+        """쿼리마다 최근접 k개 → [(행 번호 배열, 거리 배열), ...]
+
+        rescore가 주어지면 k × factor개 후보를 뽑은 뒤 rescore(행 번호 배열)가 돌려주는
+        float32 원본 벡터로 거리를 다시 계산해 상위 k개를 고른다.
+        """
+        np = _numpy()
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        distances = self.distances_batch(queries, mask)
+        limit = int(np.isfinite(distances[0]).sum()) if len(queries) else 0
+        n = min(k * factor if rescore else k, limit)
+        if n <= 0:
+            empty = np.empty(0, dtype=np.int64)
+            return [(empty, np.empty(0, dtype=np.float32)) for _ in queries]
+
+        if n < distances.shape[1]:
+            candidates = np.argpartition(distances, n - 1, axis=1)[:, :n]
+        else:
+            candidates = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+        results = []
+        for query, dist, rows in zip(queries, distances, candidates):
+            rows = rows[np.argsort(dist[rows], kind="stable")]
+            if rescore is None:
+                results.append((rows, dist[rows]))
+                continue
+            exact = l2_distances(rescore(rows), query)
+            order = np.argsort(exact, kind="stable")[:k]
+            results.append((rows[order], exact[order]))
+        return results
+
+    def search(self, query, k, mask=None, rescore=None, factor=RESCORE_FACTOR):
+        """근사(float32면 정확한) 최근접 k개 → (행 번호 배열, 거리 배열)"""
+        return self.search_batch([query], k, mask, rescore, factor)[0]
+
+
+def exact_search(matrix, query, k, valid=None):
+    """float32 전수 검색 (정답 기준) → 행 번호 배열"""
+    np = _numpy()
+    matrix = np.asarray(matrix, dtype=np.float32)
+    query = np.asarray(query, dtype=np.float32)
+    distances = np.einsum("ij,ij->i", matrix, matrix) - 2.0 * (matrix @ query)
+    if valid is not None:
+        distances[~valid] = np.inf
+    return top_k(distances, k)
+
+
+def recall_at_k(truth, approx):
+    """정답 상위 k개 중 근사 결과에 포함된 비율 (쿼리 평균)"""
+    if not truth:
+        return 0.0
+    total = 0.0
+    for t, a in zip(truth, approx):
+        t = set(t)
+        total += len(t & set(a)) / max(len(t), 1)
+    return total / len(truth)
@@ -0,0 +1,92 @@
+"""rag/의 모듈은 서로를 최상위 이름으로 import하므로 (python rag/pipeline.py로 실행) 테스트도 rag/를 경로에 넣는다."""
+
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+RAG_DIR = Path(__file__).resolve().parent.parent / "rag"
+sys.path.insert(0, str(RAG_DIR))
+
+import stub_gemini  # noqa: E402
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    """같은 프로세스에서 띄운 Gemini 스텁 (지연 없음, 쿼터 무제한) → api_base URL
+
+    테스트에서 stub_gemini.STUB_RPS 등을 monkeypatch로 바꿔 429를 흉내 낼 수 있다.
+    """
+    monkeypatch.setattr(stub_gemini, "STUB_RPS", 0)
+    monkeypatch.setattr(stub_gemini, "STUB_LATENCY_MS", 0)
+    monkeypatch.setattr(stub_gemini, "STUB_GEN_LATENCY_MS", 0)
+    monkeypatch.setattr(stub_gemini, "_window", [])
+    monkeypatch.setattr(stub_gemini, "_stats", dict.fromkeys(stub_gemini._stats, 0))
+    server = stub_gemini.ThreadingHTTPServer(("127.0.0.1", 0), stub_gemini.StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """청크 120개 저장소 (책 두 권 · 챕터 세 개) + 같은 순서의 단위 벡터 행렬 (32차원) → (store, matrix)"""
+    np = pytest.importorskip("numpy")
+    from chunk_store import ChunkStore, ChunkStoreWriter
+
+    rng = np.random.default_rng(7)
+    matrix = rng.standard_normal((120, 32)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    path = tmp_path / "chunks.bin"
+    with ChunkStoreWriter(path) as writer:
+        for i in range(120):
+            writer.add({
+                "id": f"chunk_{i:04d}",
+                "text": f"청크 {i}번 본문",
+                "metadata": {"source_file": "book.pdf" if i < 80 else "notes.pdf", "estimated_page": i // 4 + 1,
+                             "chapter": f"Chapter {i // 40 + 1}", "part": f"Part {i // 60 + 1}",
+                             "char_count": 10, "chunk_index": i + 1},
+            })
+    store = ChunkStore(path)
+    yield store, matrix
+    store.close()
+
+
+@pytest.fixture
+def rag_server(corpus, tmp_path, monkeypatch):
+    """corpus를 NumpyBackend로 검색하는 server.py 상태 (어휘·챕터 색인 · 사전 생성본 없음, 생성은 컨텍스트만 돌려줌)
+
+    → 쿼리 임베더 (calls: embed 호출마다 텍스트 목록). 생성 결과는 {"docs": 컨텍스트 문서}.
+    """
+    np = pytest.importorskip("numpy")
+    import server
+    from embedder import HashingEmbedder
+    from retrieval import NumpyBackend
+    from vector_codec import CompactVectors
+
+    class CountingEmbedder(HashingEmbedder):
+        def __init__(self):
+            super().__init__(dim=32)
+            self.calls = []
+
+        def embed(self, texts, task_type="RETRIEVAL_DOCUMENT", use_cache=True):
+            self.calls.append(list(texts))
+            return super().embed(texts, task_type, use_cache)
+
+    store, matrix = corpus
+    embedder = CountingEmbedder()
+    vectors = CompactVectors.from_matrix(matrix, np.ones(len(matrix), dtype=bool), "float32")
+    monkeypatch.setattr(server, "chunk_store", store)
+    monkeypatch.setattr(server, "retrieval_backend", NumpyBackend(vectors, store))
+    monkeypatch.setattr(server, "query_embedder", embedder)
+    monkeypatch.setattr(server, "lexical_index", None)
+    monkeypatch.setattr(server, "chapter_index", None)
+    monkeypatch.setattr(server, "PREGENERATED_DIR", tmp_path / "pregenerated")
+    monkeypatch.setattr(server, "pregenerated", None)
+    monkeypatch.setattr(server, "pregenerated_mtime", None)
+    monkeypatch.setattr(server, "generate_with_context",
+                        lambda query, context_docs, system_prompt, temperature=0.7: {"docs": context_docs})
+    return embedder
@@ -0,0 +1,59 @@
+"""비동기 서빙 모드 (async_server.py): 연결 풀 transport 주입 · 상태 API"""
+
+import asyncio
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+
+import async_server  # noqa: E402
+import server  # noqa: E402
+import stub_gemini  # noqa: E402
+from embedder import GeminiEmbedder  # noqa: E402
+
+
+@pytest.fixture
+def query_embedder(stub_server, monkeypatch):
+    embedder = GeminiEmbedder("stub", api_base=stub_server, dim=8)
+    monkeypatch.setattr(server, "query_embedder", embedder)
+    monkeypatch.setattr(server, "embedder_transport", None)
+    return embedder
+
+
+def test_transport_is_injected_into_the_servers_embedder_only(query_embedder, stub_server):
+    other = GeminiEmbedder("stub", api_base=stub_server, dim=8)
+
+    async def scenario():
+        client = TestClient(TestServer(async_server.build_app(server, workers=2, pool_size=4)))
+        await client.start_server()
+        try:
+            assert query_embedder.transport is not None
+            assert other.transport is None and GeminiEmbedder.transport is None
+
+            # 검색 스레드에서 보낸 쿼리 임베딩이 이벤트 루프의 연결 풀을 거침
+            loop = asyncio.get_running_loop()
+            for text in ("기회비용", "비교우위", "탄력성"):
+                vector = await loop.run_in_executor(None, query_embedder.embed_query, text, False)
+                assert len(vector) == 8
+            resp = await client.get("/api/status")
+            upstream = (await resp.json())["upstream"]
+            assert upstream["requests"] == 3
+            assert upstream["connections_created"] == 1 and upstream["connections_reused"] == 2
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+    assert query_embedder.transport is None and server.embedder_transport is None
+    assert stub_gemini._stats["connections"] == 1
+
+
+def test_set_embedder_transport_returns_previous_for_restore(query_embedder):
+    def transport(url, body, timeout):
+        return {"embedding": {"values": [1.0, 0.0]}}
+
+    previous = server.set_embedder_transport(transport)
+    assert previous is None and query_embedder.transport is transport
+    assert server.set_embedder_transport(previous) is transport
+    assert query_embedder.transport is None
@@ -0,0 +1,71 @@
+"""챕터 색인 (chapter_index.py): 챕터 값 해석 · 고른 표본 · 챕터 요청의 임베딩 생략"""
+
+import pytest
+
+import server
+from chapter_index import ChapterIndex, build_chapter_index, chapter_number
+
+
+@pytest.fixture
+def index(corpus, tmp_path):
+    store, _ = corpus
+    data = build_chapter_index(store, tmp_path / "chapter_index.json")
+    assert data["chunks"] == store.digest and data["count"] == len(store)
+    return ChapterIndex.load(tmp_path / "chapter_index.json")
+
+
+def test_chapter_number_parses_request_values():
+    assert [chapter_number(v) for v in (4, "4", "Chapter 4: 수요와 공급", "제4장", "부록")] == [4, 4, 4, 4, None]
+
+
+def test_index_groups_contiguous_ranges(index, tmp_path):
+    # corpus: 청크 40개마다 챕터가 바뀜 (Chapter 1 · 2 · 3)
+    assert len(index) == 3
+    assert index.chapters["Chapter 2"]["ranges"] == [[40, 80]]
+    assert index.chapters["Chapter 3"]["source_files"] == ["notes.pdf"]
+    assert index.chapters["Chapter 2"]["pages"] == [11, 20]
+    assert index.resolve(2) == index.resolve("제2장") == index.resolve("Chapter 2") == ["Chapter 2"]
+    assert index.resolve(9) == [] and index.resolve("") == [] and index.where("부록") is None
+    assert index.where("2") == {"chapter": "Chapter 2"}
+    assert ChapterIndex.load(tmp_path / "missing.json") is None
+
+
+def test_sample_spreads_over_whole_chapter(index):
+    rows = index.sample(2, 4)
+    assert rows == [45, 55, 65, 75]
+    assert index.sample(2, 100) == list(range(40, 80))
+
+
+@pytest.mark.parametrize("handler, body", [
+    (server.handle_exam, {"chapters": [2, "3"]}),
+    (server.handle_lecture, {"chapter": "제2장"}),
+    (server.handle_report, {"chapter": "Chapter 2"}),
+])
+def test_indexed_chapter_requests_skip_query_embedding(rag_server, index, monkeypatch, handler, body):
+    monkeypatch.setattr(server, "chapter_index", index)
+
+    docs = server.dispatch(handler, body)["docs"]
+
+    assert docs and rag_server.calls == []
+    wanted = body.get("chapters") or [body["chapter"]]
+    names = {name for ch in wanted for name in index.resolve(ch)}
+    assert {d["metadata"]["chapter"] for d in docs} == names
+
+
+def test_topic_narrows_search_to_chapter(rag_server, index, monkeypatch):
+    monkeypatch.setattr(server, "chapter_index", index)
+
+    docs = server.dispatch(server.handle_lecture, {"chapter": 3, "topic": "환율과 무역"})["docs"]
+
+    assert len(rag_server.calls) == 1
+    assert docs and all(d["metadata"]["chapter"] == "Chapter 3" for d in docs)
+
+
+def test_unknown_chapter_falls_back_to_search(rag_server, index, monkeypatch):
+    monkeypatch.setattr(server, "chapter_index", index)
+
+    lecture = server.dispatch(server.handle_lecture, {"chapter": 9})["docs"]
+    exam = server.dispatch(server.handle_exam, {"chapters": [9]})["docs"]
+
+    assert len(lecture) == 8 and len(exam) == 3
+    assert rag_server.calls == [["Chapter 9"], ["Chapter 9 핵심 개념과 이론"]]
@@ -0,0 +1,76 @@
+"""청크 ID: 내용 기반 ID · 중복 텍스트의 위치 접미사 · 재청킹 ID 대응표"""
+
+import pipeline
+
+BOILERPLATE = "이 페이지는 저작권 보호를 받습니다. 무단 복제를 금합니다. " * 4
+
+
+def page(n, text=None, source="book.pdf"):
+    return {"source_file": source, "estimated_page": n,
+            "text": text or f"본문 {n}쪽: 수요와 공급의 균형에 대한 설명입니다. " * 5}
+
+
+def ids_by_page(pages, **kwargs):
+    return {(c["metadata"]["source_file"], c["metadata"]["estimated_page"]): c["id"]
+            for c in pipeline.iter_chunks(pages, **kwargs)}
+
+
+def test_ids_do_not_shift_when_a_page_is_inserted():
+    before = ids_by_page([page(1), page(2), page(3)])
+    after = ids_by_page([page(1), page(9, "새로 추가된 페이지의 본문입니다. " * 5), page(2), page(3)])
+
+    for key, chunk_id in before.items():
+        assert after[key] == chunk_id
+    text = next(pipeline.iter_chunks([page(2)]))["text"]
+    assert before[("book.pdf", 2)] == pipeline.chunk_content_id(text)
+
+
+def test_duplicate_text_gets_positional_suffix():
+    pages = [page(1, BOILERPLATE), page(2), page(3, BOILERPLATE), page(4, BOILERPLATE)]
+    ids = ids_by_page(pages)
+
+    assert len(set(ids.values())) == len(ids)
+    base = pipeline.chunk_content_id(next(pipeline.iter_chunks([page(1, BOILERPLATE)]))["text"])
+    assert ids[("book.pdf", 1)] == base
+    for n in (3, 4):
+        assert ids[("book.pdf", n)].startswith(base + "_")
+
+
+def test_suffix_does_not_depend_on_occurrence_order():
+    # 앞쪽에 같은 텍스트가 하나 더 생겨도 기존 중복 청크의 ID는 그대로
+    before = ids_by_page([page(1, BOILERPLATE), page(2), page(5, BOILERPLATE), page(9, BOILERPLATE)])
+    after = ids_by_page([page(1, BOILERPLATE), page(2), page(3, BOILERPLATE),
+                         page(5, BOILERPLATE), page(9, BOILERPLATE)])
+
+    for key in (("book.pdf", 1), ("book.pdf", 2), ("book.pdf", 5), ("book.pdf", 9)):
+        assert before[key] == after[key]
+
+
+def test_cross_page_ids_are_unique():
+    pages = [page(n, BOILERPLATE) for n in range(1, 6)] + [page(n, BOILERPLATE, "notes.pdf") for n in range(1, 3)]
+    chunks = list(pipeline.iter_chunks(pages, cross_page=True))
+    assert len({c["id"] for c in chunks}) == len(chunks)
+
+
+def test_seen_digests_are_exact_and_grow():
+    seen = pipeline.SeenDigests(capacity=4)
+    keys = [pipeline.chunk_content_id(f"청크 {i}") for i in range(5000)]
+
+    # 블룸 필터와 달리 처음 나온 키는 하나도 중복으로 판정하지 않음 (여러 번 커져도)
+    assert not any(seen.add(key) for key in keys)
+    assert all(seen.add(key) for key in keys)
+    assert len(seen) == len(keys) and len(seen._table) == 16384
+
+
+def test_chunk_id_map_renames_each_duplicate_once():
+    old = [{"id": "old_1", "text": BOILERPLATE, "metadata": {"p": 1}},
+           {"id": "old_2", "text": BOILERPLATE, "metadata": {"p": 3}},
+           {"id": "same", "text": "변하지 않은 청크", "metadata": {"p": 2}}]
+    new = [{"id": "new_1", "text": BOILERPLATE, "metadata": {"p": 1}},
+           {"id": "same", "text": "변하지 않은 청크", "metadata": {"p": 4}},
+           {"id": "new_2", "text": BOILERPLATE, "metadata": {"p": 3}}]
+
+    id_map = pipeline.build_chunk_id_map(old, new)
+
+    assert id_map["renamed"] == {"old_1": "new_1", "old_2": "new_2"}
+    assert id_map["metadata_changed"] == ["same"]
@@ -0,0 +1,97 @@
+"""열 지향 청크 저장소 (chunk_store.py): 레코드 왕복 · 사전 인코딩 · 지문 · 이전 형식 변환"""
+
+import json
+
+import pytest
+
+import pipeline
+from chunk_store import ChunkStore, ChunkStoreWriter, iter_chunk_records
+
+
+def make_chunk(i, text=None, chapter="Chapter 1: 경제학의 10대 원리", source="001-100.pdf"):
+    text = text or f"{i}번 청크: 기회비용은 포기한 것의 가치이다. Trade can make everyone better off."
+    return {"id": f"chunk_{i:016x}", "text": text,
+            "metadata": {"source_file": source, "estimated_page": i // 3 + 1, "chapter": chapter,
+                         "part": "Part 1: 도입", "char_count": len(text), "chunk_index": i + 1}}
+
+
+def write_store(path, chunks):
+    with ChunkStoreWriter(path) as writer:
+        for chunk in chunks:
+            writer.add(chunk)
+    return ChunkStore(path)
+
+
+@pytest.fixture
+def chunks():
+    return ([make_chunk(i) for i in range(5)]
+            + [make_chunk(5, "짧은 청크 🙂", chapter="Chapter 2: 생각하는 경제학자", source="101-200.pdf"),
+               make_chunk(6, "", chapter="Chapter 1: 경제학의 10대 원리")])
+
+
+def test_records_round_trip(tmp_path, chunks):
+    with write_store(tmp_path / "chunks.bin", chunks) as store:
+        assert len(store) == len(chunks)
+        assert list(store) == chunks
+        assert store[-1] == chunks[-1]
+        # chunks.jsonl 시절과 같은 키 순서 (ChromaDB 메타데이터 · 지문이 그대로 유지됨)
+        assert json.dumps(store[5], ensure_ascii=False) == json.dumps(chunks[5], ensure_ascii=False)
+        assert bytes(store.text_view(5)) == "짧은 청크 🙂".encode("utf-8")
+        assert store.chapters == ["Chapter 1: 경제학의 10대 원리", "Chapter 2: 생각하는 경제학자"]
+        assert list(store.chapter_ids) == [0, 0, 0, 0, 0, 1, 0]
+        assert store.index_of(chunks[3]["id"]) == 3 and store.index_of("chunk_missing") is None
+        with pytest.raises(IndexError):
+            store[len(chunks)]
+
+
+def test_digest_tracks_content_not_file(tmp_path, chunks):
+    with write_store(tmp_path / "a.bin", chunks) as a, write_store(tmp_path / "b.bin", chunks) as b:
+        assert a.digest == b.digest
+    changed = chunks[:-1] + [make_chunk(6, "바뀐 텍스트")]
+    with write_store(tmp_path / "c.bin", changed) as c:
+        assert c.digest != a.digest
+
+
+def test_empty_store_and_bad_file(tmp_path):
+    with write_store(tmp_path / "empty.bin", []) as store:
+        assert len(store) == 0 and list(store) == []
+    (tmp_path / "bad.bin").write_bytes(b"not a chunk store")
+    with pytest.raises(ValueError):
+        ChunkStore(tmp_path / "bad.bin")
+
+
+def test_iter_chunk_records_reads_both_formats(tmp_path, chunks):
+    write_store(tmp_path / "chunks.bin", chunks).close()
+    legacy = tmp_path / "chunks.jsonl"
+    legacy.write_text("".join(json.dumps(c, ensure_ascii=False) + "\n" for c in chunks), encoding="utf-8")
+
+    assert list(iter_chunk_records(tmp_path / "chunks.bin")) == chunks
+    assert list(iter_chunk_records(legacy)) == chunks
+
+
+def test_step2_migrates_legacy_chunks_jsonl(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for name, path in {"DATA_DIR": data_dir, "MANIFEST_PATH": data_dir / "manifest.json",
+                       "CHUNK_ID_MAP_PATH": data_dir / "chunk_id_map.json",
+                       "CHUNK_STORE_PATH": data_dir / "chunks.bin",
+                       "LEGACY_CHUNKS_PATH": data_dir / "chunks.jsonl",
+                       "LEXICAL_INDEX_PATH": data_dir / "lexical.bin",
+                       "CHAPTER_INDEX_PATH": data_dir / "chapter_index.json"}.items():
+        monkeypatch.setattr(pipeline, name, path)
+    text = ("Markets are usually a good way to organize economic activity. " * 5).strip()
+    (data_dir / "extracted_pages.jsonl").write_text(json.dumps(
+        {"source_file": "book.pdf", "page_index": 0, "estimated_page": 1, "text": text}) + "\n", encoding="utf-8")
+    legacy = {"id": "chunk_00001", "text": text,
+              "metadata": {"source_file": "book.pdf", "estimated_page": 1, "chapter": "Unknown",
+                           "part": "Unknown", "char_count": len(text), "chunk_index": 1}}
+    pipeline.LEGACY_CHUNKS_PATH.write_text(json.dumps(legacy) + "\n", encoding="utf-8")
+
+    assert pipeline.step2_chunk_text()
+
+    assert not pipeline.LEGACY_CHUNKS_PATH.exists()
+    with ChunkStore(pipeline.CHUNK_STORE_PATH) as store:
+        new_id = store.chunk_id(0)
+        assert store.text(0) == legacy["text"]
+    id_map = json.loads(pipeline.CHUNK_ID_MAP_PATH.read_text(encoding="utf-8"))
+    assert id_map["renamed"] == {"chunk_00001": new_id}
@@ -0,0 +1,125 @@
+"""Step 2 (청킹): 오프셋 기반 청크 분할 · 페이지 경계를 넘는 청킹"""
+
+import pytest
+
+import pipeline
+from pipeline import create_chunks, iter_chunk_spans
+
+SMALL = dict(chunk_size=50, overlap=10, min_size=5)
+
+
+def spans(text, **params):
+    return [(start, end, text[start:end]) for start, end in iter_chunk_spans(text, **params)]
+
+
+def test_text_without_boundaries_is_one_chunk():
+    # 문장 경계가 없으면 단어 중간에서 자르지 않고 통째로 한 청크
+    text = "x" * 120
+    assert spans(text, **SMALL) == [(0, 120, text)]
+
+
+def test_long_sentence_is_kept_whole_with_overlap_before_it():
+    text = "Short one. " + "L" * 70 + ". Tail end here."
+    chunks = spans(text, **SMALL)
+
+    assert [c[2] for c in chunks] == ["Short one.", "Short one. " + "L" * 70 + ".", "L" * 9 + ". Tail end here."]
+    # 앞 청크가 overlap보다 짧으면 앞 청크 전체가 오버랩이 됨 (이전 청커와 같은 동작)
+    assert chunks[1][0] == chunks[0][0]
+
+
+def test_overlap_start_skips_whitespace():
+    text = "aaaa bbbb. " * 8
+    chunks = spans(text, **SMALL)
+
+    assert len(chunks) > 2
+    for (_, prev_end, _), (start, _, chunk) in zip(chunks, chunks[1:]):
+        assert prev_end - SMALL["overlap"] <= start < prev_end
+        assert not chunk[0].isspace() and chunk == chunk.strip()
+
+
+def test_whitespace_only_text_has_no_chunks():
+    assert spans(" \n\n " * 40, **SMALL) == []
+    assert create_chunks("\n\n" * 30, **SMALL) == []
+    # chunk_size 이하의 짧은 텍스트도 공백만 있으면 버림
+    assert spans(" \n\t  \n", **SMALL) == []
+
+
+def test_short_text_is_trimmed_before_min_size_check():
+    assert spans("\n  abcd.  \n", **SMALL) == [(3, 8, "abcd.")]
+    assert spans("   abc.   ", **SMALL) == []                # 공백을 빼면 min_size 미만
+
+
+def test_exact_chunk_size_and_min_size_edges():
+    text = "a" * 49 + "."
+    assert spans(text, **SMALL) == [(0, 50, text)]          # 정확히 chunk_size면 한 청크
+    assert spans("abc.", **SMALL) == []                      # min_size 미만은 버림
+    assert spans("abcd.", **SMALL) == [(0, 5, "abcd.")]      # 정확히 min_size는 유지
+
+    # 문장들을 이어 정확히 chunk_size가 되면 한 청크, 한 글자 넘으면 나뉨
+    packed = "abcd. " * 8 + "abc."
+    assert len(packed) == 52 and spans(packed, **SMALL)[0][1] == 47
+    fits = "a" * 20 + ". " + "b" * 27 + "."
+    assert len(fits) == 50 and len(spans(fits + " " + "c" * 60, **SMALL)[0][2]) == 50
+
+
+def test_create_chunks_slices_spans():
+    text = "수요와 공급. " * 30
+    assert create_chunks(text, 60, 15, 10) == [text[s:e] for s, e in iter_chunk_spans(text, 60, 15, 10)]
+
+
+# ── 페이지 경계를 넘는 청킹 (iter_chunks cross_page=True) ──
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(pipeline, "CHUNK_SIZE", 120)
+    monkeypatch.setattr(pipeline, "CHUNK_OVERLAP", 20)
+    monkeypatch.setattr(pipeline, "MIN_CHUNK_SIZE", 10)
+
+
+def page(number, text, source_file="book.pdf"):
+    return {"source_file": source_file, "page_index": number - 1, "estimated_page": number, "text": text}
+
+
+def test_cross_page_chunks_map_back_to_starting_page(small_chunks):
+    pages = [page(1, "Prices rise when demand grows. Sellers respond with more output."),
+             page(2, "Markets clear at the equilibrium price. Shortages push prices upward."),
+             page(3, "Surpluses push them down again."),
+             page(1, "Another book starts here with its own first sentence.", "notes.pdf")]
+
+    chunks = list(pipeline.iter_chunks(iter(pages), cross_page=True))
+
+    doc = "\n\n".join(p["text"] for p in pages[:3])
+    book = [c for c in chunks if c["metadata"]["source_file"] == "book.pdf"]
+    # 같은 파일의 페이지는 한 텍스트로 이어 붙여 청킹 → 청크가 페이지 경계("\n\n")를 넘음
+    assert any("\n\n" in c["text"] for c in book)
+    starts = [0, len(pages[0]["text"]) + 2, len(pages[0]["text"]) + len(pages[1]["text"]) + 4]
+    for chunk in book:
+        start = doc.index(chunk["text"])
+        expected_page = 1 + sum(start >= s for s in starts[1:])
+        assert chunk["metadata"]["estimated_page"] == expected_page
+    assert {c["metadata"]["estimated_page"] for c in book} == {1, 2}
+    # 다른 파일의 페이지는 이어 붙이지 않음
+    assert [c["text"] for c in chunks if c["metadata"]["source_file"] == "notes.pdf"] == [pages[3]["text"]]
+    assert [c["metadata"]["chunk_index"] for c in chunks] == list(range(1, len(chunks) + 1))
+
+
+def test_cross_page_duplicate_suffix_uses_offset_in_starting_page(small_chunks):
+    # 같은 문단이 페이지마다 반복 → 두 번째부터는 위치 접미사 (시작 페이지 · 그 페이지 안 오프셋)
+    paragraph = "Supply meets demand at the market price. Buyers and sellers both agree."
+    pages = [page(n, f"{paragraph} {paragraph}") for n in range(1, 4)]
+
+    chunks = list(pipeline.iter_chunks(iter(pages), cross_page=True))
+
+    doc = "\n\n".join(p["text"] for p in pages)
+    page_len = len(pages[0]["text"]) + 2
+    spans = list(iter_chunk_spans(doc, 120, 20, 10))
+    assert [c["text"] for c in chunks] == [doc[s:e] for s, e in spans]
+    suffixed = 0
+    for chunk, (start, _) in zip(chunks, spans):
+        number, offset = divmod(start, page_len)
+        assert chunk["metadata"]["estimated_page"] == number + 1
+        base = pipeline.chunk_content_id(chunk["text"])
+        if chunk["id"] != base:
+            suffixed += 1
+            assert chunk["id"] == f"{base}_{pipeline.chunk_position_id('book.pdf', number + 1, offset)}"
+    assert suffixed and len({c["id"] for c in chunks}) == len(chunks)
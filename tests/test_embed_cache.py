@@ -0,0 +1,73 @@
+"""임베딩 디스크 캐시 (embed_cache.py): 벡터 왕복 · 키 분리 · TTL · 크기 제한"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import embed_cache
+from embed_cache import DiskCache, EmbeddingCache
+from embedder import HashingEmbedder
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite")
+    yield cache
+    cache.close()
+
+
+def test_vectors_round_trip_per_model_and_task(cache):
+    texts = ["기회비용", "비교우위", "기회비용"]
+    vectors = [[0.5, -0.25], [1.0, 0.0], [0.5, -0.25]]
+    cache.put_vectors(texts, vectors, "model-a", "RETRIEVAL_DOCUMENT")
+
+    assert cache.get_vectors(texts, "model-a", "RETRIEVAL_DOCUMENT") == vectors
+    assert cache.get_vectors(["기회비용"], "model-a", "RETRIEVAL_QUERY") == [None]
+    assert cache.get_vectors(["기회비용"], EmbeddingCache.model_tag("model-a", 768), "RETRIEVAL_DOCUMENT") == [None]
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["hits"] == 2
+
+
+def test_max_age_skips_old_entries(tmp_path, monkeypatch):
+    clock = SimpleNamespace(time=lambda: 1000.0)
+    monkeypatch.setattr(embed_cache, "time", clock)
+    cache = DiskCache(tmp_path / "cache.sqlite", table="t")
+    cache.put("k", b"v")
+
+    clock.time = lambda: 1000.0 + 3600
+    assert cache.get("k", max_age=3600) == b"v"
+    assert cache.get("k", max_age=3599) is None
+    assert cache.get("k") == b"v"
+    cache.close()
+
+
+def test_evicts_least_recently_used_beyond_max_entries(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(embed_cache, "time", SimpleNamespace(time=lambda: now[0]))
+    monkeypatch.setattr(embed_cache, "EVICT_CHECK_INTERVAL", 1)
+    cache = DiskCache(tmp_path / "cache.sqlite", table="t", max_entries=2)
+    for key in ("a", "b"):
+        now[0] += 1
+        cache.put(key, key.encode())
+    now[0] += 1
+    assert cache.get("a") == b"a"     # a를 최근에 사용 → b가 가장 오래됨
+    now[0] += 1
+    cache.put("c", b"c")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"a" and cache.get("c") == b"c"
+    assert cache.stats()["evictions"] == 1
+    cache.close()
+
+
+def test_embedder_only_computes_missing_texts(cache):
+    embedder = HashingEmbedder(dim=64, cache=cache)
+    first = embedder.embed_documents(["수요", "공급"])
+    calls = []
+    original = embedder._embed
+    embedder._embed = lambda texts, task_type: calls.append(list(texts)) or original(texts, task_type)
+
+    again = embedder.embed_documents(["공급", "균형", "수요"])
+
+    assert calls == [["균형"]]
+    assert again[0] == pytest.approx(first[1]) and again[2] == pytest.approx(first[0])
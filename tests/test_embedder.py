@@ -0,0 +1,51 @@
+"""임베딩 백엔드 (embedder.py): 해싱 임베딩의 결정성 · 캐시 키 · 컬렉션 이름"""
+
+import math
+
+import pytest
+
+from embedder import (GEMINI_MODEL, HASHING_DIM, GeminiEmbedder, HashingEmbedder, collection_name,
+                      make_embedder)
+
+TEXTS = ["수요의 가격 탄력성", "GDP deflator = nominal GDP / real GDP", "기회비용 기회비용 기회비용", ""]
+
+
+def test_hashing_embedding_is_deterministic_unit_length():
+    first = HashingEmbedder(dim=64).embed_documents(TEXTS)
+    again = HashingEmbedder(dim=64).embed_documents(list(reversed(TEXTS)))[::-1]
+
+    assert first == again
+    assert [len(v) for v in first] == [64] * len(TEXTS)
+    for vector in first[:-1]:
+        assert math.sqrt(sum(x * x for x in vector)) == pytest.approx(1.0)
+    # 토큰이 없으면 0 벡터 (정규화하지 않음)
+    assert first[-1] == [0.0] * 64
+    # 쿼리와 문서를 같은 방식으로 만듦
+    assert HashingEmbedder(dim=64).embed_query(TEXTS[0]) == first[0]
+
+
+def test_hashing_dimension_defaults_and_separates_vectors():
+    assert HashingEmbedder().dim == HASHING_DIM
+    assert len(make_embedder("hashing").embed_query("균형 가격")) == HASHING_DIM
+    small, large = HashingEmbedder(dim=32), HashingEmbedder(dim=128)
+    assert len(small.embed_query(TEXTS[0])) == 32 and len(large.embed_query(TEXTS[0])) == 128
+    assert small.embed_query(TEXTS[0]) != small.embed_query(TEXTS[1])
+
+
+def test_cache_tag_and_collection_differ_between_backends():
+    gemini = make_embedder("gemini", api_key="key")
+    gemini_768 = GeminiEmbedder("key", dim=768)
+    hashing = make_embedder("hashing", dim=768)
+    tags = {gemini.cache_tag, gemini_768.cache_tag, hashing.cache_tag, HashingEmbedder(dim=64).cache_tag}
+
+    assert len(tags) == 4
+    assert gemini.cache_tag == GEMINI_MODEL
+    assert gemini.collection_name("econ") == "econ"
+    assert gemini_768.collection_name("econ") == "econ_d768"
+    assert hashing.collection_name("econ") == "econ_hashing_d768" == collection_name("econ", "hashing", 768)
+    assert collection_name("econ", "onnx", model="intfloat/multilingual-e5-small") == "econ_onnx_multilingual_e5_small"
+
+
+def test_make_embedder_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        make_embedder("word2vec")
@@ -0,0 +1,118 @@
+"""Step 1 (PDF 추출): 페이지 구간 병렬 추출 · 병합 순서 · RSS 상한 · 바뀐 PDF만 다시 추출"""
+
+import json
+
+import pytest
+
+import pipeline
+
+pytest.importorskip("pdfplumber")
+
+BODY = "Supply and demand determine the price of page {n} in this book."
+
+
+def make_pdf(path, pages):
+    """페이지마다 텍스트 한 줄씩 들어간 최소 PDF (Helvetica, ASCII)"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 10 Tf 40 780 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for n, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{n} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(out)
+
+
+@pytest.fixture
+def raw_pdfs(tmp_path, monkeypatch):
+    """PDF 두 권 (001-005.pdf: 5쪽 중 3쪽은 거의 빈 페이지, 006-012.pdf: 7쪽) → extracted_pages.jsonl 경로"""
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    make_pdf(raw_dir / "001-005.pdf", [BODY.format(n=n) if n != 3 else "blank" for n in range(1, 6)])
+    make_pdf(raw_dir / "006-012.pdf", [BODY.format(n=n) for n in range(6, 13)])
+    monkeypatch.setattr(pipeline, "RAW_DB_DIR", raw_dir)
+    monkeypatch.setattr(pipeline, "DATA_DIR", tmp_path / "data")
+    monkeypatch.setattr(pipeline, "PAGES_CACHE_DIR", tmp_path / "data" / "pages")
+    monkeypatch.setattr(pipeline, "MANIFEST_PATH", tmp_path / "data" / "manifest.json")
+    return tmp_path / "data" / "extracted_pages.jsonl"
+
+
+def read_pages(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_serial_extract_numbers_pages_from_file_name(raw_pdfs):
+    assert pipeline.step1_extract_pdfs()
+
+    pages = read_pages(raw_pdfs)
+    assert [(p["source_file"], p["page_index"], p["estimated_page"]) for p in pages] == (
+        [("001-005.pdf", i, i + 1) for i in (0, 1, 3, 4)] + [("006-012.pdf", i, i + 6) for i in range(7)])
+    assert pages[0]["text"] == BODY.format(n=1) and pages[0]["char_count"] == len(pages[0]["text"])
+
+
+def test_parallel_extract_is_byte_identical_to_serial(raw_pdfs, monkeypatch):
+    # 2쪽씩 나눠 작업 7개 → 완료 순서와 상관없이 (파일, 페이지) 순서로 병합
+    monkeypatch.setattr(pipeline, "EXTRACT_SHARD_PAGES", 2)
+    assert pipeline.step1_extract_pdfs(workers=1)
+    serial = raw_pdfs.read_bytes()
+
+    assert pipeline.step1_extract_pdfs(workers=3)
+    assert raw_pdfs.read_bytes() == serial
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_rss_ceiling_stops_and_keeps_previous_output(raw_pdfs, workers):
+    raw_pdfs.parent.mkdir(parents=True)
+    raw_pdfs.write_text("previous\n", encoding="utf-8")
+
+    # 1 MB는 어떤 인터프리터도 넘으므로 첫 페이지에서 멈춤
+    assert not pipeline.step1_extract_pdfs(workers=workers, max_rss_mb=1)
+
+    assert raw_pdfs.read_text(encoding="utf-8") == "previous\n"
+    assert not raw_pdfs.with_suffix(".jsonl.tmp").exists()
+
+
+def test_check_memory_collects_garbage_before_giving_up(monkeypatch):
+    readings = iter([120.0, 90.0, 150.0, 140.0])
+    monkeypatch.setattr(pipeline, "current_rss_mb", lambda: next(readings))
+
+    assert pipeline.check_memory(50.0, 100, "p.1") == 90.0    # GC 후 상한 아래로 내려오면 계속
+    with pytest.raises(pipeline.MemoryLimitExceeded, match="p.2"):
+        pipeline.check_memory(90.0, 100, "p.2")
+    monkeypatch.setattr(pipeline, "current_rss_mb", lambda: None)
+    assert pipeline.check_memory(90.0, 100, "p.3") == 90.0    # 측정할 수 없으면 제한하지 않음
+
+
+def test_only_changed_pdfs_are_extracted_again(raw_pdfs, monkeypatch):
+    assert pipeline.step1_extract_pdfs()
+    first = raw_pdfs.read_bytes()
+    extracted = []
+    original = pipeline.extract_pdfs_streaming
+    monkeypatch.setattr(pipeline, "extract_pdfs_streaming",
+                        lambda pdf_files, *args: extracted.append([p.name for p in pdf_files])
+                        or original(pdf_files, *args))
+
+    assert pipeline.step1_extract_pdfs()
+    assert extracted == [] and raw_pdfs.read_bytes() == first
+
+    make_pdf(pipeline.RAW_DB_DIR / "006-012.pdf", [BODY.format(n=n) for n in range(6, 14)])
+    assert pipeline.step1_extract_pdfs()
+    assert extracted == [["006-012.pdf"]]
+    changed = raw_pdfs.read_bytes()
+    assert changed != first
+
+    # 파일별 캐시를 이어 붙인 결과는 전체 재추출과 바이트 단위로 같음
+    assert pipeline.step1_extract_pdfs(force=True)
+    assert extracted[-1] == ["001-005.pdf", "006-012.pdf"] and raw_pdfs.read_bytes() == changed
@@ -0,0 +1,87 @@
+"""생성 결과 캐시 (generation_cache.py · server.cached_generation): 키 · 엔드포인트 정책 · fresh/cache 제어"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import embed_cache
+import server
+from generation_cache import GenerationCache
+
+DOCS = [{"id": "chunk_a", "text": "기회비용", "metadata": {"chapter": "Chapter 1"}, "similarity": 0.9}]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = GenerationCache(tmp_path / "generations.sqlite",
+                            policy={"lecture": {"ttl": 3600, "max_entries": 10},
+                                    "quiz": {"ttl": None, "max_entries": 10}})
+    yield cache
+    cache.close()
+
+
+def test_key_ignores_control_fields_and_query_formatting():
+    key = GenerationCache.make_key("quiz", {"chapter": "1", "topic": "기회비용?"}, ["a"], "m", 0.5)
+    assert key == GenerationCache.make_key("quiz", {"topic": " 기회비용 ", "chapter": "1", "fresh": True,
+                                                    "cache": True}, ["a"], "m", 0.5)
+    for changed in (("lecture", {"chapter": "1", "topic": "기회비용"}, ["a"], "m", 0.5),
+                    ("quiz", {"chapter": "2", "topic": "기회비용"}, ["a"], "m", 0.5),
+                    ("quiz", {"chapter": "1", "topic": "기회비용"}, ["b"], "m", 0.5),
+                    ("quiz", {"chapter": "1", "topic": "기회비용"}, ["a"], "m2", 0.5),
+                    ("quiz", {"chapter": "1", "topic": "기회비용"}, ["a"], "m", 0.7)):
+        assert GenerationCache.make_key(*changed) != key
+
+
+def test_endpoint_ttl(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(embed_cache, "time", SimpleNamespace(time=lambda: now[0]))
+    cache.put("lecture", "k", {"response": "노트"})
+    cache.put("quiz", "k", {"response": "퀴즈"})
+
+    now[0] += 3601
+    assert cache.get("lecture", "k") is None
+    assert cache.get("quiz", "k") == {"response": "퀴즈"}   # ttl None = 만료 없음
+    assert cache.enabled("quiz") and not cache.enabled("chat")
+    stats = cache.stats()
+    assert stats["lecture"]["ttl"] == 3600 and stats["quiz"]["hits"] == 1
+
+
+class FakeTask(server.GenerationTask):
+    def run(self):
+        result = {"response": f"생성 {self.query}", "sources": []}
+        self.remember(result)
+        return result
+
+
+@pytest.fixture
+def cached_quiz(cache, monkeypatch):
+    monkeypatch.setattr(server, "generation_cache", cache)
+    calls = []
+
+    def handle_quiz(body):
+        calls.append(body)
+        return FakeTask(body.get("topic", ""), DOCS, "system", temperature=0.5)
+    return server.cached_generation("quiz", handle_quiz), calls
+
+
+def test_cached_generation_reuses_stored_response(cached_quiz):
+    handler, calls = cached_quiz
+    first = server.dispatch(handler, {"topic": "기회비용"})
+    second = server.dispatch(handler, {"topic": "기회비용!"})
+
+    assert first == {"response": "생성 기회비용", "sources": []}
+    assert second == dict(first, cached=True)
+    assert len(calls) == 2   # 검색(핸들러)은 매번 실행, 생성만 건너뜀
+
+
+def test_fresh_regenerates_and_overwrites_cache_false_bypasses(cached_quiz, cache):
+    handler, _ = cached_quiz
+    server.dispatch(handler, {"topic": "기회비용"})
+
+    task = handler({"topic": "기회비용", "fresh": True})
+    assert isinstance(task, server.GenerationTask) and task.cache is not None
+    task.remember({"response": "새로 생성", "sources": []})
+    assert server.dispatch(handler, {"topic": "기회비용"})["response"] == "새로 생성"
+
+    uncached = handler({"topic": "기회비용", "cache": False})
+    assert isinstance(uncached, server.GenerationTask) and uncached.cache is None
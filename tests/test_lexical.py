@@ -0,0 +1,74 @@
+"""어휘 색인 (lexical.py): 토큰화 · BM25 검색 · 순위 융합(RRF)"""
+
+import pytest
+
+from chunk_store import ChunkStore, ChunkStoreWriter
+from lexical import RRF_K, LexicalIndex, build_lexical_index, read_header, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "수요의 가격 탄력성은 가격 변화에 대한 수요량의 반응 정도이다.",
+    "GDP 디플레이터는 명목 GDP를 실질 GDP로 나눈 값이다.",
+    "기회비용은 어떤 것을 얻기 위해 포기한 것의 가치이다.",
+    "공급의 가격 탄력성은 생산 기간이 길수록 커진다.",
+    "비교우위는 기회비용이 더 작은 생산자에게 있다.",
+]
+
+
+@pytest.fixture
+def lexical_index(tmp_path):
+    store_path = tmp_path / "chunks.bin"
+    with ChunkStoreWriter(store_path) as writer:
+        for i, text in enumerate(TEXTS):
+            writer.add({"id": f"chunk_{i}", "text": text,
+                        "metadata": {"source_file": "book.pdf", "estimated_page": i + 1, "chapter": "Chapter 1",
+                                     "part": "Part 1", "char_count": len(text), "chunk_index": i + 1}})
+    with ChunkStore(store_path) as store:
+        header = build_lexical_index(store, tmp_path / "lexical.bin")
+        assert read_header(tmp_path / "lexical.bin")["chunks"] == store.digest
+    index = LexicalIndex(tmp_path / "lexical.bin")
+    yield index, header
+    index.close()
+
+
+def test_tokenize_korean_bigrams_and_words():
+    assert tokenize("돈은") == ["돈", "돈은"]
+    assert tokenize("돈은", query=True) == ["돈은"]
+    assert tokenize("GDP 2.5%") == ["gdp", "2.5"]
+
+
+def test_bm25_ranks_exact_terms_first(lexical_index):
+    index, header = lexical_index
+    assert len(index) == len(TEXTS) and header["postings"] > 0
+
+    hits = index.search("GDP 디플레이터", 3)
+    assert hits[0][0] == 1
+
+    ranked = [doc for doc, _ in index.search("기회비용", 5)]
+    assert set(ranked[:2]) == {2, 4}
+    scores = [score for _, score in index.search("가격 탄력성", 5)]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_bm25_mask_and_unknown_terms(lexical_index):
+    index, _ = lexical_index
+    mask = [i != 2 for i in range(len(TEXTS))]
+    assert [doc for doc, _ in index.search("기회비용", 5, mask=mask)] == [4]
+    assert index.search("엔트로피", 5) == []
+
+
+def test_rrf_fuses_by_reciprocal_rank():
+    vector = [{"id": "a", "src": "vector"}, {"id": "b"}, {"id": "c"}]
+    lexical = [{"id": "c", "src": "lexical"}, {"id": "a"}, {"id": "d"}]
+
+    fused = reciprocal_rank_fusion([vector, lexical], 3)
+
+    # a: 1/61 + 1/62, c: 1/63 + 1/61, b: 1/62, d: 1/63
+    assert [doc["id"] for doc in fused] == ["a", "c", "b"]
+    assert fused[0]["rrf"] == round(1 / (RRF_K + 1) + 1 / (RRF_K + 2), 6)
+    # 같은 문서는 먼저 나온 목록의 dict를 씀
+    assert fused[0]["src"] == "vector" and "src" not in fused[1]
+
+
+def test_rrf_single_ranking_keeps_order_and_truncates():
+    ranking = [{"id": str(i)} for i in range(10)]
+    assert [doc["id"] for doc in reciprocal_rank_fusion([ranking, []], 4)] == ["0", "1", "2", "3"]
@@ -0,0 +1,95 @@
+"""단계별 지문 (manifest.json): 입력·파라미터가 같으면 건너뛰고, 바뀌면 다시 실행"""
+
+import json
+
+import pytest
+
+import pipeline
+from embedder import HashingEmbedder
+
+TEXT = "Prices rise when demand grows faster than supply. Sellers respond by producing more output. " * 6
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """임시 디렉터리의 추출 결과(페이지 3개) · 매니페스트 · ChromaDB"""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(pipeline, "DATA_DIR", data_dir)
+    monkeypatch.setattr(pipeline, "CHROMA_DIR", tmp_path / "chroma_db")
+    monkeypatch.setattr(pipeline, "MANIFEST_PATH", data_dir / "manifest.json")
+    monkeypatch.setattr(pipeline, "CHUNK_ID_MAP_PATH", data_dir / "chunk_id_map.json")
+    monkeypatch.setattr(pipeline, "EMBED_JOURNAL_PATH", data_dir / "embed_journal.log")
+    monkeypatch.setattr(pipeline, "CHUNK_STORE_PATH", data_dir / "chunks.bin")
+    monkeypatch.setattr(pipeline, "LEGACY_CHUNKS_PATH", data_dir / "chunks.jsonl")
+    monkeypatch.setattr(pipeline, "LEXICAL_INDEX_PATH", data_dir / "lexical.bin")
+    monkeypatch.setattr(pipeline, "CHAPTER_INDEX_PATH", data_dir / "chapter_index.json")
+    monkeypatch.setattr(pipeline, "COLLECTION_NAME", "test_collection")
+    write_pages(data_dir, TEXT)
+    return data_dir
+
+
+def write_pages(data_dir, text):
+    with open(data_dir / "extracted_pages.jsonl", "w", encoding="utf-8") as f:
+        for n in range(1, 4):
+            f.write(json.dumps({"source_file": "book.pdf", "page_index": n - 1, "estimated_page": n,
+                                "text": f"Page {n}. {text}"}) + "\n")
+
+
+@pytest.fixture
+def chunk_runs(monkeypatch):
+    """step2가 실제로 청킹한 횟수"""
+    runs = []
+    original = pipeline.iter_chunks
+    monkeypatch.setattr(pipeline, "iter_chunks", lambda pages, **kw: runs.append(1) or original(pages, **kw))
+    return runs
+
+
+def test_chunk_step_skips_until_inputs_or_params_change(workdir, chunk_runs, monkeypatch):
+    assert pipeline.step2_chunk_text()
+    assert pipeline.step2_chunk_text()
+    assert len(chunk_runs) == 1
+
+    for name, value in (("CHUNK_SIZE", 300), ("CHUNK_OVERLAP", 40), ("MIN_CHUNK_SIZE", 50),
+                        ("CHUNKER_VERSION", pipeline.CHUNKER_VERSION + 1)):
+        monkeypatch.setattr(pipeline, name, value)
+        assert pipeline.step2_chunk_text()
+        assert pipeline.step2_chunk_text()
+    assert len(chunk_runs) == 5
+
+    assert pipeline.step2_chunk_text(cross_page=True)
+    write_pages(workdir, TEXT.upper())
+    assert pipeline.step2_chunk_text(cross_page=True)
+    assert pipeline.step2_chunk_text(cross_page=True, force=True)
+    assert len(chunk_runs) == 8
+
+
+@pytest.fixture
+def offline_embedding(monkeypatch):
+    """step3를 네트워크 없이 돌림 → 임베딩 단계가 실제로 실행된 횟수 (연결 확인 호출 수)"""
+    monkeypatch.setattr(pipeline, "EMBEDDING_CACHE_ENABLED", False)
+    monkeypatch.setattr(pipeline, "_embedder", HashingEmbedder(dim=16))
+    runs = []
+    original = pipeline.check_embedding_api
+    monkeypatch.setattr(pipeline, "check_embedding_api", lambda *args: runs.append(1) or original(*args))
+    return runs
+
+
+def test_embed_step_skips_until_chunks_or_model_change(workdir, offline_embedding, monkeypatch):
+    assert pipeline.step2_chunk_text()
+    assert pipeline.step3_build_vectordb()
+    assert json.loads(pipeline.MANIFEST_PATH.read_text(encoding="utf-8"))["embed"]["complete"]
+
+    assert pipeline.step3_build_vectordb()
+    assert len(offline_embedding) == 1   # 완료 상태 + 같은 지문 → API 확인 전에 건너뜀
+
+    monkeypatch.setattr(pipeline, "EMBEDDING_MODEL", "models/other-embedding")
+    assert pipeline.step3_build_vectordb()
+    assert pipeline.step3_build_vectordb()
+    assert len(offline_embedding) == 2
+
+    monkeypatch.setattr(pipeline, "CHUNK_SIZE", 300)   # 청크가 바뀌면 다시 실행
+    assert pipeline.step2_chunk_text()
+    assert pipeline.step3_build_vectordb()
+    assert pipeline.step3_build_vectordb(force=True)
+    assert len(offline_embedding) == 4
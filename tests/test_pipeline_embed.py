@@ -0,0 +1,417 @@
+"""Step 3 (임베딩 + DB 저장): 속도 제한기 · 쓰기 스레드 · 체크포인트 저널 · 중단 경로"""
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import pipeline
+import stub_gemini
+from chunk_store import ChunkStoreWriter
+from embedder import EmbeddingHTTPError, GeminiEmbedder
+
+
+def make_chunks(n):
+    return [{
+        "id": f"chunk_{i:04d}",
+        "text": f"경제학 청크 {i}: 기회비용과 한계 편익",
+        "metadata": {"source_file": "book.pdf", "estimated_page": i // 4 + 1, "chapter": "Chapter 1: 서론",
+                     "part": "Part 1: 도입", "char_count": 20, "chunk_index": i + 1},
+    } for i in range(n)]
+
+
+@pytest.fixture
+def embed_env(tmp_path, monkeypatch):
+    """임시 디렉터리의 청크 저장소 · ChromaDB로 step3를 돌리는 환경 → embedder 설정 함수"""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for name, path in {
+        "RAW_DB_DIR": tmp_path / "raw",
+        "DATA_DIR": data_dir,
+        "CHROMA_DIR": tmp_path / "chroma_db",
+        "MANIFEST_PATH": data_dir / "manifest.json",
+        "CHUNK_ID_MAP_PATH": data_dir / "chunk_id_map.json",
+        "CHUNK_STORE_PATH": data_dir / "chunks.bin",
+        "LEGACY_CHUNKS_PATH": data_dir / "chunks.jsonl",
+        "EMBED_JOURNAL_PATH": data_dir / "embed_journal.log",
+        "STREAM_JOURNAL_PATH": data_dir / "stream_journal.log",
+    }.items():
+        monkeypatch.setattr(pipeline, name, path)
+    monkeypatch.setattr(pipeline, "EMBEDDING_CACHE_ENABLED", False)
+    monkeypatch.setattr(pipeline, "EMBEDDING_BATCH_SIZE", 4)
+    monkeypatch.setattr(pipeline, "COLLECTION_NAME", "test_collection")
+
+    chunks = make_chunks(48)
+    with ChunkStoreWriter(pipeline.CHUNK_STORE_PATH) as writer:
+        for chunk in chunks:
+            writer.add(chunk)
+
+    def use(embedder):
+        monkeypatch.setattr(pipeline, "_embedder", embedder)
+        return chunks
+    return use
+
+
+def writer_threads():
+    return [t for t in threading.enumerate() if t.name == "chroma-writer" and t.is_alive()]
+
+
+def test_embed_backs_off_on_429_and_stores_everything(embed_env, stub_server, monkeypatch):
+    # 스텁 쿼터(초당 5회)보다 빠르게 시작 → 429를 받고 속도를 낮춰 끝까지 저장
+    monkeypatch.setattr(stub_gemini, "STUB_RPS", 5)
+    monkeypatch.setattr(pipeline, "EMBEDDING_RATE_LIMIT", 0.02)
+    chunks = embed_env(GeminiEmbedder("stub", api_base=stub_server))
+
+    assert pipeline.step3_build_vectordb(workers=4)
+
+    assert stub_gemini._stats["throttled"] > 0
+    collection = pipeline.open_collection()
+    assert sorted(collection.get(include=[])["ids"]) == [c["id"] for c in chunks]
+    manifest = json.loads(pipeline.MANIFEST_PATH.read_text(encoding="utf-8"))
+    assert manifest["embed"]["complete"]
+    assert not writer_threads()
+
+
+def test_embed_aborts_after_consecutive_errors(embed_env, stub_server, monkeypatch):
+    # 연결 확인(1회)과 첫 배치 2개만 성공하고 이후 요청은 모두 500
+    # (배치 요청은 느리게 실패시켜 중단 시점에 아직 시작하지 않은 배치가 남도록 함)
+    calls = []
+
+    def flaky(url, body, timeout):
+        calls.append(url)
+        if len(calls) > 3:
+            if "requests" in body:
+                time.sleep(0.1)
+            raise EmbeddingHTTPError(500, "internal")
+        requests = body.get("requests", [body])
+        vectors = [{"values": stub_gemini.fake_vector(stub_gemini.request_text(r), 8)} for r in requests]
+        return {"embeddings": vectors} if "requests" in body else {"embedding": vectors[0]}
+
+    monkeypatch.setattr(pipeline, "EMBEDDING_RATE_LIMIT", 0.02)
+    embedder = GeminiEmbedder("stub", api_base=stub_server)
+    embedder.transport = flaky
+    chunks = embed_env(embedder)
+
+    assert pipeline.step3_build_vectordb(workers=2)
+
+    # 중단해도 이미 임베딩한 배치는 커밋되고 저널에 남음
+    assert not writer_threads()
+    stored = pipeline.open_collection().count()
+    assert stored == 8
+    header = json.loads(pipeline.EMBED_JOURNAL_PATH.read_text(encoding="utf-8").splitlines()[0])
+    journal = pipeline.EmbedJournal(pipeline.EMBED_JOURNAL_PATH, header["fingerprint"], len(chunks))
+    assert journal.load().count(1) == stored
+    manifest = json.loads(pipeline.MANIFEST_PATH.read_text(encoding="utf-8"))
+    assert not manifest["embed"]["complete"]
+    # 중단 후에는 남은 배치를 더 보내지 않음 (배치 5개 × (배치 1 + 청크 4) 이하)
+    assert len(calls) < 3 + 6 * 5
+
+
+def test_stream_commits_through_writer_and_resumes_from_journal(embed_env, stub_server, monkeypatch):
+    pytest.importorskip("pdfplumber")
+    raw_dir = pipeline.RAW_DB_DIR
+    raw_dir.mkdir()
+    (raw_dir / "book.pdf").write_bytes(b"%PDF-1.4 stub")
+    text = "수요와 공급의 균형은 가격이 조정되며 이루어진다. " * 12
+    pages = [{"source_file": "book.pdf", "estimated_page": n, "text": f"{n}쪽. {text}"} for n in range(1, 11)]
+    monkeypatch.setattr(pipeline, "iter_pdf_pages", lambda pdf_files, max_rss_mb: iter(pages))
+    monkeypatch.setattr(pipeline, "EMBEDDING_RATE_LIMIT", 0.02)
+    embed_env(GeminiEmbedder("stub", api_base=stub_server))
+    pipeline.save_manifest({"embed": {"fingerprint": "chunks-bin", "complete": True}})
+    pipeline.EMBED_JOURNAL_PATH.write_text("{}\n", encoding="utf-8")
+
+    assert pipeline.run_stream_pipeline(workers=2)
+
+    expected = [c["id"] for c in pipeline.iter_chunks(iter(pages))]
+    assert sorted(pipeline.open_collection().get(include=[])["ids"]) == sorted(expected)
+    assert not writer_threads()
+    manifest = pipeline.load_manifest()
+    assert manifest["stream"]["complete"] and manifest["stream"]["chunks"] == len(expected)
+    # 스트림이 컬렉션에 새 행을 넣었으므로 Step 3의 지문·저널은 무효
+    assert "embed" not in manifest and not pipeline.EMBED_JOURNAL_PATH.exists()
+
+    # 같은 입력으로 다시 실행하면 저널만 보고 모두 건너뜀 (임베딩 요청 없음)
+    texts = stub_gemini._stats["texts"]
+    pipeline.save_manifest({**manifest, "embed": {"fingerprint": "chunks-bin", "complete": True}})
+    assert pipeline.run_stream_pipeline(workers=2)
+    assert stub_gemini._stats["texts"] == texts + 1   # 연결 확인 1회
+    assert pipeline.load_manifest()["embed"]["complete"]
+
+
+# ── 동시 임베딩 루프 (embed_batches) ──
+
+class ListWriter:
+    """ChromaWriter 대신 put된 청크 순번만 기록"""
+
+    def __init__(self):
+        self.ordinals = []
+
+    def put(self, chunks, embeddings, ordinals=()):
+        assert len(chunks) == len(embeddings) == len(ordinals)
+        self.ordinals.extend(ordinals)
+
+
+class ScriptedEmbedder:
+    """텍스트에 "slow"가 있으면 늦게 성공, batch_fails면 여러 텍스트 요청은 500, 나머지는 fail_all에 따라"""
+
+    def __init__(self, delay=0.2, batch_fails=False, fail_all=False):
+        self.delay = delay
+        self.batch_fails = batch_fails
+        self.fail_all = fail_all
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def embed_documents(self, texts):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            if any("slow" in t for t in texts):
+                time.sleep(self.delay)
+            elif self.fail_all or (self.batch_fails and len(texts) > 1):
+                raise EmbeddingHTTPError(500, "internal")
+            else:
+                time.sleep(self.delay)
+            return [[1.0] for _ in texts]
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def numbered_batches(texts, size):
+    chunks = [{"id": f"c{i}", "text": text} for i, text in enumerate(texts)]
+    return [(list(range(i, i + size)), chunks[i:i + size]) for i in range(0, len(chunks), size)]
+
+
+def test_abort_drains_running_batches_and_writes_their_results():
+    # 배치 0 실패 → 청크별 재시도 대기 / 배치 1은 실행 중(느림) / 배치 2 실패 → 연속 2번으로 중단
+    texts = ["bad a", "bad b", "slow a", "slow b", "bad c", "bad d", "ok a", "ok b"]
+    writer = ListWriter()
+
+    stats = pipeline.embed_batches(numbered_batches(texts, 2), ScriptedEmbedder(fail_all=True), writer,
+                                   workers=2, max_consecutive_errors=2)
+
+    assert stats["aborted"] and stats["errors"] >= 2   # 빈 워커가 중단 전에 배치 3을 시작했을 수 있음
+    # 중단 시점에 실행 중이던 배치 1은 버리지 않고 씀, 시작하지 않은 재시도는 취소
+    assert writer.ordinals == [2, 3] and stats["embedded"] == 2
+
+
+def test_failed_batch_is_retried_per_chunk_concurrently():
+    embedder = ScriptedEmbedder(delay=0.1, batch_fails=True)
+    writer = ListWriter()
+
+    stats = pipeline.embed_batches(numbered_batches([f"text {i}" for i in range(4)], 4), embedder, writer,
+                                   workers=4)
+
+    assert sorted(writer.ordinals) == [0, 1, 2, 3]
+    assert stats == {"embedded": 4, "batches": 1, "errors": 1, "aborted": False}
+    # 청크별 재시도는 조정 스레드에서 하나씩이 아니라 executor에서 동시에
+    assert embedder.peak >= 2
+
+
+# ── AIMD 속도 제한기 (AdaptiveRateLimiter · embed_with_limiter) ──
+
+class FakeClock:
+    """sleep하면 그만큼 시간이 흐르는 가짜 시계"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(round(seconds, 6))
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(pipeline, "time", SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    return clock
+
+
+def test_limiter_additive_increase_multiplicative_decrease(clock):
+    limiter = pipeline.AdaptiveRateLimiter(rate=2.0, max_rate=3.0, min_rate=0.5, additive_step=0.4)
+    for _ in range(2):
+        limiter.on_success()
+    assert limiter.rate == pytest.approx(2.8) and limiter.burst == pytest.approx(2.8)
+    limiter.on_success()
+    assert limiter.rate == 3.0   # max_rate에서 멈춤
+
+    for _ in range(3):
+        limiter.on_throttle()
+    assert limiter.rate == 0.5 and limiter.burst == 1.0   # 3 → 1.5 → 0.75 → min_rate
+    assert limiter.throttles == 3 and limiter.tokens == 0.0
+
+
+def test_limiter_acquire_waits_for_tokens_at_current_rate(clock):
+    limiter = pipeline.AdaptiveRateLimiter(rate=4.0)
+    limiter.tokens = 1.0
+    limiter.acquire()
+    assert clock.slept == []   # 처음 토큰 1개는 바로 사용
+
+    limiter.acquire()
+    assert clock.slept == [0.25]
+    limiter.on_throttle()   # 쌓인 토큰을 비우고 2 req/s로
+    limiter.acquire()
+    assert clock.slept == [0.25, 0.5]
+
+
+class ThrottledEmbedder:
+    """처음 fails번은 code로 실패하는 임베더"""
+
+    def __init__(self, fails, code=429):
+        self.fails = fails
+        self.code = code
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.calls <= self.fails:
+            raise EmbeddingHTTPError(self.code, "quota")
+        return [[1.0] for _ in texts]
+
+
+def test_embed_with_limiter_retries_throttles_only(clock):
+    limiter = pipeline.AdaptiveRateLimiter(rate=8.0, additive_step=1.0)
+    embedder = ThrottledEmbedder(fails=2)
+    assert pipeline.embed_with_limiter(["a", "b"], embedder, limiter) == [[1.0], [1.0]]
+    assert embedder.calls == 3 and limiter.throttles == 2
+    assert limiter.rate == pytest.approx(8.0 / 4 + 1.0)
+
+    with pytest.raises(EmbeddingHTTPError):
+        pipeline.embed_with_limiter(["a"], ThrottledEmbedder(fails=1, code=500), limiter)
+    limiter = pipeline.AdaptiveRateLimiter(rate=8.0)
+    with pytest.raises(EmbeddingHTTPError):
+        pipeline.embed_with_limiter(["a"], ThrottledEmbedder(fails=3), limiter, max_attempts=3)
+    assert limiter.throttles == 2   # 마지막 시도의 429는 그대로 올림
+
+
+# ── 쓰기 스레드 (ChromaWriter) ──
+
+class FakeCollection:
+    """upsert 호출을 기록하는 컬렉션 (fail=True면 항상 실패)"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.upserts = []
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        if self.fail:
+            raise RuntimeError("database is locked")
+        assert len(ids) == len(embeddings) == len(documents) == len(metadatas)
+        self.upserts.append(list(ids))
+
+
+class RecordingJournal:
+    def __init__(self):
+        self.appended = []
+
+    def append(self, ordinals):
+        self.appended.append(list(ordinals))
+
+
+def put_batches(writer, chunks, size):
+    for start in range(0, len(chunks), size):
+        batch = chunks[start:start + size]
+        writer.put(batch, [[float(start)]] * len(batch), range(start, start + len(batch)))
+
+
+def test_writer_groups_batches_into_bulk_upserts():
+    collection, journal = FakeCollection(), RecordingJournal()
+    writer = pipeline.ChromaWriter(collection, journal, flush_rows=8, flush_seconds=5)
+    writer.start()
+    chunks = make_chunks(20)
+    put_batches(writer, chunks, 3)
+    writer.close()
+
+    # 3행 배치를 8행 이상 모일 때마다 커밋, 나머지는 close()에서
+    assert [len(ids) for ids in collection.upserts] == [9, 9, 2]
+    assert [i for ids in collection.upserts for i in ids] == [c["id"] for c in chunks]
+    assert journal.appended == [list(range(0, 9)), list(range(9, 18)), [18, 19]]
+    assert (writer.rows, writer.commits, writer.failed_rows) == (20, 3, 0)
+    assert not writer.is_alive()
+
+
+def test_writer_flushes_after_idle_timeout():
+    collection = FakeCollection()
+    writer = pipeline.ChromaWriter(collection, flush_rows=100, flush_seconds=0.05)
+    writer.start()
+    put_batches(writer, make_chunks(4), 4)
+
+    deadline = time.monotonic() + 5
+    while not collection.upserts and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert collection.upserts == [[f"chunk_{i:04d}" for i in range(4)]]
+    writer.close()
+    assert writer.commits == 1
+
+
+def test_writer_failed_commit_is_not_journaled():
+    journal = RecordingJournal()
+    writer = pipeline.ChromaWriter(FakeCollection(fail=True), journal, flush_rows=4, flush_seconds=5)
+    writer.start()
+    put_batches(writer, make_chunks(6), 2)
+    writer.close()
+
+    assert (writer.rows, writer.failed_rows) == (0, 6)
+    assert journal.appended == []
+
+
+# ── 체크포인트 저널 (EmbedJournal) ──
+
+def test_journal_encode_ranges():
+    assert pipeline.EmbedJournal.encode_ranges([5, 0, 1, 2, 7, 8, 10]) == "0-2,5,7-8,10"
+    assert pipeline.EmbedJournal.encode_ranges([]) == ""
+
+
+def test_journal_append_load_and_compact(tmp_path):
+    path = tmp_path / "journal.log"
+    journal = pipeline.EmbedJournal(path, "fp", 12)
+    assert journal.load() is None
+    journal.reset(bytearray(12))
+    journal.append([0, 1, 2, 3])
+    journal.append([6, 5])
+    journal.append([])
+    journal.close()
+
+    done = journal.load()
+    assert list(done) == [1, 1, 1, 1, 0, 1, 1, 0, 0, 0, 0, 0]
+    assert pipeline.EmbedJournal.watermark(done) == 4
+
+    journal.reset(done)   # 여러 줄 → 구간 한 줄로 압축
+    assert path.read_text(encoding="utf-8").splitlines()[1:] == ["0-3,5-6"]
+    assert journal.load() == done
+    assert pipeline.EmbedJournal.watermark(bytearray(b"\x01" * 3)) == 3
+
+
+def test_journal_ignores_truncated_line_and_rejects_mismatch(tmp_path):
+    path = tmp_path / "journal.log"
+    journal = pipeline.EmbedJournal(path, "fp", 8)
+    journal.reset(bytearray(8))
+    journal.append([0, 1])
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("2-7")   # 기록 도중 중단 (줄바꿈 없음)
+
+    assert list(journal.load()) == [1, 1, 0, 0, 0, 0, 0, 0]
+    assert pipeline.EmbedJournal(path, "other", 8).load() is None      # 입력이 바뀜
+    assert pipeline.EmbedJournal(path, "fp", 9).load() is None         # 청크 수가 바뀜
+
+    path.write_text(json.dumps({"fingerprint": "fp", "total": 8}) + "\n0-20\n", encoding="utf-8")
+    assert journal.load() is None   # 범위를 벗어난 순번 = 손상
+
+
+def test_journal_without_total_grows(tmp_path):
+    journal = pipeline.EmbedJournal(tmp_path / "stream.log", "fp", None)
+    journal.reset(bytearray())
+    journal.append([3, 4])
+    journal.close()
+
+    assert list(journal.load()) == [0, 0, 0, 1, 1]
@@ -0,0 +1,202 @@
+"""사전 생성 (pregenerate.py): 챕터 목록 · 버전 작성 · 버전 저장소 · 버전 정리 · 서버의 사전 생성본 응답"""
+
+import json
+import os
+
+import pytest
+
+import server
+import pregenerate
+from pregenerate import (LECTURE_FORMATS, QUIZ_COUNT, QUIZ_TYPES, PregeneratedStore, build_version, item_key,
+                         load_catalogue, parse_chapters, plan_items, previous_version, prune_versions)
+
+CATALOGUE = [(1, "경제학의 10대 기본원리"), (2, "경제학자처럼 생각하기")]
+
+
+def write_version(root, version, keys, model="gemini-test", chunks="digest", current=True, created=0.0):
+    """build_version()과 같은 구조로 버전 하나를 씀 → 버전 디렉토리"""
+    items = {}
+    for key in keys:
+        kind, format_type, number = key.split("/")
+        relative = f"{kind}-{format_type}/ch{int(number):02d}.json"
+        path = root / version / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"kind": kind, "format": format_type, "chapter": int(number), "title": "t",
+                                    "response": f"{version}:{key}", "sources": []}), encoding="utf-8")
+        items[key] = {"file": relative, "chapter": int(number), "title": "t"}
+    (root / version / "manifest.json").write_text(json.dumps({
+        "version": version, "created": created, "created_at": "2026-01-01 00:00:00", "model": model, "chunks": chunks,
+        "items": items, "failed": []}), encoding="utf-8")
+    if current:
+        pointer = root / "current.json"
+        pointer.write_text(json.dumps({"version": version}), encoding="utf-8")
+        # 같은 초에 두 번 써도 서버가 바뀐 것을 알 수 있게 수정 시각을 앞으로
+        stamp = pointer.stat().st_mtime + len(list(root.iterdir()))
+        os.utime(pointer, (stamp, stamp))
+    return root / version
+
+
+def test_catalogue_and_plan():
+    catalogue = load_catalogue()
+    numbers = [number for number, _ in catalogue]
+    assert numbers == sorted(set(numbers)) and numbers[0] == 1 and all(title for _, title in catalogue)
+
+    assert parse_chapters("1-3, 5", catalogue) == {1, 2, 3, 5}
+    assert parse_chapters("", catalogue) == set(numbers)
+    assert parse_chapters("0,999", catalogue) == set()
+
+    items = plan_items(catalogue, {2, 3}, ["lecture", "quiz"], LECTURE_FORMATS)
+    assert len(items) == 2 * (len(LECTURE_FORMATS) + 1)
+    quiz = next(item for item in items if item[0] == item_key("quiz", "default", 2))
+    assert quiz[5] == {"chapter": "2", "count": QUIZ_COUNT, "types": list(QUIZ_TYPES), "fresh": True}
+    assert all(body["fresh"] for *_, body in items)
+
+
+def test_store_reads_version_named_by_current(tmp_path):
+    assert PregeneratedStore.load(tmp_path) is None
+    write_version(tmp_path, "20260101-000000", ["lecture/notes/1"])
+    write_version(tmp_path, "20260102-000000", ["lecture/notes/1", "quiz/default/1"])
+
+    store = PregeneratedStore.load(tmp_path)
+
+    assert store.version == "20260102-000000" and len(store) == 2
+    assert store.get("lecture", "notes", 1) == {"response": "20260102-000000:lecture/notes/1", "sources": [],
+                                                "pregenerated": "20260102-000000"}
+    assert store.get("lecture", "slides", 1) is None
+    assert store.stats()["kinds"] == {"lecture": 1, "quiz": 1}
+
+
+def test_previous_version_requires_same_model_and_chunks(tmp_path):
+    version_dir = write_version(tmp_path, "20260101-000000", ["lecture/notes/1"])
+
+    assert previous_version(tmp_path, "gemini-test", "digest") == (version_dir, PregeneratedStore.load(tmp_path).items)
+    assert previous_version(tmp_path, "gemini-other", "digest") == (None, None)
+    assert previous_version(tmp_path, "gemini-test", "rechunked") == (None, None)
+    assert previous_version(tmp_path / "missing", "gemini-test", "digest") == (None, None)
+
+
+def fake_generate(failing=()):
+    """build_version에 넘기는 생성 함수 — 생성한 키를 기록하고 failing 키는 오류로 돌려줌"""
+    generated = []
+
+    def generate(pending, on_done):
+        for item in pending:
+            generated.append(item[0])
+            on_done(item, {"error": "quota"} if item[0] in failing else {"response": f"new:{item[0]}", "sources": []})
+        return {"requests": len(pending)}
+    generate.generated = generated
+    return generate
+
+
+def test_build_version_writes_items_and_switches_current(tmp_path):
+    items = plan_items(CATALOGUE, {1, 2}, ["lecture", "quiz"], ["notes"])
+    generate = fake_generate(failing={"quiz/default/2"})
+
+    version_dir, manifest, upstream = build_version(tmp_path, items, "gemini-test", "digest", generate)
+
+    assert generate.generated == [item[0] for item in items] and upstream == {"requests": 4}
+    assert json.loads((tmp_path / "current.json").read_text(encoding="utf-8")) == {"version": version_dir.name}
+    assert json.loads((version_dir / "manifest.json").read_text(encoding="utf-8")) == manifest
+    assert manifest["failed"] == [{"key": "quiz/default/2", "error": "quota"}]
+    assert sorted(manifest["items"]) == ["lecture/notes/1", "lecture/notes/2", "quiz/default/1"]
+    # 임시 파일 없이 완성된 파일만 남고, 저장소는 바뀐 current를 읽음
+    assert not list(tmp_path.rglob("*.tmp"))
+    store = PregeneratedStore.load(tmp_path)
+    assert store.version == version_dir.name
+    assert store.get("quiz", "default", 1)["response"] == "new:quiz/default/1"
+    assert store.get("quiz", "default", 2) is None
+
+
+def test_build_version_reuses_previous_items(tmp_path):
+    items = plan_items(CATALOGUE, {1, 2}, ["lecture"], ["notes", "slides"])
+    failing = fake_generate(failing={"lecture/slides/2"})
+    first_dir, _, _ = build_version(tmp_path, items, "gemini-test", "digest", failing)
+
+    generate = fake_generate()
+    second_dir, manifest, _ = build_version(tmp_path, items, "gemini-test", "digest", generate)
+
+    # 직전 버전에서 실패한 항목만 새로 생성하고 나머지는 복사
+    assert generate.generated == ["lecture/slides/2"]
+    assert second_dir != first_dir and len(manifest["items"]) == 4 and manifest["failed"] == []
+    copied = "lecture-notes/ch01.json"
+    assert (second_dir / copied).read_bytes() == (first_dir / copied).read_bytes()
+
+    # 모델 · 청크 저장소가 바뀌거나 force면 전부 다시 생성, 모두 가져오면 생성 호출 없음
+    for model, chunks, force in [("gemini-other", "digest", False), ("gemini-test", "rechunked", False),
+                                 ("gemini-test", "digest", True)]:
+        generate = fake_generate()
+        build_version(tmp_path, items, model, chunks, generate, force=force, keep=0)
+        assert len(generate.generated) == 4
+    _, _, upstream = build_version(tmp_path, items, "gemini-test", "digest", fake_generate(), keep=0)
+    assert upstream is None
+
+
+def test_same_second_versions_get_distinct_names(tmp_path, monkeypatch):
+    monkeypatch.setattr(pregenerate.time, "strftime", lambda fmt: "20260101-000000")
+    items = plan_items(CATALOGUE, {1}, ["quiz"], [])
+
+    names = [build_version(tmp_path, items, "gemini-test", "digest", fake_generate(), force=True, keep=0)[0].name
+             for _ in range(3)]
+
+    assert names == ["20260101-000000", "20260101-000000-2", "20260101-000000-3"]
+    assert PregeneratedStore.load(tmp_path).version == names[-1]
+
+
+def test_prune_keeps_newest_versions_by_created_time(tmp_path):
+    # 이름 순서와 생성 순서가 달라도 manifest의 created로 판단
+    for version, created in [("zz-oldest", 100.0), ("20260102-000000", 200.0), ("20260101-000000-2", 300.0),
+                             ("20260101-000000", 400.0)]:
+        write_version(tmp_path, version, ["lecture/notes/1"], created=created, current=False)
+    backup = tmp_path / "manual-backup"
+    backup.mkdir()
+    os.utime(backup, (50.0, 50.0))   # manifest가 없으면 디렉토리 수정 시각
+    write_version(tmp_path, "20260101-000000-2", ["lecture/notes/1"], created=300.0)
+
+    prune_versions(tmp_path, 2)
+
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == ["20260101-000000", "20260101-000000-2"]
+    prune_versions(tmp_path, 0)   # 0 이하면 아무것도 지우지 않음
+    assert len([p for p in tmp_path.iterdir() if p.is_dir()]) == 2
+    # current.json이 가리키는 버전은 더 새로운 버전이 있어도 지우지 않음
+    prune_versions(tmp_path, 1)
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == ["20260101-000000", "20260101-000000-2"]
+    assert PregeneratedStore.load(tmp_path).version == "20260101-000000-2"
+
+
+def test_server_serves_stored_items_and_generates_custom_topics(rag_server):
+    write_version(server.PREGENERATED_DIR, "20260101-000000", ["lecture/notes/2", "quiz/default/2"])
+
+    lecture = server.dispatch(server.handle_lecture, {"chapter": "2"})
+    quiz = server.dispatch(server.handle_quiz, {"chapter": "Chapter 2"})
+
+    assert lecture["response"] == "20260101-000000:lecture/notes/2"
+    assert quiz["pregenerated"] == "20260101-000000"
+    assert rag_server.calls == []
+
+    # 사용자 주제 · fresh · 저장되지 않은 형식 · 기본이 아닌 퀴즈는 실시간 생성
+    for handler, body in [(server.handle_lecture, {"chapter": "2", "topic": "환율"}),
+                          (server.handle_lecture, {"chapter": "2", "fresh": True}),
+                          (server.handle_lecture, {"chapter": "2", "format": "slides"}),
+                          (server.handle_quiz, {"chapter": "2", "count": 3})]:
+        result = server.dispatch(handler, body)
+        assert "docs" in result and "pregenerated" not in result
+    assert len(rag_server.calls) == 4
+
+
+def test_server_reloads_when_current_version_changes(rag_server):
+    root = server.PREGENERATED_DIR
+    write_version(root, "20260101-000000", ["lecture/notes/2"])
+    assert server.pregenerated_result("lecture", "notes", 2)["pregenerated"] == "20260101-000000"
+
+    write_version(root, "20260102-000000", ["lecture/notes/2"])
+
+    assert server.pregenerated_result("lecture", "notes", "2")["pregenerated"] == "20260102-000000"
+    assert server.pregenerated_result("lecture", "notes", "") is None
+    (root / "current.json").unlink()
+    assert server.pregenerated_result("lecture", "notes", 2) is None
+
+
+@pytest.mark.parametrize("chapter", ["제2장", 2, "Chapter 2: 경제학자처럼 생각하기"])
+def test_chapter_values_resolve_to_stored_number(rag_server, chapter):
+    write_version(server.PREGENERATED_DIR, "20260101-000000", ["lecture/notes/2"])
+    assert server.pregenerated_result("lecture", "notes", chapter)["response"].endswith("lecture/notes/2")
@@ -0,0 +1,62 @@
+"""쿼리 캐시 (query_cache.py): 정규화 · LRU 삭제 · TTL 만료"""
+
+from types import SimpleNamespace
+
+import query_cache
+from query_cache import LRUCache, normalize_query
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalize_query_folds_case_punctuation_and_width():
+    assert normalize_query("  수요와 공급의   균형?! ") == "수요와 공급의 균형"
+    assert normalize_query("ＧＤＰ_Deflator") == normalize_query("gdp deflator")
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2, ttl=0)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1      # a가 최근 사용
+    cache.put("c", 3)               # → b 삭제
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["entries"] == 2
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+
+
+def test_ttl_expires_entries(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(query_cache, "time", SimpleNamespace(monotonic=clock))
+    cache = LRUCache(max_entries=10, ttl=60)
+    cache.put("q", "vector")
+
+    clock.now += 59
+    assert cache.get("q") == "vector"
+    clock.now += 2
+    assert cache.get("q") is None
+    assert cache.stats()["expired"] == 1 and len(cache) == 0
+
+
+def test_put_refreshes_ttl_and_clear_keeps_stats(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(query_cache, "time", SimpleNamespace(monotonic=clock))
+    cache = LRUCache(max_entries=10, ttl=60)
+    cache.put("q", 1)
+    clock.now += 50
+    cache.put("q", 2)
+    clock.now += 50
+    assert cache.get("q") == 2
+
+    cache.clear()
+    assert cache.get("q") is None
+    stats = cache.stats()
+    assert stats["clears"] == 1 and stats["hits"] == 1
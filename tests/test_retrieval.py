@@ -0,0 +1,168 @@
+"""검색 백엔드 (retrieval.py): 백엔드 간 결과 일치 · where 필터"""
+
+import uuid
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from retrieval import ChromaBackend, NumpyBackend, ShardedBackend, StoreFilter  # noqa: E402
+from vector_codec import CompactVectors  # noqa: E402
+
+
+@pytest.fixture
+def chroma_collection(corpus):
+    chromadb = pytest.importorskip("chromadb")
+    store, matrix = corpus
+    collection = chromadb.EphemeralClient().create_collection(f"test_{uuid.uuid4().hex}")
+    collection.add(ids=[store.chunk_id(i) for i in range(len(store))], embeddings=matrix.tolist(),
+                   documents=[store.text(i) for i in range(len(store))],
+                   metadatas=[store.metadata(i) for i in range(len(store))])
+    return collection
+
+
+def numpy_backend(corpus, codec="float32"):
+    store, matrix = corpus
+    vectors = CompactVectors.from_matrix(matrix, np.ones(len(matrix), dtype=bool), codec)
+    return NumpyBackend(vectors, store, rescore=lambda rows: matrix[rows])
+
+
+@pytest.mark.parametrize("where", [
+    None,
+    {"chapter": "Chapter 2"},
+    {"source_file": {"$in": ["notes.pdf"]}},
+    {"$and": [{"part": "Part 1"}, {"estimated_page": {"$gte": 5}}]},
+    {"$or": [{"chapter": "Chapter 1"}, {"source_file": "notes.pdf"}]},
+])
+def test_numpy_backend_matches_chroma(corpus, chroma_collection, where):
+    _, matrix = corpus
+    queries = matrix[[0, 45, 90, 119]] + 0.1
+    chroma = ChromaBackend(chroma_collection).search_batch(queries, 8, where)
+
+    for codec in ("float32", "int8"):
+        docs = numpy_backend(corpus, codec).search_batch(queries, 8, where)
+        assert [[d["id"] for d in q] for q in docs] == [[d["id"] for d in q] for q in chroma]
+        for got, want in zip(docs[0], chroma[0]):
+            assert got["metadata"] == want["metadata"] and got["text"] == want["text"]
+            assert got["distance"] == pytest.approx(want["distance"], abs=1e-4)
+            assert got["similarity"] == round(1 - got["distance"], 4)
+
+
+def test_filter_without_matches_returns_nothing(corpus):
+    backend = numpy_backend(corpus)
+    assert backend.search(corpus[1][0], 5, {"chapter": "Chapter 99"}) == []
+
+
+def test_unknown_filter_field_is_rejected(corpus):
+    with pytest.raises(ValueError):
+        numpy_backend(corpus).search(corpus[1][0], 5, {"author": "Mankiw"})
+
+
+# ── ANN 색인 (ann_index.py) ──
+
+def build_ann(corpus, kind, valid=None):
+    pytest.importorskip("faiss")
+    from ann_index import AnnIndex
+
+    _, matrix = corpus
+    valid = np.ones(len(matrix), dtype=bool) if valid is None else valid
+    return AnnIndex.build(kind, matrix, valid)
+
+
+@pytest.mark.parametrize("kind", ["hnsw", "ivfpq"])
+def test_ann_recall_against_exact_search(corpus, kind):
+    from vector_codec import exact_search, recall_at_k
+
+    _, matrix = corpus
+    valid = np.ones(len(matrix), dtype=bool)
+    valid[::9] = False
+    index = build_ann(corpus, kind, valid)
+    queries = matrix[:30] + 0.05
+    truth = [exact_search(matrix, q, 10, valid).tolist() for q in queries]
+
+    # 작은 표본의 IVF-PQ 코드는 거칠어서 (1비트) 후보를 넉넉히 뽑아 float32로 다시 채점
+    results = index.search_batch(queries, 10, search_param=index.sweep_values()[-1],
+                                 rescore=lambda rows: matrix[rows], factor=8)
+
+    approx = [rows.tolist() for rows, _ in results]
+    # 색인 순번이 아니라 청크 저장소 순번을 돌려주고, 빠진 행은 나오지 않음
+    assert not any(set(rows) & set(np.flatnonzero(~valid)) for rows in approx)
+    assert recall_at_k(truth, approx) >= 0.9
+    assert len(index) == int(valid.sum())
+
+
+def test_ann_mask_filter_and_save_load(corpus, tmp_path):
+    from ann_index import AnnIndex
+
+    _, matrix = corpus
+    index = build_ann(corpus, "hnsw")
+    backend_mask = np.zeros(len(matrix), dtype=bool)
+    backend_mask[40:80] = True
+
+    rows, _ = index.search(matrix[0], 5, mask=backend_mask)
+    assert len(rows) == 5 and all(40 <= r < 80 for r in rows)
+
+    index.set_search_param(64)
+    index.save(tmp_path / "hnsw")
+    loaded = AnnIndex.load(tmp_path / "hnsw")
+    assert loaded.search_param == 64 and len(loaded) == len(index)
+    assert loaded.search(matrix[7], 3)[0].tolist() == index.search(matrix[7], 3)[0].tolist()
+    assert AnnIndex.load(tmp_path / "missing") is None
+
+
+# ── 샤드 병합 (ShardedBackend) ──
+
+class FailingBackend:
+    def search_batch(self, query_embeddings, n_results, where=None):
+        raise RuntimeError("shard down")
+
+    def stats(self):
+        return {"documents": 0}
+
+
+def source_shards(corpus):
+    """책(source_file)마다 자기 행만 유효한 NumpyBackend 샤드"""
+    store, matrix = corpus
+    sources = np.array([store.metadata(i)["source_file"] for i in range(len(store))])
+    return {name: NumpyBackend(CompactVectors.from_matrix(matrix, sources == name, "float32"), store)
+            for name in ("book.pdf", "notes.pdf")}
+
+
+def test_sharded_merge_matches_single_backend(corpus):
+    store, matrix = corpus
+    sharded = ShardedBackend(source_shards(corpus), "source_file", router=StoreFilter(store))
+    queries = matrix[[0, 79, 80, 119]] + 0.1
+    try:
+        for where in (None, {"chapter": "Chapter 2"}):
+            merged = sharded.search_batch(queries, 12, where)
+            single = numpy_backend(corpus).search_batch(queries, 12, where)
+            assert [[d["id"] for d in q] for q in merged] == [[d["id"] for d in q] for q in single]
+            assert all(d["shard"] == d["metadata"]["source_file"] for q in merged for d in q)
+    finally:
+        sharded.close()
+
+
+def test_sharded_routing_skips_unreachable_shards(corpus):
+    store, matrix = corpus
+    sharded = ShardedBackend(source_shards(corpus), "source_file", router=StoreFilter(store))
+    try:
+        docs = sharded.search(matrix[0], 5, {"source_file": "notes.pdf"})
+        assert docs and all(d["shard"] == "notes.pdf" for d in docs)
+        assert sharded.route({"chapter": "Chapter 1"}) == ["book.pdf"]
+        stats = sharded.shard_stats()
+        assert stats["book.pdf"]["skipped"] == 1 and stats["notes.pdf"]["queries"] == 1
+    finally:
+        sharded.close()
+
+
+def test_failing_shard_is_dropped_from_merge(corpus):
+    _, matrix = corpus
+    shards = source_shards(corpus)
+    shards["notes.pdf"] = FailingBackend()
+    sharded = ShardedBackend(shards, "source_file")
+    try:
+        docs = sharded.search(matrix[100], 5)
+        assert len(docs) == 5 and all(d["shard"] == "book.pdf" for d in docs)
+        assert sharded.shard_stats()["notes.pdf"]["errors"] == 1
+    finally:
+        sharded.close()
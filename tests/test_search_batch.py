@@ -0,0 +1,105 @@
+"""여러 쿼리 검색 (server.search_vectordb_batch): 쿼리 순서 · 필터 묶음 · 중복 제거 · 호출하는 핸들러"""
+
+import pytest
+
+import server
+from embedder import HashingEmbedder
+from retrieval import NumpyBackend
+
+QUERIES = ["수요의 가격 탄력성", "GDP 디플레이터", "기회비용과 비교우위", "인플레이션과 실업"]
+
+
+def expected(query, n, where=None):
+    vector = HashingEmbedder(dim=32).embed_query(query)
+    return [d["id"] for d in server.retrieval_backend.search(vector, n, where)]
+
+
+def ids(batch):
+    return [[d["id"] for d in docs] for docs in batch]
+
+
+def test_one_embedding_call_and_results_in_query_order(rag_server):
+    batch = server.search_vectordb_batch(QUERIES, n_results=5)
+
+    assert rag_server.calls == [QUERIES]
+    assert ids(batch) == [expected(q, 5) for q in QUERIES]
+    assert server.search_vectordb_batch([], n_results=5) == [] and len(rag_server.calls) == 1
+
+
+def test_queries_with_the_same_filter_share_a_backend_call(rag_server, monkeypatch):
+    calls = []
+    search_batch = NumpyBackend.search_batch
+
+    def spy(self, embeddings, n, where=None):
+        calls.append((len(embeddings), where))
+        return search_batch(self, embeddings, n, where)
+    monkeypatch.setattr(NumpyBackend, "search_batch", spy)
+    chapter = {"chapter": "Chapter 1"}
+    wheres = [chapter, None, {"chapter": "Chapter 1"}, None]
+
+    batch = server.search_vectordb_batch(QUERIES, n_results=4, where_filter=wheres)
+
+    assert sorted(calls, key=str) == sorted([(2, chapter), (2, None)], key=str)
+    assert ids(batch) == [expected(q, 4, w) for q, w in zip(QUERIES, wheres)]
+    assert all(d["metadata"]["chapter"] == "Chapter 1" for d in batch[0] + batch[2])
+
+
+def test_dedupe_backfills_from_later_candidates(rag_server):
+    queries = ["시장 균형 가격", "시장 균형 가격", "시장 균형 가격"]
+
+    plain = server.search_vectordb_batch(queries, n_results=4)
+    deduped = server.search_vectordb_batch(queries, n_results=4, dedupe=True)
+
+    assert ids(plain)[0] == ids(plain)[1] == ids(plain)[2]
+    flat = [i for docs in ids(deduped) for i in docs]
+    assert len(flat) == len(set(flat)) == 12
+    # 같은 쿼리가 반복돼도 앞 쿼리에 나온 것을 빼고 다음 후보(5~8위, 9~12위)로 끝까지 채움
+    assert flat == expected(queries[0], 12)
+
+
+def test_exam_searches_unindexed_chapters_in_one_batch(rag_server):
+    docs = server.dispatch(server.handle_exam, {"chapters": [7, 8, 9]})["docs"]
+
+    assert rag_server.calls == [[f"Chapter {ch} 핵심 개념과 이론" for ch in (7, 8, 9)]]
+    assert len(docs) == 9 and len({d["id"] for d in docs}) == 9
+
+
+def test_report_topics_are_searched_together_and_interleaved(rag_server):
+    topics = ["인플레이션", "실업", "환율"]
+
+    docs = server.dispatch(server.handle_report, {"topics": topics})["docs"]
+
+    assert rag_server.calls == [topics]
+    per_topic = server.search_vectordb_batch(topics, n_results=3, dedupe=True)
+    assert [d["id"] for d in docs] == [per_topic[t][i]["id"] for i in range(3) for t in range(3)]
+
+
+def test_search_endpoint_accepts_query_list(rag_server):
+    result = server.handle_search({"queries": QUERIES[:2], "n_results": 3})
+
+    assert result["queries"] == QUERIES[:2]
+    assert [len(r) for r in result["results"]] == [3, 3]
+    assert rag_server.calls == [QUERIES[:2]]
+
+
+@pytest.mark.parametrize("mode", ["lexical", "hybrid"])
+def test_without_lexical_index_every_mode_uses_vectors(rag_server, mode):
+    batch = server.search_vectordb_batch(QUERIES[:2], n_results=3, mode=mode)
+    assert ids(batch) == [expected(q, 3) for q in QUERIES[:2]]
+
+
+@pytest.mark.parametrize("topics", ["GDP", ["GDP"]])
+def test_single_topic_string_is_not_split_into_characters(rag_server, topics):
+    docs = server.dispatch(server.handle_report, {"topics": topics})["docs"]
+
+    assert rag_server.calls == [["GDP"]]
+    assert len(docs) == 10
+
+
+@pytest.mark.parametrize("handler, key", [(server.handle_report, "topics"), (server.handle_search, "queries")])
+@pytest.mark.parametrize("value", [{"a": "GDP"}, ["GDP", 3], ["GDP", " "], 7])
+def test_malformed_text_lists_are_rejected(rag_server, handler, key, value):
+    result = server.dispatch(handler, {key: value})
+
+    assert "error" in result and key in result["error"]
+    assert rag_server.calls == []
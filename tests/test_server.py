@@ -0,0 +1,166 @@
+"""동기 서버 (server.py): SSE 프레이밍 · 이벤트 순서 · 워커 풀 HTTP 서버"""
+
+import http.client
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+DOCS = [{"id": "chunk_a", "text": "기회비용은 포기한 것의 가치", "similarity": 0.9,
+         "metadata": {"source_file": "book.pdf", "estimated_page": 3, "chapter": "Chapter 1"}}]
+
+
+class FakeTask(server.GenerationTask):
+    """SDK 대신 정해진 조각을 흘려보내는 생성 작업 (fail=True면 중간에 예외)"""
+
+    def __init__(self, parts, fail=False):
+        super().__init__("기회비용", DOCS, "system")
+        self.parts = parts
+        self.fail = fail
+        self.remembered = []
+
+    def stream(self):
+        for part in self.parts:
+            yield part
+        if self.fail:
+            raise RuntimeError("quota")
+
+    def remember(self, result):
+        self.remembered.append(result)
+
+
+@pytest.fixture(autouse=True)
+def fake_genai(monkeypatch):
+    monkeypatch.setattr(server, "genai", SimpleNamespace())
+
+
+def parse_sse(raw):
+    """SSE 바이트 → [(event, data)]"""
+    events = []
+    for block in raw.decode("utf-8").split("\n\n"):
+        if not block:
+            continue
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_sse_event_framing():
+    raw = server.sse_event("delta", {"text": "수요\n공급"})
+    assert raw == 'event: delta\ndata: {"text": "수요\\n공급"}\n\n'.encode("utf-8")
+    assert parse_sse(raw + server.sse_event("done", {"chars": 5})) == [("delta", {"text": "수요\n공급"}),
+                                                                       ("done", {"chars": 5})]
+
+
+def test_stream_events_sources_then_deltas_then_done():
+    task = FakeTask(["기회", "비용"])
+    events = list(server.stream_events(task))
+
+    assert [event for event, _ in events] == ["sources", "delta", "delta", "done"]
+    assert events[0][1]["sources"][0]["file"] == "book.pdf"
+    assert events[-1][1] == {"chars": 4}
+    assert task.remembered == [{"response": "기회비용", "sources": events[0][1]["sources"]}]
+
+
+def test_stream_events_error_mid_stream_is_not_cached():
+    task = FakeTask(["기회"], fail=True)
+    events = list(server.stream_events(task))
+
+    assert [event for event, _ in events] == ["sources", "delta", "error"]
+    assert "quota" in events[-1][1]["error"]
+    assert task.remembered == []
+
+
+def test_completed_results_use_same_event_order():
+    cached = {"response": "저장된 답", "sources": [], "cached": True}
+    assert list(server.stream_events(cached)) == [("sources", {"sources": []}), ("delta", {"text": "저장된 답"}),
+                                                  ("done", {"chars": 5, "cached": True})]
+    assert list(server.stream_events({"error": "검색어를 입력해주세요."})) == [
+        ("error", {"error": "검색어를 입력해주세요."})]
+
+
+# ── HTTP 서버 (PooledHTTPServer + RAGHandler) ──
+
+@pytest.fixture
+def http_server():
+    """포트 0에 띄운 PooledHTTPServer (워커 2개) → (host, port)"""
+    httpd = server.PooledHTTPServer(("127.0.0.1", 0), server.RAGHandler, workers=2)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def post(address, path, body, timeout=5):
+    conn = http.client.HTTPConnection(*address, timeout=timeout)
+    try:
+        conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        return resp.status, resp.getheader("Content-Type"), resp.read()
+    finally:
+        conn.close()
+
+
+def test_stream_route_sends_sse_over_http(http_server, monkeypatch):
+    monkeypatch.setitem(server.STREAM_ROUTES, "/api/test/stream", lambda body: FakeTask(body["parts"]))
+
+    status, content_type, raw = post(http_server, "/api/test/stream", {"parts": ["수요", "와 ", "공급"]})
+
+    assert status == 200 and content_type.startswith("text/event-stream")
+    events = parse_sse(raw)
+    assert [event for event, _ in events] == ["sources", "delta", "delta", "delta", "done"]
+    assert "".join(data["text"] for event, data in events if event == "delta") == "수요와 공급"
+
+
+def test_pool_runs_requests_concurrently_up_to_worker_count(http_server, monkeypatch):
+    release = threading.Event()
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0, "done": 0}
+
+    def handle_slow(body):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        release.wait(5)
+        with lock:
+            state["active"] -= 1
+            state["done"] += 1
+        return {"n": body["n"]}
+
+    monkeypatch.setitem(server.API_ROUTES, "/api/test/slow", handle_slow)
+    results = {}
+
+    def request(n):
+        results[n] = post(http_server, "/api/test/slow", {"n": n})
+    clients = [threading.Thread(target=request, args=(n,)) for n in range(3)]
+    for client in clients:
+        client.start()
+
+    deadline = time.monotonic() + 5
+    while state["active"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)   # 세 번째 요청은 워커가 빌 때까지 accept되지 않아야 함
+    assert (state["active"], state["peak"], state["done"]) == (2, 2, 0)
+
+    release.set()
+    for client in clients:
+        client.join(5)
+    assert state == {"active": 0, "peak": 2, "done": 3}
+    assert sorted(json.loads(raw)["n"] for status, _, raw in results.values()) == [0, 1, 2]
+    assert all(status == 200 for status, _, _ in results.values())
+
+
+def test_unknown_route_and_bad_json(http_server):
+    status, _, raw = post(http_server, "/api/nope", {})
+    assert status == 404 and "알 수 없는 경로" in json.loads(raw)["error"]
+
+    conn = http.client.HTTPConnection(*http_server, timeout=5)
+    conn.request("POST", "/api/search", "{not json", {"Content-Type": "application/json"})
+    resp = conn.getresponse()
+    assert resp.status == 400
+    conn.close()
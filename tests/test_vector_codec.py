@@ -0,0 +1,78 @@
+"""압축 벡터 (vector_codec.py): 코덱 왕복 · 저장/로드 · 전수 검색과의 상위 k 일치"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from vector_codec import CODECS, CompactVectors, exact_search, l2_distances, quantize, recall_at_k  # noqa: E402
+
+
+@pytest.mark.parametrize("codec, tolerance", [("float32", 0.0), ("float16", 1e-3), ("int8", 1e-2)])
+def test_quantize_round_trip_error(corpus, codec, tolerance):
+    _, matrix = corpus
+    data, scales = quantize(matrix, codec)
+    restored = data.astype(np.float32) * (scales[:, None] if scales is not None else 1.0)
+    assert np.abs(restored - matrix).max() <= tolerance
+
+
+def test_quantize_rejects_unknown_codec(corpus):
+    with pytest.raises(ValueError):
+        quantize(corpus[1], "int4")
+
+
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_round_trip(corpus, tmp_path, codec, mmap):
+    _, matrix = corpus
+    valid = np.ones(len(matrix), dtype=bool)
+    valid[5] = False
+    vectors = CompactVectors.from_matrix(matrix, valid, codec, meta={"collection": "test"})
+    vectors.save(tmp_path / codec)
+
+    loaded = CompactVectors.load(tmp_path / codec, mmap=mmap)
+
+    assert loaded.codec == codec and loaded.meta["collection"] == "test"
+    assert (len(loaded), loaded.dim) == matrix.shape
+    assert np.array_equal(np.asarray(loaded.data), vectors.data)
+    assert np.array_equal(np.asarray(loaded.valid), valid)
+    assert (loaded.scales is None) == (codec != "int8")
+    assert CompactVectors.load(tmp_path / "missing") is None
+
+
+def test_distances_match_squared_l2(corpus):
+    _, matrix = corpus
+    vectors = CompactVectors.from_matrix(matrix, np.ones(len(matrix), dtype=bool), "float32")
+    query = matrix[3] * 0.5 + matrix[4] * 0.5
+    assert np.allclose(vectors.distances(query), l2_distances(matrix, query), atol=1e-5)
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_search_top_k_agrees_with_exact_search(corpus, codec):
+    _, matrix = corpus
+    valid = np.ones(len(matrix), dtype=bool)
+    valid[::7] = False
+    vectors = CompactVectors.from_matrix(matrix, valid, codec)
+    queries = matrix[:20] + 0.05
+    truth = [exact_search(matrix, q, 10, valid).tolist() for q in queries]
+
+    approx = [rows.tolist() for rows, _ in vectors.search_batch(queries, 10)]
+    rescored = [rows.tolist() for rows, _ in vectors.search_batch(queries, 10, rescore=lambda rows: matrix[rows])]
+
+    assert not any(set(rows) & set(np.flatnonzero(~valid)) for rows in approx)
+    if codec == "float32":
+        assert approx == truth
+    assert recall_at_k(truth, approx) >= 0.95
+    # 원본 정밀도로 다시 채점하면 순서까지 정답과 같음
+    assert rescored == truth
+
+
+def test_search_respects_mask_and_small_k(corpus):
+    _, matrix = corpus
+    vectors = CompactVectors.from_matrix(matrix, np.ones(len(matrix), dtype=bool), "int8")
+    mask = np.zeros(len(matrix), dtype=bool)
+    mask[10:13] = True
+
+    rows, distances = vectors.search(matrix[11], 10, mask=mask)
+
+    assert rows.tolist()[0] == 11 and sorted(rows.tolist()) == [10, 11, 12]
+    assert np.all(np.diff(distances) >= 0)